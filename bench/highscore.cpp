@@ -0,0 +1,134 @@
+/*
+ * Micro-benchmark of Highscore::Set, against the linear table it replaced.
+ *
+ * Every query counts the kmers its candidates share with it, and ranks a
+ * candidate each time its count goes up. A quarter of the postings belong
+ * to 64 true candidates, the rest to random database sequences.
+ *
+ *   g++ -std=c++14 -O2 -Iinclude bench/highscore.cpp -o highscore
+ *   ./highscore
+ *
+ * Default search parameters keep maxAccepts + maxRejects = 17 entries.
+ */
+
+#include "nsearch/Database/Highscore.h"
+
+#include <algorithm>
+#include <chrono>
+#include <cstdio>
+#include <random>
+#include <vector>
+
+// The previous implementation: a fixed table scanned on every update
+class LinearHighscore {
+  class Entry {
+  public:
+    size_t id    = 0;
+    size_t score = 0;
+
+    bool operator<( const Entry& other ) const {
+      return score < other.score;
+    }
+  };
+
+public:
+  LinearHighscore( const size_t numHighestEntriesToKeep )
+      : mLowestScore( 0 ) {
+    mEntries.resize( numHighestEntriesToKeep );
+  }
+
+  void Set( const size_t id, const size_t score ) {
+    if( score < mLowestScore )
+      return;
+
+    auto it = std::find_if(
+      mEntries.begin(), mEntries.end(),
+      [id]( const Entry& candidate ) { return id == candidate.id; } );
+
+    if( it == mEntries.end() ) {
+      it = std::find_if(
+        mEntries.begin(), mEntries.end(),
+        [score]( const Entry& candidate ) { return score > candidate.score; } );
+    }
+
+    if( it != mEntries.end() ) {
+      it->id    = id;
+      it->score = score;
+
+      mLowestScore =
+        std::min_element( mEntries.begin(), mEntries.end() )->score;
+    }
+  }
+
+  size_t NumEntries() const {
+    return std::count_if( mEntries.begin(), mEntries.end(),
+                          []( const Entry& e ) { return e.score > 0; } );
+  }
+
+private:
+  size_t               mLowestScore;
+  std::vector< Entry > mEntries;
+};
+
+static const size_t NumIds      = 100000;
+static const size_t NumPostings = 200000;
+static const size_t NumQueries  = 20;
+static const int    NumRuns     = 5;
+
+// Best of NumRuns, in ns per Set
+template < typename Query >
+double Measure( const std::vector< size_t >& postings, Query query ) {
+  std::vector< uint16_t > counters( NumIds );
+  size_t                  check = 0;
+  double                  best  = 0.0;
+
+  for( int run = 0; run < NumRuns; run++ ) {
+    const auto start = std::chrono::steady_clock::now();
+    for( size_t q = 0; q < NumQueries; q++ ) {
+      std::fill( counters.begin(), counters.end(), 0 );
+      check += query( postings, counters );
+    }
+    const double seconds = std::chrono::duration< double >(
+                             std::chrono::steady_clock::now() - start )
+                             .count();
+    if( run == 0 || seconds < best )
+      best = seconds;
+  }
+
+  if( check == 0 )
+    printf( "no entries kept\n" );
+  return 1e9 * best / ( NumPostings * NumQueries );
+}
+
+int main() {
+  std::mt19937                            rng( 1 );
+  std::uniform_int_distribution< size_t > any( 0, NumIds - 1 ), few( 0, 63 );
+  std::vector< size_t >                   postings( NumPostings );
+  for( auto& id : postings )
+    id = rng() % 4 == 0 ? few( rng ) : any( rng );
+
+  printf( "%8s %18s %18s\n", "entries", "linear ns/update", "heap ns/update" );
+  for( size_t keep : { 17, 40, 264, 1032 } ) {
+    const double linear =
+      Measure( postings, [&]( const std::vector< size_t >& ids,
+                              std::vector< uint16_t >&     counters ) {
+        LinearHighscore highscore( keep );
+        for( auto id : ids )
+          highscore.Set( id, ++counters[ id ] );
+        return highscore.NumEntries();
+      } );
+
+    Highscore    highscore;
+    const double heap =
+      Measure( postings, [&]( const std::vector< size_t >& ids,
+                              std::vector< uint16_t >&     counters ) {
+        highscore.Reset( keep );
+        for( auto id : ids )
+          highscore.Set( id, ++counters[ id ] );
+        return highscore.EntriesFromTopToBottom().size();
+      } );
+
+    printf( "%8zu %18.1f %18.1f\n", keep, linear, heap );
+  }
+  return 0;
+}
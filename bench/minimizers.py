@@ -0,0 +1,86 @@
+"""
+Index size, search time and sensitivity of minimizer indexes, on a
+simulated DNA data set: 2000 random database sequences of 200-1500 bp,
+and 1000 queries copied from them with 2-20% mutations, half of them
+reverse complemented. Hits are compared with those of the full index
+(minimizerWindow = 1) of the same word size. The search uses one thread.
+
+    python bench/minimizers.py
+"""
+
+import random
+import time
+
+import npysearch as npy
+
+
+def mutate(seq, rate):
+    out = []
+    for residue in seq:
+        r = random.random()
+        if r < rate / 3:
+            continue
+        elif r < 2 * rate / 3:
+            out.append(random.choice("ACGT"))
+            out.append(residue)
+        elif r < rate:
+            out.append(random.choice("ACGT"))
+        else:
+            out.append(residue)
+    return "".join(out)
+
+
+def reverseComplement(seq):
+    return seq[::-1].translate(str.maketrans("ACGT", "TGCA"))
+
+
+def simulate(seed = 1):
+    """
+    Simulated database and queries, as lists of (sequence id, sequence)
+    tuples. Query ids are q<number>_<id of the database sequence>.
+    """
+
+    random.seed(seed)
+    database = [("ref%d" % i, "".join(random.choice("ACGT")
+                                      for _ in range(random.randint(200, 1500))))
+                for i in range(2000)]
+
+    sequences = dict(database)
+    queries   = []
+    for i in range(1000):
+        target = random.choice(list(sequences))
+        seq    = mutate(sequences[target], random.choice([0.02, 0.05, 0.1, 0.2]))
+        if random.random() < 0.5:
+            seq = reverseComplement(seq)
+        queries.append(("q%d_%s" % (i, target), seq))
+    return database, queries
+
+
+def main():
+    database, queries = simulate()
+
+    print("%3s %3s %9s %8s %8s %12s %14s" % ("k", "w", "postings", "index",
+          "search", "queries hit", "same best hit"))
+    for wordSize in (8, 12):
+        full = None
+        for window in (1, 4, 8, 12, 16):
+            db    = npy.Database(database, wordSize = wordSize,
+                                 minimizerWindow = window)
+            stats = db.indexStats()
+
+            start   = time.time()
+            results = db.search(queries, maxAccepts = 1, maxRejects = 16,
+                                minIdentity = 0.75, threads = 1)
+            seconds = time.time() - start
+
+            bestHits = set(zip(results["QueryId"], results["TargetId"]))
+            if full is None:
+                full = bestHits
+            print("%3d %3d %9d %6.1fMB %7.1fs %12d %13.1f%%" % (
+                wordSize, window, stats["postings"], stats["indexSize"] / 1e6,
+                seconds, len(set(results["QueryId"])),
+                100.0 * len(bestHits & full) / len(full)), flush = True)
+
+
+if __name__ == "__main__":
+    main()
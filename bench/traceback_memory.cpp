@@ -0,0 +1,74 @@
+/*
+ * Peak memory and time of one BandedAlign::Align and one
+ * ExtendAlign::Extend of two long related sequences (0.5% deletions,
+ * 0.5% insertions, 2% mismatches), with the traceback into a Cigar.
+ *
+ *   g++ -std=c++14 -O2 -Iinclude bench/traceback_memory.cpp -o traceback_memory
+ *   for length in 1000 10000 30000; do ./traceback_memory $length; done
+ *
+ * Peak RSS is per process, so every length needs a run of its own.
+ */
+
+#include "nsearch/Alignment/BandedAlign.h"
+#include "nsearch/Alignment/ExtendAlign.h"
+#include "nsearch/Alphabet/DNA.h"
+#include "nsearch/Sequence.h"
+
+#include <sys/resource.h>
+
+#include <chrono>
+#include <cstdint>
+#include <cstdio>
+#include <cstdlib>
+#include <random>
+#include <string>
+
+static long PeakRSSKilobytes() {
+  struct rusage usage;
+  getrusage( RUSAGE_SELF, &usage );
+  return usage.ru_maxrss;
+}
+
+int main( int argc, char** argv ) {
+  if( argc != 2 ) {
+    fprintf( stderr, "usage: %s length\n", argv[ 0 ] );
+    return 1;
+  }
+  const int length = atoi( argv[ 1 ] );
+
+  std::mt19937 rng( 3 );
+  const char*  letters = "ACGT";
+  std::string  a, b;
+  for( int i = 0; i < length; i++ )
+    a += letters[ rng() % 4 ];
+  for( char ch : a ) {
+    const int r = rng() % 1000;
+    if( r < 5 )
+      continue;
+    if( r < 10 )
+      b += letters[ rng() % 4 ];
+    b += r < 30 ? letters[ rng() % 4 ] : ch;
+  }
+  Sequence< DNA > seqA( "a", a ), seqB( "b", b );
+
+  const auto start = std::chrono::steady_clock::now();
+
+  BandedAlign< DNA > bandedAlign;
+  Cigar              bandedCigar;
+  const int bandedScore = bandedAlign.Align( seqA, seqB, &bandedCigar );
+
+  ExtendAlign< DNA > extendAlign;
+  Cigar              extendCigar;
+  size_t             bestA, bestB;
+  const int          extendScore =
+    extendAlign.Extend( seqA, seqB, &bestA, &bestB, &extendCigar );
+
+  const double seconds =
+    std::chrono::duration< double >( std::chrono::steady_clock::now() - start )
+      .count();
+
+  printf( "length %d: peak RSS %.1f MB, %.1f ms (scores %d, %d)\n", length,
+          PeakRSSKilobytes() / 1024.0, seconds * 1e3, bandedScore,
+          extendScore );
+  return 0;
+}
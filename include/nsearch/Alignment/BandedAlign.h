@@ -1,8 +1,11 @@
 #pragma once
 
+#include "BandedRow.h"
 #include "Cigar.h"
 #include "Common.h"
 
+#include "../Simd.h"
+
 #include <cassert>
 #include <iostream>
 #include <vector>
@@ -15,6 +18,10 @@ typedef struct BandedAlignParams {
 
   int terminalGapOpenScore   = -2;
   int terminalGapExtendScore = -1;
+
+  // Vector instructions for the rows of the band, by default the best
+  // the CPU supports. All levels give the same alignments.
+  SimdLevel simdLevel = CpuSimdLevel();
 } BandedAlignParams;
 
 template < typename Alphabet >
@@ -32,6 +39,10 @@ private:
       Reset();
     }
 
+    Gap( const BandedAlignParams& params, const int score,
+         const bool isTerminal )
+        : mScore( score ), mIsTerminal( isTerminal ), mParams( params ) {}
+
     // Open new or extend existing
     void OpenOrExtend( const int score, const bool terminal,
                        const size_t length = 1 ) {
@@ -60,14 +71,17 @@ private:
       return mScore;
     }
 
+    void Set( const int score, const bool isTerminal ) {
+      mScore      = score;
+      mIsTerminal = isTerminal;
+    }
+
     void Reset() {
-      mScore      = MinInt();
-      mIsTerminal = false;
+      Set( MinInt(), false );
     }
   };
 
   using Scores = std::vector< int >;
-  using Gaps   = std::vector< Gap >;
 
   void PrintRow( const size_t width ) {
     for( int i = 0; i < width; i++ ) {
@@ -81,14 +95,90 @@ private:
     printf( "\n" );
   }
 
+  void ResetVerticalGap( const size_t x ) {
+    mVerticalScores[ x ]   = MinInt();
+    mVerticalTerminal[ x ] = false;
+  }
+
+  // One cell, with gaps that may be terminal (first and last column).
+  // score: from the diagonal.
+  void AlignCell( const size_t x, int score, Gap* horizontalGap,
+                  const bool isTerminalA, const bool isTerminalB,
+                  CigarOp* op ) {
+    Gap verticalGap( mParams, mVerticalScores[ x ], mVerticalTerminal[ x ] );
+
+    // Select highest score
+    //  - coming from diag (current),
+    //  - coming from left (row)
+    //  - coming from top (col)
+    if( score < horizontalGap->Score() )
+      score = horizontalGap->Score();
+    if( score < verticalGap.Score() )
+      score = verticalGap.Score();
+
+    mScores[ x ] = score;
+
+    if( score == horizontalGap->Score() ) {
+      *op = CigarOp::Insertion;
+    } else if( score == verticalGap.Score() ) {
+      *op = CigarOp::Deletion;
+    } else {
+      *op = CigarOp::Match; // match or mismatch, see the traceback
+    }
+
+    // Calculate potential gaps
+    horizontalGap->OpenOrExtend( score, isTerminalB );
+    verticalGap.OpenOrExtend( score, isTerminalA );
+
+    mVerticalScores[ x ]   = verticalGap.Score();
+    mVerticalTerminal[ x ] = verticalGap.IsTerminal();
+  }
+
+  // Substitution scores of the columns [0, mNumProfileColumns) against
+  // residue, computed once per residue and alignment
+  const int* Profile( const char residue ) {
+    int& slot = mProfileSlots[ ( unsigned char ) residue ];
+    if( slot < 0 ) {
+      slot = mProfileResidues.size();
+      mProfileResidues.push_back( residue );
+
+      if( mProfiles.size() < ( slot + 1 ) * mNumProfileColumns ) {
+        mProfiles.resize( ( slot + 1 ) * mNumProfileColumns );
+      }
+
+      int* profile = &mProfiles[ slot * mNumProfileColumns ];
+      for( size_t x = 1; x < mNumProfileColumns; x++ ) {
+        profile[ x ] =
+          ScorePolicy< Alphabet >::Score( mColumnResidues[ x ], residue );
+      }
+    }
+    return &mProfiles[ slot * mNumProfileColumns ];
+  }
+
   Scores            mScores;
-  Gaps              mVerticalGaps;
+  Scores            mVerticalScores;
+  std::vector< char > mVerticalTerminal;
+  Scores            mScratch;
   CigarOps          mOperations;
   BandedAlignParams mParams;
+  BandedRow::Kernel mRowKernel;
+
+  std::string         mColumnResidues; // residue of A by column
+  size_t              mNumProfileColumns;
+  Scores              mProfiles;
+  std::vector< int >  mProfileSlots;    // by residue, -1: none yet
+  std::vector< char > mProfileResidues; // with a slot
 
 public:
   BandedAlign( const BandedAlignParams& params = BandedAlignParams() )
-      : mParams( params ) {}
+      : mParams( params ), mProfileSlots( 256, -1 ) {
+    // The vector kernels rely on gaps costing something
+    const bool gapsCost =
+      params.interiorGapOpenScore <= 0 && params.interiorGapExtendScore <= 0 &&
+      params.terminalGapOpenScore <= 0 && params.terminalGapExtendScore <= 0;
+    mRowKernel =
+      BandedRow::Select( gapsCost ? params.simdLevel : SimdLevel::None );
+  }
 
   int Align( const Sequence< Alphabet >& A, const Sequence< Alphabet >& B,
              Cigar*                   cigar = NULL,
@@ -126,30 +216,57 @@ public:
 
     // Make sure we have enough cells
     if( mScores.capacity() < width ) {
-      mScores = Scores( width * 1.5, MinInt() );
-    }
-
-    if( mVerticalGaps.capacity() < width ) {
-      mVerticalGaps = Gaps( width * 1.5, mParams );
-    }
-
-    if( mOperations.capacity() < width * height ) {
-      mOperations = CigarOps( width * height * 1.5 );
+      mScores           = Scores( width * 1.5, MinInt() );
+      mVerticalScores   = Scores( width * 1.5, MinInt() );
+      mVerticalTerminal = std::vector< char >( width * 1.5, false );
+      mScratch          = Scores( width * 1.5 + 8 );
     }
 
     // Initialize first row
     size_t bw = mParams.bandwidth;
 
+    // Operations are kept for the band only, row y from the first column
+    // of its band on
+    size_t rowLength = height > 1 ? std::min( width, 2 * bw + 1 ) : width;
+    if( mOperations.size() < rowLength * height ) {
+      mOperations = CigarOps( rowLength * height * 1.5 );
+    }
+    auto firstColumn = [&]( const size_t y ) {
+      return std::min( y > bw ? y - bw : 0, width - 1 );
+    };
+
+    auto indexA = [&]( const size_t x ) {
+      return ( dir == AlignmentDirection::Forward ) ? startA + x - 1
+                                                    : startA - x;
+    };
+    auto indexB = [&]( const size_t y ) {
+      return ( dir == AlignmentDirection::Forward ) ? startB + y - 1
+                                                    : startB - y;
+    };
+
     bool fromBeginningA = ( startA == 0 || startA == lenA );
     bool fromBeginningB = ( startB == 0 || startB == lenB );
 
     bool fromEndA = ( endA == 0 || endA == lenA );
     bool fromEndB = ( endB == 0 || endB == lenB );
 
+    // Residues of A in the columns the band reaches, for the profiles
+    for( auto residue : mProfileResidues ) {
+      mProfileSlots[ ( unsigned char ) residue ] = -1;
+    }
+    mProfileResidues.clear();
+    mNumProfileColumns = std::min( width, height + bw );
+    mColumnResidues.resize( mNumProfileColumns );
+    for( size_t x = 1; x < mNumProfileColumns; x++ ) {
+      mColumnResidues[ x ] = A[ indexA( x ) ];
+    }
+
     mScores[ 0 ] = 0;
 
-    mVerticalGaps[ 0 ].Reset();
-    mVerticalGaps[ 0 ].OpenOrExtend( mScores[ 0 ], fromBeginningB );
+    Gap firstVerticalGap( mParams );
+    firstVerticalGap.OpenOrExtend( mScores[ 0 ], fromBeginningB );
+    mVerticalScores[ 0 ]   = firstVerticalGap.Score();
+    mVerticalTerminal[ 0 ] = firstVerticalGap.IsTerminal();
 
     Gap horizontalGap( mParams );
 
@@ -161,11 +278,11 @@ public:
       horizontalGap.OpenOrExtend( mScores[ x - 1 ], fromBeginningA );
       mScores[ x ]     = horizontalGap.Score();
       mOperations[ x ] = CigarOp::Insertion;
-      mVerticalGaps[ x ].Reset();
+      ResetVerticalGap( x );
     }
     if( x < width ) {
       mScores[ x ] = MinInt();
-      mVerticalGaps[ x ].Reset();
+      ResetVerticalGap( x );
     }
     /* PrintRow( width ); */
 
@@ -173,76 +290,70 @@ public:
     size_t center = 1;
     bool   hitEnd = false;
     for( y = 1; y < height && !hitEnd; y++ ) {
-      int score = MinInt();
-
       // Calculate band bounds
       size_t leftBound =
         std::min( center > bw ? ( center - bw ) : 0, width - 1 );
       size_t rightBound = std::min( center + bw, width - 1 );
 
+      bool isTerminalB = ( y == height - 1 ) && fromEndB;
+
+      CigarOp*   ops = mOperations.data() + y * rowLength - leftBound;
+      const int* substitutions = Profile( B[ indexB( y ) ] );
+
       // Set diagonal score for first calculated cell in row
       int diagScore = MinInt();
       if( leftBound > 0 ) {
         diagScore                = mScores[ leftBound - 1 ];
         mScores[ leftBound - 1 ] = MinInt();
-        mVerticalGaps[ leftBound - 1 ].Reset();
+        ResetVerticalGap( leftBound - 1 );
       }
 
-      // Calculate row within the band bounds
       horizontalGap.Reset();
-      for( x = leftBound; x <= rightBound; x++ ) {
-        // Calculate diagonal score
-        size_t aIdx = 0, bIdx = 0;
-        bool   match;
-        if( x > 0 ) {
-          aIdx =
-            ( dir == AlignmentDirection::Forward ) ? startA + x - 1 : startA - x;
-          bIdx =
-            ( dir == AlignmentDirection::Forward ) ? startB + y - 1 : startB - y;
-          // diagScore: score at col-1, row-1
-          match = MatchPolicy< Alphabet >::Match( A[ aIdx ], B[ bIdx ] );
-          score = diagScore + ScorePolicy< Alphabet >::Score( A[ aIdx ], B[ bIdx ] );
-        }
-
-        // Select highest score
-        //  - coming from diag (current),
-        //  - coming from left (row)
-        //  - coming from top (col)
-        if( score < horizontalGap.Score() )
-          score = horizontalGap.Score();
-
-        Gap& verticalGap = mVerticalGaps[ x ];
-        if( score < verticalGap.Score() )
-          score = verticalGap.Score();
-
-        // Save the prev score at (x - 1) which
-        // we will use to compute the diagonal score at (x)
-        diagScore = mScores[ x ];
-
-        // Save new score
-        mScores[ x ] = score;
-
-        CigarOp op;
-        if( score == horizontalGap.Score() ) {
-          op = CigarOp::Insertion;
-        } else if( score == verticalGap.Score() ) {
-          op = CigarOp::Deletion;
-        } else {
-          op = match ? CigarOp::Match : CigarOp::Mismatch;
-        }
-        mOperations[ y * width + x ] = op;
+      x = leftBound;
+
+      // First column (no diagonal)
+      if( x == 0 ) {
+        diagScore = mScores[ 0 ];
+        AlignCell( 0, MinInt(), &horizontalGap, fromEndA, isTerminalB,
+                   &ops[ 0 ] );
+        x++;
+      }
 
-        // Calculate potential gaps
-        bool isTerminalA = ( x == 0 || x == width - 1 ) && fromEndA;
-        bool isTerminalB = ( y == 0 || y == height - 1 ) && fromEndB;
+      // Columns in between, where no gap is terminal
+      size_t interiorEnd = std::min( rightBound + 1, width - 1 );
+      if( x < interiorEnd ) {
+        BandedRow::Gaps gaps;
+        gaps.horizontalExtend = isTerminalB ? mParams.terminalGapExtendScore
+                                            : mParams.interiorGapExtendScore;
+        gaps.horizontalOpen =
+          gaps.horizontalExtend + ( isTerminalB ? mParams.terminalGapOpenScore
+                                                : mParams.interiorGapOpenScore );
+        gaps.verticalExtend = mParams.interiorGapExtendScore;
+        gaps.verticalOpen =
+          mParams.interiorGapOpenScore + mParams.interiorGapExtendScore;
+
+        int nextDiagScore = mScores[ interiorEnd - 1 ];
+        int horizontal    = mRowKernel(
+          &mScores[ x ], &mVerticalScores[ x ], substitutions + x, ops + x,
+          interiorEnd - x, diagScore, horizontalGap.Score(), gaps,
+          mScratch.data() );
+
+        // A gap was opened at the first cell at the latest
+        horizontalGap.Set( horizontal, isTerminalB );
+        diagScore = nextDiagScore;
+        x         = interiorEnd;
+      }
 
-        horizontalGap.OpenOrExtend( score, isTerminalB );
-        verticalGap.OpenOrExtend( score, isTerminalA );
+      // Last column
+      if( x <= rightBound ) {
+        AlignCell( x, diagScore + substitutions[ x ], &horizontalGap, fromEndA,
+                   isTerminalB, &ops[ x ] );
+        x++;
       }
 
       if( rightBound + 1 < width ) {
         mScores[ rightBound + 1 ] = MinInt();
-        mVerticalGaps[ rightBound + 1 ].Reset();
+        ResetVerticalGap( rightBound + 1 );
       }
 
       hitEnd = ( rightBound == leftBound );
@@ -261,7 +372,13 @@ public:
       CigarEntry ce;
       cigar->Clear();
       while( bx != 0 || by != 0 ) {
-        CigarOp op = mOperations[ by * width + bx ];
+        CigarOp op = mOperations[ by * rowLength + bx - firstColumn( by ) ];
+        if( op == CigarOp::Match ) {
+          op = MatchPolicy< Alphabet >::Match( A[ indexA( bx ) ],
+                                               B[ indexB( by ) ] )
+                 ? CigarOp::Match
+                 : CigarOp::Mismatch;
+        }
         cigar->Add( op );
 
         switch( op ) {
@@ -292,8 +409,9 @@ public:
     int score = mScores[ x - 1 ];
     if( x == width ) {
       // We reached the end of A, emulate going down on B (vertical gaps)
-      size_t remainingB  = height - y;
-      Gap&   verticalGap = mVerticalGaps[ x - 1 ];
+      size_t remainingB = height - y;
+      Gap    verticalGap( mParams, mVerticalScores[ x - 1 ],
+                          mVerticalTerminal[ x - 1 ] );
       verticalGap.OpenOrExtend( score, verticalGap.IsTerminal(), remainingB );
       score = verticalGap.Score();
 
@@ -0,0 +1,260 @@
+#pragma once
+
+#include "Cigar.h"
+#include "Common.h"
+#include "../Simd.h"
+
+#include <algorithm>
+#include <cstddef>
+#include <cstring>
+
+/*
+ * Kernels for the cells of one row of the band of BandedAlign, away from
+ * the first and last column (whose gaps may be terminal). Every kernel
+ * computes the same scores and operations as the scalar one.
+ *
+ * The vector kernels get the diagonal and vertical scores of all cells
+ * at once, as they only depend on the previous row. The horizontal gap
+ * scores are a prefix maximum over the row: as opening a gap costs
+ * something, a gap is never opened from a cell whose best score is a
+ * horizontal gap itself, so the prefix can be taken over the diagonal
+ * and vertical scores alone.
+ */
+namespace BandedRow {
+
+struct Gaps {
+  int horizontalOpen;   // open + extend, of a gap of length 1
+  int horizontalExtend;
+  int verticalOpen;
+  int verticalExtend;
+};
+
+// Cells [0, count) of the row. scores: the previous row in, this row out.
+// diag: score of the previous row left of the first cell. horizontal:
+// horizontal gap score at the first cell. ops: Insertion, Deletion or
+// Match for the diagonal (match or mismatch is left to the traceback).
+// scratch: count + 8 ints. Returns the horizontal gap score after the last
+// cell.
+using Kernel = int ( * )( int* scores, int* verticalScores,
+                          const int* substitutions, CigarOp* ops,
+                          const size_t count, int diag, int horizontal,
+                          const Gaps& gaps, int* scratch );
+
+inline int Scalar( int* scores, int* verticalScores, const int* substitutions,
+                   CigarOp* ops, const size_t count, int diag, int horizontal,
+                   const Gaps& gaps, int* /* scratch */ ) {
+  for( size_t i = 0; i < count; i++ ) {
+    int score = diag + substitutions[ i ];
+    diag      = scores[ i ];
+
+    const int vertical = verticalScores[ i ];
+    score              = std::max( score, horizontal );
+    score              = std::max( score, vertical );
+    scores[ i ]        = score;
+
+    if( score == horizontal ) {
+      ops[ i ] = CigarOp::Insertion;
+    } else if( score == vertical ) {
+      ops[ i ] = CigarOp::Deletion;
+    } else {
+      ops[ i ] = CigarOp::Match;
+    }
+
+    horizontal = std::max( horizontal + gaps.horizontalExtend,
+                           score + gaps.horizontalOpen );
+    verticalScores[ i ] =
+      std::max( vertical + gaps.verticalExtend, score + gaps.verticalOpen );
+  }
+  return horizontal;
+}
+
+#ifdef NSEARCH_X86_SIMD
+
+#define NSEARCH_SSE41 __attribute__( ( target( "sse4.1" ) ) )
+#define NSEARCH_AVX2 __attribute__( ( target( "avx2" ) ) )
+
+NSEARCH_SSE41
+inline int SSE41( int* scores, int* verticalScores, const int* substitutions,
+                  CigarOp* ops, const size_t count, int diag, int horizontal,
+                  const Gaps& gaps, int* scratch ) {
+  const size_t lanes = 4;
+  const size_t end   = count - count % lanes;
+
+  // Diagonal or vertical, whichever is better
+  for( size_t i = 0; i < end; i += lanes ) {
+    __m128i d = _mm_add_epi32(
+      _mm_loadu_si128( ( const __m128i* )( scores + i - 1 ) ),
+      _mm_loadu_si128( ( const __m128i* )( substitutions + i ) ) );
+    __m128i v = _mm_loadu_si128( ( const __m128i* )( verticalScores + i ) );
+    _mm_storeu_si128( ( __m128i* )( scratch + i ), _mm_max_epi32( d, v ) );
+  }
+  if( end > 0 ) {
+    scratch[ 0 ] = std::max( diag + substitutions[ 0 ], verticalScores[ 0 ] );
+    diag         = scores[ end - 1 ];
+  }
+
+  const int     e        = gaps.horizontalExtend;
+  const __m128i minInt   = _mm_set1_epi32( MinInt() );
+  const __m128i extend1  = _mm_set1_epi32( e );
+  const __m128i extend2  = _mm_set1_epi32( 2 * e );
+  const __m128i extends  = _mm_setr_epi32( 0, e, 2 * e, 3 * e );
+  const __m128i extend4  = _mm_set1_epi32( 4 * e );
+  const __m128i hOpen    = _mm_set1_epi32( gaps.horizontalOpen - e );
+  const __m128i vOpen    = _mm_set1_epi32( gaps.verticalOpen );
+  const __m128i vExtend  = _mm_set1_epi32( gaps.verticalExtend );
+  const __m128i opIns    = _mm_set1_epi32( ( int ) CigarOp::Insertion );
+  const __m128i opDel    = _mm_set1_epi32( ( int ) CigarOp::Deletion );
+  const __m128i opDiag   = _mm_set1_epi32( ( int ) CigarOp::Match );
+  __m128i       carry    = _mm_set1_epi32( horizontal );
+
+  for( size_t i = 0; i < end; i += lanes ) {
+    __m128i best = _mm_loadu_si128( ( const __m128i* )( scratch + i ) );
+
+    // Best gap opened at or left of every cell, extended up to it
+    __m128i open = _mm_add_epi32( best, hOpen );
+    open         = _mm_max_epi32(
+      open, _mm_add_epi32(
+              _mm_blend_epi16( _mm_slli_si128( open, 4 ), minInt, 0x03 ),
+              extend1 ) );
+    open = _mm_max_epi32(
+      open, _mm_add_epi32(
+              _mm_blend_epi16( _mm_slli_si128( open, 8 ), minInt, 0x0F ),
+              extend2 ) );
+
+    __m128i h = _mm_max_epi32(
+      _mm_add_epi32( carry, extends ),
+      _mm_add_epi32(
+        _mm_blend_epi16( _mm_slli_si128( open, 4 ), minInt, 0x03 ), extend1 ) );
+    carry = _mm_max_epi32( _mm_add_epi32( carry, extend4 ),
+                           _mm_add_epi32( _mm_shuffle_epi32( open, 0xFF ), extend1 ) );
+
+    __m128i v     = _mm_loadu_si128( ( const __m128i* )( verticalScores + i ) );
+    __m128i score = _mm_max_epi32( best, h );
+    _mm_storeu_si128( ( __m128i* )( scores + i ), score );
+    _mm_storeu_si128(
+      ( __m128i* )( verticalScores + i ),
+      _mm_max_epi32( _mm_add_epi32( v, vExtend ), _mm_add_epi32( score, vOpen ) ) );
+
+    __m128i op = _mm_blendv_epi8( opDiag, opDel, _mm_cmpeq_epi32( score, v ) );
+    op         = _mm_blendv_epi8( op, opIns, _mm_cmpeq_epi32( score, h ) );
+    op         = _mm_packs_epi32( op, op );
+    op         = _mm_packus_epi16( op, op );
+    int packed = _mm_cvtsi128_si32( op );
+    memcpy( ops + i, &packed, lanes );
+  }
+  if( end > 0 ) {
+    horizontal = _mm_cvtsi128_si32( carry );
+  }
+
+  return Scalar( scores + end, verticalScores + end, substitutions + end,
+                 ops + end, count - end, diag, horizontal, gaps, scratch );
+}
+
+// Lanes moved up by as many lanes as blend has bits, fill shifted in
+template < int Blend >
+NSEARCH_AVX2 inline __m256i ShiftLanesUp( const __m256i v, const __m256i fill,
+                                          const __m256i index ) {
+  return _mm256_blend_epi32( _mm256_permutevar8x32_epi32( v, index ), fill,
+                             Blend );
+}
+
+NSEARCH_AVX2
+inline int AVX2( int* scores, int* verticalScores, const int* substitutions,
+                 CigarOp* ops, const size_t count, int diag, int horizontal,
+                 const Gaps& gaps, int* scratch ) {
+  const size_t lanes = 8;
+  const size_t end   = count - count % lanes;
+
+  // Diagonal or vertical, whichever is better
+  for( size_t i = 0; i < end; i += lanes ) {
+    __m256i d = _mm256_add_epi32(
+      _mm256_loadu_si256( ( const __m256i* )( scores + i - 1 ) ),
+      _mm256_loadu_si256( ( const __m256i* )( substitutions + i ) ) );
+    __m256i v = _mm256_loadu_si256( ( const __m256i* )( verticalScores + i ) );
+    _mm256_storeu_si256( ( __m256i* )( scratch + i ), _mm256_max_epi32( d, v ) );
+  }
+  if( end > 0 ) {
+    scratch[ 0 ] = std::max( diag + substitutions[ 0 ], verticalScores[ 0 ] );
+    diag         = scores[ end - 1 ];
+  }
+
+  const int     e       = gaps.horizontalExtend;
+  const __m256i minInt  = _mm256_set1_epi32( MinInt() );
+  const __m256i up1     = _mm256_setr_epi32( 0, 0, 1, 2, 3, 4, 5, 6 );
+  const __m256i up2     = _mm256_setr_epi32( 0, 0, 0, 1, 2, 3, 4, 5 );
+  const __m256i up4     = _mm256_setr_epi32( 0, 0, 0, 0, 0, 1, 2, 3 );
+  const __m256i last    = _mm256_set1_epi32( 7 );
+  const __m256i extend1 = _mm256_set1_epi32( e );
+  const __m256i extend2 = _mm256_set1_epi32( 2 * e );
+  const __m256i extend4 = _mm256_set1_epi32( 4 * e );
+  const __m256i extend8 = _mm256_set1_epi32( 8 * e );
+  const __m256i extends =
+    _mm256_setr_epi32( 0, e, 2 * e, 3 * e, 4 * e, 5 * e, 6 * e, 7 * e );
+  const __m256i hOpen   = _mm256_set1_epi32( gaps.horizontalOpen - e );
+  const __m256i vOpen   = _mm256_set1_epi32( gaps.verticalOpen );
+  const __m256i vExtend = _mm256_set1_epi32( gaps.verticalExtend );
+  const __m256i opIns   = _mm256_set1_epi32( ( int ) CigarOp::Insertion );
+  const __m256i opDel   = _mm256_set1_epi32( ( int ) CigarOp::Deletion );
+  const __m256i opDiag  = _mm256_set1_epi32( ( int ) CigarOp::Match );
+  __m256i       carry   = _mm256_set1_epi32( horizontal );
+
+  for( size_t i = 0; i < end; i += lanes ) {
+    __m256i best = _mm256_loadu_si256( ( const __m256i* )( scratch + i ) );
+
+    // Best gap opened at or left of every cell, extended up to it
+    __m256i open = _mm256_add_epi32( best, hOpen );
+    open         = _mm256_max_epi32(
+      open, _mm256_add_epi32( ShiftLanesUp< 0x01 >( open, minInt, up1 ), extend1 ) );
+    open = _mm256_max_epi32(
+      open, _mm256_add_epi32( ShiftLanesUp< 0x03 >( open, minInt, up2 ), extend2 ) );
+    open = _mm256_max_epi32(
+      open, _mm256_add_epi32( ShiftLanesUp< 0x0F >( open, minInt, up4 ), extend4 ) );
+
+    __m256i h = _mm256_max_epi32(
+      _mm256_add_epi32( carry, extends ),
+      _mm256_add_epi32( ShiftLanesUp< 0x01 >( open, minInt, up1 ), extend1 ) );
+    carry = _mm256_max_epi32(
+      _mm256_add_epi32( carry, extend8 ),
+      _mm256_add_epi32( _mm256_permutevar8x32_epi32( open, last ), extend1 ) );
+
+    __m256i v = _mm256_loadu_si256( ( const __m256i* )( verticalScores + i ) );
+    __m256i score = _mm256_max_epi32( best, h );
+    _mm256_storeu_si256( ( __m256i* )( scores + i ), score );
+    _mm256_storeu_si256( ( __m256i* )( verticalScores + i ),
+                         _mm256_max_epi32( _mm256_add_epi32( v, vExtend ),
+                                           _mm256_add_epi32( score, vOpen ) ) );
+
+    __m256i op =
+      _mm256_blendv_epi8( opDiag, opDel, _mm256_cmpeq_epi32( score, v ) );
+    op = _mm256_blendv_epi8( op, opIns, _mm256_cmpeq_epi32( score, h ) );
+    __m128i packed = _mm_packs_epi32( _mm256_castsi256_si128( op ),
+                                      _mm256_extracti128_si256( op, 1 ) );
+    packed         = _mm_packus_epi16( packed, packed );
+    _mm_storel_epi64( ( __m128i* )( ops + i ), packed );
+  }
+  if( end > 0 ) {
+    horizontal = _mm_cvtsi128_si32( _mm256_castsi256_si128( carry ) );
+  }
+
+  return Scalar( scores + end, verticalScores + end, substitutions + end,
+                 ops + end, count - end, diag, horizontal, gaps, scratch );
+}
+
+#undef NSEARCH_SSE41
+#undef NSEARCH_AVX2
+
+#endif
+
+// The kernel for level, or a lower one if it is not compiled in. The
+// vector kernels rely on gap open and extend scores <= 0.
+inline Kernel Select( const SimdLevel level ) {
+#ifdef NSEARCH_X86_SIMD
+  if( level == SimdLevel::AVX2 )
+    return &AVX2;
+  if( level == SimdLevel::SSE41 )
+    return &SSE41;
+#endif
+  return &Scalar;
+}
+
+} // namespace BandedRow
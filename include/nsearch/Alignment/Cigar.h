@@ -141,6 +141,95 @@ public:
   }
 };
 
+// What Cigar::Identity needs of a cigar (matches, columns and the first
+// and last entry) without keeping its entries. Kept next to a Cigar that
+// grows piece by piece, to judge it after every piece.
+class CigarCounts {
+public:
+  size_t     matches = 0;
+  size_t     cols    = 0;
+  CigarEntry first, last;
+
+  bool empty() const {
+    return cols == 0;
+  }
+
+  void Add( const CigarEntry& entry ) {
+    CigarCounts counts;
+    counts.first = counts.last = entry;
+    counts.cols                = entry.count;
+    counts.matches = entry.op == CigarOp::Match ? entry.count : 0;
+    *this += counts;
+  }
+
+  CigarCounts& operator+=( const Cigar& cigar ) {
+    for( auto& entry : cigar )
+      Add( entry );
+    return *this;
+  }
+
+  CigarCounts& operator+=( const CigarCounts& other ) {
+    if( other.empty() || other.first.op == CigarOp::Unknown )
+      return *this;
+
+    if( empty() ) {
+      *this = other;
+      return *this;
+    }
+
+    // Entries merge where the ops meet, as in Cigar::Add
+    CigarEntry newFirst = first, newLast = other.last;
+    if( last.op == other.first.op ) {
+      if( IsOneEntry() )
+        newFirst.count += other.first.count;
+      if( other.IsOneEntry() )
+        newLast.count += last.count;
+    }
+
+    first = newFirst;
+    last  = newLast;
+    cols += other.cols;
+    matches += other.matches;
+    return *this;
+  }
+
+  float Identity() const {
+    // Don't count terminal gaps towards identity calculation
+    size_t columns = cols;
+    if( IsGap( first ) )
+      columns -= first.count;
+    if( !IsOneEntry() && IsGap( last ) )
+      columns -= last.count;
+
+    return columns > 0 ? float( matches ) / float( columns ) : 0.0f;
+  }
+
+  // Upper bound of the identity once the cigar is continued by an
+  // alignment of the remaining residues of A and B: at best all of the
+  // remaining pairs are matches, and the first and last entry end up
+  // as terminal gaps.
+  float MaxIdentity( const size_t remainingA, const size_t remainingB ) const {
+    size_t pairs   = std::min( remainingA, remainingB );
+    size_t columns = cols;
+    if( IsGap( first ) )
+      columns -= first.count;
+    if( !IsOneEntry() && IsGap( last ) )
+      columns -= last.count;
+
+    columns += pairs;
+    return columns > 0 ? float( matches + pairs ) / float( columns ) : 0.0f;
+  }
+
+private:
+  bool IsOneEntry() const {
+    return size_t( first.count ) == cols;
+  }
+
+  static bool IsGap( const CigarEntry& entry ) {
+    return entry.op == CigarOp::Insertion || entry.op == CigarOp::Deletion;
+  }
+};
+
 static std::ostream& operator<<( std::ostream& os, const Cigar& cigar ) {
   return ( os << cigar.ToString() );
 }
@@ -0,0 +1,172 @@
+#pragma once
+
+#include "../Sequence.h"
+
+#include <algorithm>
+#include <cstddef>
+#include <cstdint>
+#include <vector>
+
+/*
+ * Edit distance of a pattern to its best match anywhere in a text (the
+ * text's leading and trailing residues are free), computed column by
+ * column of the text with 64 rows of the pattern per machine word
+ * (Myers' bit-vector algorithm, in blocks as described by Hyyrö).
+ *
+ * Only the blocks that can still hold a distance <= maxDistance are
+ * computed (Ukkonen's cut-off): as a cell is never below its upper left
+ * neighbour, the lowest row within maxDistance moves down by at most one
+ * row per column.
+ */
+template < typename Alphabet >
+class EditDistance {
+public:
+  EditDistance() {
+    // Text residues every pattern residue matches, by pattern residue
+    for( int p = 0; p < NumLetters; p++ ) {
+      mMatches[ p ] = 0;
+      for( int t = 0; t < NumLetters; t++ ) {
+        if( MatchPolicy< Alphabet >::Match( 'A' + p, 'A' + t ) )
+          mMatches[ p ] |= uint32_t( 1 ) << t;
+      }
+    }
+  }
+
+  void SetPattern( const Sequence< Alphabet >& pattern ) {
+    mLength    = pattern.Length();
+    mNumBlocks = ( mLength + WordSize - 1 ) / WordSize;
+
+    // Match bit vectors by text residue. Residues out of 'A'...'Z' are
+    // taken to match anything, which can only lower the distance.
+    mPeq.assign( ( NumLetters + 1 ) * mNumBlocks, 0 );
+    for( size_t i = 0; i < mLength; i++ ) {
+      const Word   bit   = Word( 1 ) << ( i % WordSize );
+      const size_t block = i / WordSize;
+      const int    p     = Letter( pattern[ i ] );
+
+      uint32_t matches = p < NumLetters ? mMatches[ p ] : AllLetters;
+      matches |= uint32_t( 1 ) << NumLetters;
+      while( matches ) {
+        const int t = __builtin_ctz( matches );
+        mPeq[ t * mNumBlocks + block ] |= bit;
+        matches &= matches - 1;
+      }
+    }
+
+    mBlocks.resize( mNumBlocks );
+  }
+
+  // Distance of the pattern to text if it is <= maxDistance, otherwise
+  // some number > maxDistance
+  size_t Distance( const Sequence< Alphabet >& text, const size_t maxDistance ) {
+    if( mLength == 0 )
+      return 0;
+
+    const size_t n         = text.Length();
+    const int    k         = int( std::min( maxDistance, mLength ) );
+    const size_t lastBlock = mNumBlocks - 1;
+    Block*       blocks    = mBlocks.data();
+
+    // Blocks are scored at their bottom row, the last one at the last row
+    // of the pattern. Before the first column, row i is at i + 1.
+    for( size_t b = 0; b < mNumBlocks; b++ ) {
+      blocks[ b ].scoreBit = b == lastBlock ? ( mLength - 1 ) % WordSize
+                                            : WordSize - 1;
+    }
+    auto reset = [&]( const size_t b, const int score ) {
+      blocks[ b ].pv    = ~Word( 0 );
+      blocks[ b ].mv    = 0;
+      blocks[ b ].score = score + int( blocks[ b ].scoreBit ) + 1;
+    };
+
+    size_t active = std::min( lastBlock, size_t( k ) / WordSize );
+    for( size_t b = 0; b <= active; b++ )
+      reset( b, int( b * WordSize ) );
+
+    int best = int( mLength );
+    for( size_t j = 0; j < n; j++ ) {
+      const Word* peq = mPeq.data() + Letter( text[ j ] ) * mNumBlocks;
+
+      int hout = 0; // the row above the pattern is free
+      for( size_t b = 0; b <= active; b++ )
+        hout = Step( &blocks[ b ], peq[ b ], hout );
+
+      // The block below the last one can only be reached through the
+      // bottom row of the last one, if it was within maxDistance
+      if( active < lastBlock && blocks[ active ].score - hout <= k ) {
+        active++;
+        reset( active, blocks[ active - 1 ].score - hout );
+        Step( &blocks[ active ], peq[ active ], hout );
+      }
+
+      // Blocks whose rows are all > maxDistance
+      while( active > 0 &&
+             blocks[ active ].score > k + int( blocks[ active ].scoreBit ) )
+        active--;
+
+      if( active == lastBlock ) {
+        best = std::min( best, blocks[ lastBlock ].score );
+      } else {
+        // The pattern's last row is still out of reach, and it can only
+        // come closer by a row per column
+        const size_t lowestRow = ( active + 1 ) * WordSize - 1;
+        if( mLength - 1 - lowestRow > n - 1 - j )
+          break;
+      }
+    }
+
+    return size_t( best );
+  }
+
+private:
+  using Word = uint64_t;
+
+  static const size_t   WordSize   = 64;
+  static const int      NumLetters = 26; // 'A'...'Z'
+  static const uint32_t AllLetters = ( uint32_t( 1 ) << NumLetters ) - 1;
+
+  struct Block {
+    Word   pv, mv; // vertical differences +1 and -1, by row
+    int    score;
+    size_t scoreBit;
+  };
+
+  static int Letter( const char ch ) {
+    return ch >= 'A' && ch <= 'Z' ? ch - 'A' : NumLetters;
+  }
+
+  // Advances a block by one column. hin is the horizontal difference
+  // entering the block at its top, the one leaving it at its bottom is
+  // returned.
+  static int Step( Block* block, const Word eq, const int hin ) {
+    const Word pv     = block->pv;
+    const Word mv     = block->mv;
+    const Word hinNeg = Word( hin < 0 );
+    const Word hinPos = Word( hin > 0 );
+
+    const Word xv = eq | mv;
+    const Word eh = eq | hinNeg;
+    const Word xh = ( ( ( eh & pv ) + pv ) ^ pv ) | eh;
+
+    Word ph = mv | ~( xh | pv );
+    Word mh = pv & xh;
+
+    const int hout =
+      int( ph >> ( WordSize - 1 ) ) - int( mh >> ( WordSize - 1 ) );
+    block->score += int( ( ph >> block->scoreBit ) & 1 ) -
+                    int( ( mh >> block->scoreBit ) & 1 );
+
+    ph = ( ph << 1 ) | hinPos;
+    mh = ( mh << 1 ) | hinNeg;
+
+    block->pv = mh | ~( xv | ph );
+    block->mv = ph & xv;
+    return hout;
+  }
+
+  size_t              mLength    = 0;
+  size_t              mNumBlocks = 0;
+  uint32_t            mMatches[ NumLetters ];
+  std::vector< Word > mPeq; // by text residue, then block
+  std::vector< Block > mBlocks;
+};
@@ -39,9 +39,31 @@ private:
     printf( "\n" );
   }
 
-  ExtendAlignParams mAP;
-  Cells             mRow;
-  CigarOps          mOperations;
+  // Operations of the cells a row computed, rows one after another
+  struct OperationsRow {
+    size_t offset;
+    size_t firstX;
+  };
+
+  CigarOp& Operation( const size_t x, const size_t y ) {
+    const OperationsRow& row = mOperationsRows[ y ];
+    return mOperations[ row.offset + x - row.firstX ];
+  }
+
+  // Starts row y at column firstX, with room for the columns up to width
+  void BeginOperationsRow( const size_t y, const size_t firstX,
+                           const size_t width ) {
+    mOperationsRows[ y ] = { mNumOperations, firstX };
+    if( mOperations.size() < mNumOperations + width - firstX ) {
+      mOperations.resize( ( mNumOperations + width - firstX ) * 1.5 );
+    }
+  }
+
+  ExtendAlignParams            mAP;
+  Cells                        mRow;
+  CigarOps                     mOperations;
+  size_t                       mNumOperations;
+  std::vector< OperationsRow > mOperationsRows;
 
 public:
   ExtendAlign( const ExtendAlignParams& ap = ExtendAlignParams() )
@@ -76,9 +98,12 @@ public:
       mRow = Cells( width * 1.5 );
     }
 
-    if( mOperations.capacity() < width * height ) {
-      mOperations = CigarOps( width * height * 1.5 );
+    // Without a traceback, only scores are computed
+    const bool traceback = cigar != NULL;
+    if( traceback && mOperationsRows.size() < height ) {
+      mOperationsRows.resize( height * 1.5 );
     }
+    mNumOperations = 0;
 
     bestX = 0;
     bestY = 0;
@@ -92,17 +117,21 @@ public:
     mRow[ 0 ].score    = 0;
     mRow[ 0 ].scoreGap = mAP.gapOpenScore + mAP.gapExtendScore;
 
+    if( traceback )
+      BeginOperationsRow( 0, 0, width );
     for( x = 1; x < width; x++ ) {
       score = mAP.gapOpenScore + x * mAP.gapExtendScore;
 
       if( score < -mAP.xDrop )
         break;
 
-      mOperations[ x ]   = CigarOp::Insertion;
+      if( traceback )
+        Operation( x, 0 ) = CigarOp::Insertion;
       mRow[ x ].score    = score;
       mRow[ x ].scoreGap = MinInt();
     }
     size_t rowSize = x;
+    mNumOperations = rowSize;
     /* Print( mRow ); */
 
     size_t firstX = 0;
@@ -115,6 +144,10 @@ public:
 
       size_t lastX = firstX;
 
+      const size_t rowFirstX = firstX;
+      if( traceback )
+        BeginOperationsRow( y, rowFirstX, width );
+
       for( x = firstX; x < rowSize; x++ ) {
         int colGap = mRow[ x ].scoreGap;
 
@@ -175,15 +208,17 @@ public:
           }
 
           // Record new score
-          CigarOp op;
-          if( score == rowGap ) {
-            op = CigarOp::Insertion;
-          } else if( score == colGap ) {
-            op = CigarOp::Deletion;
-          } else {
-            op = match ? CigarOp::Match : CigarOp::Mismatch;
+          if( traceback ) {
+            CigarOp op;
+            if( score == rowGap ) {
+              op = CigarOp::Insertion;
+            } else if( score == colGap ) {
+              op = CigarOp::Deletion;
+            } else {
+              op = match ? CigarOp::Match : CigarOp::Mismatch;
+            }
+            Operation( x, y ) = op;
           }
-          mOperations[ y * width + x ] = op;
 
           mRow[ x ].score = score;
           mRow[ x ].scoreGap =
@@ -209,12 +244,15 @@ public:
           mRow[ rowSize ].score = rowGap;
           mRow[ rowSize ].scoreGap =
             rowGap + mAP.gapOpenScore + mAP.gapExtendScore;
-          mOperations[ y * width + rowSize ] = CigarOp::Insertion;
+          if( traceback )
+            Operation( rowSize, y ) = CigarOp::Insertion;
           rowGap += mAP.gapExtendScore;
           rowSize++;
         }
       }
 
+      mNumOperations += rowSize - rowFirstX;
+
       // Properly reset right bound
       if( rowSize < width ) {
         mRow[ rowSize ].score    = MinInt();
@@ -224,14 +262,14 @@ public:
       /* Print( mRow ); */
     }
 
-    if( cigar ) {
+    if( traceback ) {
       size_t bx = bestX;
       size_t by = bestY;
 
       CigarEntry ce;
       cigar->Clear();
       while( bx != 0 || by != 0 ) {
-        CigarOp op = mOperations[ by * width + bx ];
+        CigarOp op = Operation( bx, by );
         cigar->Add( op );
 
         switch( op ) {
@@ -8,6 +8,16 @@ struct BitMapPolicy {
   }
 };
 
+// Complement of a residue as mapped by BitMapPolicy, for alphabets
+// that have one
+template < typename Alphabet >
+struct BitMapComplementPolicy {
+  static const bool HasComplement = false;
+  inline static int8_t Complement( const int8_t bits ) {
+    return bits;
+  }
+};
+
 template < typename Alphabet >
 struct ComplementPolicy {
   inline static char Complement( const char ch ) {
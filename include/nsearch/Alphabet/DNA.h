@@ -5,6 +5,8 @@
 struct DNA {
   typedef char CharType;
 
+  static const char* Name() { return "DNA"; }
+
   enum class Strand { Plus, Minus, Both };
 };
 
@@ -26,6 +28,14 @@ struct BitMapPolicy< DNA > {
   }
 };
 
+template <>
+struct BitMapComplementPolicy< DNA > {
+  static const bool HasComplement = true;
+  inline static int8_t Complement( const int8_t bits ) {
+    return bits ^ 0b10; // A 00 <-> T 10, C 01 <-> G 11
+  }
+};
+
 template <>
 struct ComplementPolicy< DNA > {
   inline static char Complement( const char nuc ) {
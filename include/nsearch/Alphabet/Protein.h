@@ -4,6 +4,8 @@
 
 struct Protein {
   typedef char CharType;
+
+  static const char* Name() { return "Protein"; }
 };
 
 // Based on BLOSUM62
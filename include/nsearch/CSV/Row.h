@@ -0,0 +1,100 @@
+#pragma once
+
+#include "../Database/Search.h"
+
+#include <string>
+
+namespace CSV {
+
+// Columns of a single hit, as written to a CSV line
+// (positions are 1-based, terminal gaps are not part of the match)
+template < typename Alphabet >
+class Row {
+public:
+  Row( const Sequence< Alphabet >& query, const Hit< Alphabet >& hit ) {
+    Cigar cigar = hit.alignment;
+
+    size_t qs = 0, qe = query.Length() - 1;
+    size_t ts = 0, te = hit.target.Length() - 1;
+
+    // Dont take left terminal gap into account
+    if( !cigar.empty() ) {
+      const auto& fce = cigar.front();
+      if( fce.op == CigarOp::Deletion ) {
+        ts += fce.count;
+        cigar.pop_front();
+      } else if( fce.op == CigarOp::Insertion ) {
+        qs += fce.count;
+        cigar.pop_front();
+      }
+    }
+
+    // Don't take right terminal gap into account
+    if( !cigar.empty() ) {
+      const auto& bce = cigar.back();
+      if( bce.op == CigarOp::Deletion ) {
+        te -= bce.count;
+        cigar.pop_back();
+      } else if( bce.op == CigarOp::Insertion ) {
+        qe -= bce.count;
+        cigar.pop_back();
+      }
+    }
+
+    targetMatchSeq = hit.target.Subsequence( ts, te - ts + 1 ).sequence;
+    if( IsHitOnOtherStrand( hit ) ) {
+      // Minus strand -> Reverse complemented query has been hit
+      // (Alignment refers to the reverse complemented query)
+      queryMatchSeq =
+        query.Reverse().Complement().Subsequence( qs, qe - qs + 1 ).sequence;
+      // Then encode this information in queryMatchStart and queryMatchEnd
+      // (queryMatchStart > queryMatchEnd)
+      qs = query.Length() - qs - 1;
+      qe = query.Length() - qe - 1;
+    } else {
+      queryMatchSeq = query.Subsequence( qs, qe - qs + 1 ).sequence;
+    }
+
+    numMatches = 0, numMismatches = 0, numColumns = 0, numGaps = 0;
+    for( auto& c : cigar ) {
+      numColumns += c.count;
+      switch( c.op ) {
+        case CigarOp::Insertion: numGaps += c.count; break;
+        case CigarOp::Deletion: numGaps += c.count; break;
+        case CigarOp::Match: numMatches += c.count; break;
+        case CigarOp::Mismatch: numMismatches += c.count; break;
+        default: break;
+      }
+    }
+
+    queryMatchStart  = qs + 1;
+    queryMatchEnd    = qe + 1;
+    targetMatchStart = ts + 1;
+    targetMatchEnd   = te + 1;
+
+    identity  = float( numMatches ) / float( numColumns );
+    alignment = cigar;
+  }
+
+  size_t queryMatchStart, queryMatchEnd;
+  size_t targetMatchStart, targetMatchEnd;
+
+  std::string queryMatchSeq, targetMatchSeq;
+
+  size_t numColumns, numMatches, numMismatches, numGaps;
+  float  identity;
+
+  Cigar alignment;
+
+private:
+  static inline bool IsHitOnOtherStrand( const Hit< Alphabet >& hit ) {
+    return false;
+  }
+};
+
+template <>
+inline bool Row< DNA >::IsHitOnOtherStrand( const Hit< DNA >& hit ) {
+  return hit.strand == DNA::Strand::Minus;
+}
+
+} // namespace CSV
@@ -1,6 +1,7 @@
 #pragma once
 
 #include "../Database/HitWriter.h"
+#include "Row.h"
 
 #include <fstream>
 #include <array>
@@ -23,78 +24,14 @@ public:
     out << std::setiosflags( std::ios::fixed );
 
     // Header
-    static bool wroteHeader = false;
-    if( !wroteHeader ) {
+    if( !mWroteHeader ) {
       out << "QueryId,TargetId,QueryMatchStart,QueryMatchEnd,TargetMatchStart,TargetMatchEnd,QueryMatchSeq,TargetMatchSeq,NumColumns,NumMatches,NumMismatches,NumGaps,Identity,Alignment" << std::endl;
-      wroteHeader = true;
+      mWroteHeader = true;
     }
 
     // Each hit gets a line
     for( const auto& hit : hits ) {
-      // Compute stuff
-      // ----
-      Cigar cigar = hit.alignment;
-
-      size_t qs = 0, qe = query.Length() - 1;
-      size_t ts = 0, te = hit.target.Length() - 1;
-
-      // Dont take left terminal gap into account
-      if( !cigar.empty() ) {
-        const auto& fce = cigar.front();
-        if( fce.op == CigarOp::Deletion ) {
-          ts += fce.count;
-          cigar.pop_front();
-        } else if( fce.op == CigarOp::Insertion ) {
-          qs += fce.count;
-          cigar.pop_front();
-        }
-      }
-
-      // Don't take right terminal gap into account
-      if( !cigar.empty() ) {
-        const auto& bce = cigar.back();
-        if( bce.op == CigarOp::Deletion ) {
-          te -= bce.count;
-          cigar.pop_back();
-        } else if( bce.op == CigarOp::Insertion ) {
-          qe -= bce.count;
-          cigar.pop_back();
-        }
-      }
-
-      Sequence< Alphabet > targetMatchSeq = hit.target.Subsequence( ts, te - ts + 1 );
-      Sequence< Alphabet > queryMatchSeq;
-      if( IsHitOnOtherStrand( hit ) ) {
-        // Minus strand -> Reverse complemented query has been hit
-        // (Alignment refers to the reverse complemented query)
-        queryMatchSeq =
-          query.Reverse().Complement().Subsequence( qs, qe - qs + 1 );
-        // Then encode this information in queryMatchStart and queryMatchEnd
-        // (queryMatchStart > queryMatchEnd)
-        qs = query.Length() - qs - 1;
-        qe = query.Length() - qe - 1;
-      } else {
-         queryMatchSeq = query.Subsequence( qs, qe - qs + 1 );
-      }
-
-      size_t numMatches = 0, numMismatches = 0, numColumns = 0, numGaps = 0;
-      for( auto& c : cigar ) {
-        for( int i = 0; i < c.count; i++ ) {
-          numColumns++;
-          switch( c.op ) {
-            case CigarOp::Insertion: numGaps++; break;
-            case CigarOp::Deletion: numGaps++; break;
-            case CigarOp::Match: numMatches++; break;
-            case CigarOp::Mismatch: numMismatches++; break;
-            default: break;
-          }
-        }
-      }
-
-      float identity  = float( numMatches ) / float( numColumns );
-
-      // Write stuff
-      // ----
+      Row< Alphabet > row( query, hit );
 
       // QueryId
       out << EscapeStringForCSV( query.identifier ) << ",";
@@ -103,32 +40,32 @@ public:
       out << EscapeStringForCSV( hit.target.identifier ) << ",";
 
       // QueryMatchStart
-      out << qs + 1 << ",";
+      out << row.queryMatchStart << ",";
 
       // QueryMatchEnd
-      out << qe + 1 << ",";
+      out << row.queryMatchEnd << ",";
 
       // TargetMatchStart
-      out << ts + 1 << ",";
+      out << row.targetMatchStart << ",";
 
       // TargetMatchEnd
-      out << te + 1 << ",";
+      out << row.targetMatchEnd << ",";
 
       // QueryMatchSeq
-      out << EscapeStringForCSV( queryMatchSeq.sequence ) << ",";
+      out << EscapeStringForCSV( row.queryMatchSeq ) << ",";
 
       // TargetMatchSeq
-      out << EscapeStringForCSV( targetMatchSeq.sequence ) << ",";
+      out << EscapeStringForCSV( row.targetMatchSeq ) << ",";
 
       // NumColumns, NumMatches, NumMismatches, NumGaps
-      out << numColumns << "," << numMatches << "," << numMismatches << ","
-          << numGaps << ",";
+      out << row.numColumns << "," << row.numMatches << ","
+          << row.numMismatches << "," << row.numGaps << ",";
 
       // Identity
-      out << std::setprecision( 3 ) << identity << ",";
+      out << std::setprecision( 3 ) << row.identity << ",";
 
       // Alignment
-      out << cigar.ToString();
+      out << row.alignment.ToString();
 
       out << std::endl;
     }
@@ -137,6 +74,8 @@ public:
   }
 
 private:
+  bool mWroteHeader = false;
+
   std::string EscapeStringForCSV( const std::string& value ) {
     std::string ret = value;
 
@@ -155,15 +94,6 @@ private:
 
     return ret;
   }
-
-  static inline bool IsHitOnOtherStrand( const Hit< Alphabet >& hit ) {
-    return false;
-  }
 };
 
-template <>
-inline bool Writer< DNA >::IsHitOnOtherStrand( const Hit< DNA >& hit ) {
-  return hit.strand == DNA::Strand::Minus;
-}
-
 } // namespace CSV
@@ -1,6 +1,16 @@
 #pragma once
 
+#include <algorithm>
+#include <atomic>
+#include <chrono>
+#include <condition_variable>
 #include <deque>
+#include <limits>
+#include <memory>
+#include <mutex>
+#include <stdexcept>
+#include <string>
+#include <thread>
 #include <vector>
 
 #include "Sequence.h"
@@ -8,7 +18,14 @@
 
 #include "Database/HSP.h"
 #include "Database/Highscore.h"
+#include "Database/IndexArray.h"
+#include "Database/IndexFile.h"
+#include "Database/KmerArray.h"
+#include "Database/KmerPositions.h"
 #include "Database/Kmers.h"
+#include "Database/Minimizers.h"
+#include "Database/OffsetArray.h"
+#include "Database/Varint.h"
 
 #include "Alphabet.h"
 
@@ -21,35 +38,216 @@ public:
   using OnProgressCallback =
     std::function< void( ProgressType, const size_t, const size_t ) >;
 
+  // Bytes taken by the index arrays. The legacy figures are for the
+  // previous layout (dense indices only), with size_t offset and count
+  // arrays, plain posting lists and 32 bit kmers.
+  struct MemoryUsage {
+    size_t offsets;
+    size_t postings;
+    size_t kmers;
+    size_t sparseKmers; // sorted kmers and their directory
+    size_t legacyOffsets;
+    size_t legacyPostings;
+    size_t legacyKmers;
+
+    size_t Total() const {
+      return offsets + postings + kmers + sparseKmers;
+    }
+
+    size_t LegacyTotal() const {
+      return legacyOffsets + legacyPostings + legacyKmers;
+    }
+  };
+
   Database( const size_t kmerLength );
 
+  // Longest kmer for which no valid kmer collides with AmbiguousKmer.
+  // Longer than MaxDenseKmerBits requires a sparse index.
+  static size_t MaxKmerLength();
+
+  // Peak memory Initialize takes for a dense table of kmerBits bit kmers,
+  // with numKmers kmers in the database (residues times seed patterns)
+  static size_t DenseTableMemory( const size_t kmerBits, const size_t numKmers,
+                                  const bool compressPostings );
+
+  // Only before Initialize
+  void SetKmerLength( const size_t kmerLength );
+
+  // Spaced seeds instead of contiguous kmers, only before Initialize.
+  // All patterns need the same weight, which becomes the kmer length.
+  // With several patterns every position has one kmer per pattern,
+  // tagged with the pattern index in the bits above the kmer.
+  void SetSeedPatterns( const std::vector< std::string >& patterns );
+
   void SetProgressCallback( const OnProgressCallback& progressCallback );
-  void Initialize( const SequenceList< Alphabet >& sequences );
+
+  // Threads used by Initialize, numThreads <= 0 means one per core.
+  // Small databases are indexed with fewer threads.
+  void SetNumThreads( const int numThreads );
+
+  // Store posting lists as delta encoded varints. Smaller, but every
+  // lookup has to decode its list.
+  void SetCompressPostings( const bool compressPostings );
+
+  // Index only the kmers present, sorted, instead of a table with a
+  // slot for every possible kmer. Needed for long words; lookups
+  // search the sorted kmers.
+  void SetSparseIndex( const bool sparse );
+
+  // Index only the ( w, k )-minimizers of every sequence, about 2 / ( w + 1 )
+  // of its kmers. Queries look up their minimizers only. 1 indexes
+  // every kmer.
+  void SetMinimizerWindow( const size_t window );
+
+  // Mask kmers found in more than maxOccurrences sequences (poly-A,
+  // primers...): their posting lists are dropped, so that queries do not
+  // walk lists covering most of the database. The kmers stay part of the
+  // sequences for HSP detection. 0 masks nothing.
+  void SetMaxKmerOccurrences( const size_t maxOccurrences );
+  void Initialize( SequenceList< Alphabet > sequences );
+
+  // Index files are memory mapped on load unless useMmap is false.
+  // The checksum is only verified on request, since that requires
+  // reading the whole file.
+  void Save( const std::string& path ) const;
+  void Load( const std::string& path, const bool useMmap = true,
+             const bool verifyChecksum = false );
 
   size_t NumSequences() const;
-  size_t MaxUniqueKmers() const;
+  size_t NumKmerSlots() const; // every possible kmer, or those present when sparse
   size_t KmerLength() const;
+  size_t KmerBits() const; // including the pattern index
+  bool   CompressedPostings() const;
+  bool   IsSparse() const;
+  size_t MinimizerWindow() const;
+  size_t MaxKmerOccurrences() const;
+  size_t NumMaskedKmers() const;
+  size_t NumMaskedPostings() const; // postings dropped with them
+  size_t NumPostings() const;
+  size_t NumUsedKmers() const; // kmers found in at least one sequence
+
+  MemoryUsage IndexMemoryUsage() const;
+
+  const std::vector< SeedPattern >& SeedPatterns() const; // empty: contiguous
+  size_t NumSeedPatterns() const;
+
+  // Kmers of a sequence as stored in the index: fn( kmer, index ) for
+  // the kmers of each pattern in turn, NumKmerFrames() of them per
+  // pattern
+  template < typename Fn >
+  void ForEachKmer( const Sequence< Alphabet >& seq, const Fn& fn ) const;
+  size_t NumKmerFrames( const size_t length, const size_t pattern = 0 ) const;
+
+  // Kmers of the reverse complement of a sequence, given the kmers of the
+  // sequence from ForEachKmer. Only for alphabets with a complement.
+  // Derived from them where the kmers read the same on both strands
+  // (contiguous or symmetric seed patterns), extracted from
+  // reverseComplement for the other seed patterns.
+  void ReverseComplementKmers( const Sequence< Alphabet >& reverseComplement,
+                               const std::vector< Kmer >&  kmers,
+                               std::vector< Kmer >*        reverseKmers ) const;
+
+  // Of the kmers of a sequence of the given length, from ForEachKmer,
+  // those that are indexed: fn( kmer, index ) for all but ambiguous
+  // kmers, or for the minimizers of each pattern's kmers
+  template < typename Fn >
+  void ForEachIndexedKmer( const Kmer* kmers, const size_t length,
+                           const Fn& fn ) const;
 
   const Sequence< Alphabet >& GetSequenceById( const SequenceId& seqId ) const;
+  // Length of a sequence, from a compact array, for filters that only
+  // need the length
+  size_t SequenceLength( const SequenceId& seqId ) const;
 
+  // The kmers of a sequence, widened into buffer if they are stored with
+  // 32 bits
   bool GetKmersForSequenceId( const SequenceId& seqId, const Kmer** kmers,
-                              size_t* numKmers ) const;
-  bool GetSequenceIdsIncludingKmer( const Kmer& kmer, const SequenceId** seqIds,
-                                    size_t* numSeqIds ) const;
+                              size_t* numKmers,
+                              std::vector< Kmer >* buffer ) const;
+  // Slot of a kmer in [0, NumKmerSlots()), false if it is in no sequence
+  // of a sparse index or ambiguous
+  bool FindKmerSlot( const Kmer& kmer, size_t* slot ) const;
+
+  // Compressed posting lists are decoded into buffer, which is
+  // required for them
+  bool GetSequenceIdsInSlot( const size_t slot, const SequenceId** seqIds,
+                             size_t*                    numSeqIds,
+                             std::vector< SequenceId >* buffer = nullptr ) const;
+  bool GetSequenceIdsIncludingKmer(
+    const Kmer& kmer, const SequenceId** seqIds, size_t* numSeqIds,
+    std::vector< SequenceId >* buffer = nullptr ) const;
 
 private:
+  // Calls fn( seqId, scratch ) for every sequence, on up to mNumThreads
+  // threads working on consecutive ranges of sequences
+  template < typename Fn >
+  void ForEachSequence( const ProgressType type, const Fn& fn ) const;
+
+  // Calls fn( from, to ) on ranges of [0, count), in parallel
+  template < typename Fn >
+  void ParallelFor( const size_t count, const Fn& fn ) const;
+
+  // Sorted kmers of a sparse index, and their directory
+  void SetIndexedKmers( std::vector< Kmer >&& indexedKmers );
+
+  // Whether Initialize builds 32 bit posting offsets for numKmers kmers
+  static bool NarrowOffsets( const size_t numKmers,
+                             const bool   compressPostings );
+
+  // Largest dense table: 2^32 slots
+  static const size_t MaxDenseKmerBits = 32;
+  static const size_t MaxDirectoryBits = 28;
+
   size_t mKmerLength;
+  std::vector< SeedPattern > mSeedPatterns;
+  size_t mNumThreads;
+  bool   mCompressPostings;
+  bool   mSparse;
+  size_t mMinimizerWindow;
+  size_t mMaxKmerOccurrences;
+  std::vector< SequenceId > mThreadRanges; // first sequence of each thread
 
   SequenceList< Alphabet > mSequences;
-  size_t                   mMaxUniqueKmers;
+  std::vector< uint32_t >  mSequenceLengths;
+  size_t                   mNumKmerSlots;
+  size_t                   mNumPostings;
+  size_t                   mNumMaskedKmers;
+  size_t                   mNumMaskedPostings;
+
+  // Sparse index: kmer of every slot, ascending. Kmers with the top
+  // bits b ( kmer >> mKmerDirectoryShift ) are found in the slots
+  // [ directory[ b ], directory[ b + 1 ] ).
+  IndexArray< Kmer > mIndexedKmers;
+  OffsetArray        mKmerDirectory;
+  size_t             mKmerDirectoryShift;
 
-  std::vector< size_t >     mSequenceIdsOffsetByKmer;
-  std::vector< size_t >     mSequenceIdsCountByKmer;
-  std::vector< SequenceId > mSequenceIds;
+  // Posting list of slot s: entries [ offset[ s ], offset[ s + 1 ] ) of
+  // mSequenceIds, or bytes of mCompressedSequenceIds when compressed.
+  // The slot of a kmer is the kmer itself in a dense index.
+  OffsetArray              mSequenceIdsOffsetByKmer;
+  IndexArray< SequenceId > mSequenceIds;
+  IndexArray< uint8_t >    mCompressedSequenceIds;
 
-  std::vector< size_t > mKmerOffsetBySequenceId;
-  std::vector< size_t > mKmerCountBySequenceId;
-  std::vector< Kmer >   mKmers;
+  OffsetArray mKmerOffsetBySequenceId;
+  KmerArray   mKmers;
+
+  // Index file sections, in file order
+  enum IndexSection {
+    SequenceIdsOffsetByKmerSection,
+    SequenceIdsSection,
+    KmerOffsetBySequenceIdSection,
+    KmersSection,
+    IndexedKmersSection, // empty unless sparse
+    KmerDirectorySection,
+    SequenceTextOffsetsSection, // identifier and sequence start of every sequence
+    SequenceTextSection,
+    SeedPatternsSection, // comma separated, optional
+    MinimizerWindowSection, // optional
+    MaskingSection, // max. occurrences, masked kmers and postings, optional
+  };
+
+  // Keeps a loaded index file mapped as long as the arrays point into it
+  std::shared_ptr< IndexFile::MappedFile > mMapping;
 
   OnProgressCallback mProgressCallback;
 };
@@ -59,11 +257,82 @@ private:
  */
 template < typename A >
 Database< A >::Database( const size_t kmerLength )
-    : mKmerLength( kmerLength ),
-      mProgressCallback( []( ProgressType, const size_t, const size_t ) {} ),
-      mMaxUniqueKmers( 1 << ( BitMapPolicy< A >::NumBits * mKmerLength ) )
+    : mKmerLength( kmerLength ), mNumThreads( 1 ), mCompressPostings( false ),
+      mSparse( false ), mMinimizerWindow( 1 ), mMaxKmerOccurrences( 0 ),
+      mNumKmerSlots( size_t( 1 ) << ( BitMapPolicy< A >::NumBits * mKmerLength ) ),
+      mNumPostings( 0 ), mNumMaskedKmers( 0 ), mNumMaskedPostings( 0 ),
+      mKmerDirectoryShift( 0 ),
+      mProgressCallback( []( ProgressType, const size_t, const size_t ) {} )
 {
-  assert( BitMapPolicy< A >::NumBits * mKmerLength <= sizeof( Kmer ) * 8 );
+  assert( mKmerLength <= MaxKmerLength() );
+}
+
+template < typename A >
+size_t Database< A >::MaxKmerLength() {
+  return sizeof( Kmer ) * 8 / BitMapPolicy< A >::NumBits - 1;
+}
+
+template < typename A >
+bool Database< A >::NarrowOffsets( const size_t numKmers,
+                                   const bool   compressPostings ) {
+  // Every kmer is at most one posting, of at most 5 bytes as a varint
+  const size_t maxBytesPerPosting = compressPostings ? 5 : 1;
+  return numKmers <=
+         std::numeric_limits< uint32_t >::max() / maxBytesPerPosting;
+}
+
+template < typename A >
+size_t Database< A >::DenseTableMemory( const size_t kmerBits,
+                                        const size_t numKmers,
+                                        const bool   compressPostings ) {
+  if( kmerBits > MaxDenseKmerBits )
+    return std::numeric_limits< size_t >::max();
+
+  // A 32 bit count per slot next to the posting offsets. Compressing
+  // frees the counts, but adds the varint offsets, and wide offsets are
+  // narrowed into a copy if the postings turn out to fit after all.
+  const size_t numSlots = ( size_t( 1 ) << kmerBits ) + 1;
+  if( NarrowOffsets( numKmers, compressPostings ) )
+    return numSlots * ( sizeof( SequenceId ) + sizeof( uint32_t ) );
+  if( compressPostings )
+    return numSlots * ( 2 * sizeof( uint64_t ) + sizeof( uint32_t ) );
+  return numSlots * ( sizeof( SequenceId ) + sizeof( uint64_t ) );
+}
+
+template < typename A >
+void Database< A >::SetKmerLength( const size_t kmerLength ) {
+  if( kmerLength < 1 || kmerLength > MaxKmerLength() )
+    throw std::invalid_argument( "Word size must be between 1 and " +
+                                 std::to_string( MaxKmerLength() ) );
+
+  mKmerLength = kmerLength;
+  mSeedPatterns.clear();
+}
+
+template < typename A >
+void Database< A >::SetSeedPatterns( const std::vector< std::string >& patterns ) {
+  std::vector< SeedPattern > seedPatterns( patterns.begin(), patterns.end() );
+  if( seedPatterns.empty() )
+    throw std::invalid_argument( "No seed patterns given" );
+
+  size_t tagBits = 0;
+  while( ( size_t( 1 ) << tagBits ) < seedPatterns.size() ) {
+    tagBits++;
+  }
+
+  const size_t weight = seedPatterns.front().Weight();
+  for( auto& pattern : seedPatterns ) {
+    if( pattern.Weight() != weight )
+      throw std::invalid_argument( "Seed patterns must have the same number of 1s" );
+    if( pattern.Span() * BitMapPolicy< A >::NumBits > sizeof( Kmer ) * 8 )
+      throw std::invalid_argument( "Seed pattern '" + pattern.String() +
+                                   "' is too long" );
+  }
+  if( weight * BitMapPolicy< A >::NumBits + tagBits >= sizeof( Kmer ) * 8 )
+    throw std::invalid_argument( "Too many 1s in the seed patterns" );
+
+  mKmerLength   = weight;
+  mSeedPatterns = std::move( seedPatterns );
 }
 
 template < typename A >
@@ -73,89 +342,873 @@ void Database< A >::SetProgressCallback(
 }
 
 template < typename A >
-void Database< A >::Initialize( const SequenceList< A >& sequences ) {
-  mSequences = sequences;
+void Database< A >::SetNumThreads( const int numThreads ) {
+  mNumThreads = numThreads > 0
+                  ? numThreads
+                  : std::max( 1u, std::thread::hardware_concurrency() );
+}
+
+template < typename A >
+const std::vector< SeedPattern >& Database< A >::SeedPatterns() const {
+  return mSeedPatterns;
+}
 
-  size_t totalEntries       = 0;
-  size_t totalUniqueEntries = 0;
+template < typename A >
+size_t Database< A >::NumSeedPatterns() const {
+  return std::max( size_t( 1 ), mSeedPatterns.size() );
+}
 
-  /* std::vector< uint32_t > count( mMaxUniqueKmers ); */
-  std::vector< size_t >     uniqueCount( mMaxUniqueKmers );
-  std::vector< SequenceId > uniqueIndex( mMaxUniqueKmers, -1 );
+template < typename A >
+size_t Database< A >::KmerBits() const {
+  size_t tagBits = 0;
+  while( ( size_t( 1 ) << tagBits ) < mSeedPatterns.size() ) {
+    tagBits++;
+  }
+  return BitMapPolicy< A >::NumBits * mKmerLength + tagBits;
+}
 
-  for( SequenceId seqId = 0; seqId < mSequences.size(); seqId++ ) {
-    const Sequence< A >& seq = mSequences[ seqId ];
+template < typename A >
+size_t Database< A >::NumKmerFrames( const size_t length,
+                                     const size_t pattern ) const {
+  const size_t span =
+    mSeedPatterns.empty() ? mKmerLength : mSeedPatterns[ pattern ].Span();
+  return length >= span ? length - span + 1 : 1;
+}
 
-    Kmers< A > kmers( seq, mKmerLength );
-    kmers.ForEach( [&]( const Kmer kmer, const size_t pos ) {
-      totalEntries++;
+template < typename A >
+template < typename Fn >
+void Database< A >::ForEachKmer( const Sequence< A >& seq, const Fn& fn ) const {
+  if( mSeedPatterns.empty() ) {
+    Kmers< A >( seq, mKmerLength ).ForEach( fn );
+    return;
+  }
 
-      // Count unique words
-      if( kmer == AmbiguousKmer || uniqueIndex[ kmer ] == seqId )
-        return;
+  const size_t kmerBits = BitMapPolicy< A >::NumBits * mKmerLength;
 
-      uniqueIndex[ kmer ] = seqId;
-      uniqueCount[ kmer ]++;
-      totalUniqueEntries++;
+  size_t first = 0;
+  for( size_t pattern = 0; pattern < mSeedPatterns.size(); pattern++ ) {
+    const Kmer tag = Kmer( pattern ) << kmerBits;
+
+    Kmers< A > kmers( seq, mSeedPatterns[ pattern ] );
+    kmers.ForEach( [&]( const Kmer kmer, const size_t pos ) {
+      fn( kmer == AmbiguousKmer ? kmer : kmer | tag, first + pos );
     } );
+    first += kmers.Count();
+  }
+}
+
+template < typename A >
+void Database< A >::ReverseComplementKmers(
+  const Sequence< A >& reverseComplement, const std::vector< Kmer >& kmers,
+  std::vector< Kmer >* reverseKmers ) const {
+  assert( BitMapComplementPolicy< A >::HasComplement );
 
-    // Progress
-    if( seqId % 512 == 0 || seqId + 1 == mSequences.size() ) {
-      mProgressCallback( ProgressType::StatsCollection, seqId + 1,
-                         mSequences.size() );
+  const size_t length = reverseComplement.Length();
+  reverseKmers->resize( kmers.size() );
+
+  size_t first = 0;
+  for( size_t pattern = 0; pattern < NumSeedPatterns(); pattern++ ) {
+    const size_t count = NumKmerFrames( length, pattern );
+
+    Kmer   tag        = 0;
+    size_t kmerLength = std::min( mKmerLength, length );
+    bool   derive     = true;
+    if( !mSeedPatterns.empty() ) {
+      const std::string& str = mSeedPatterns[ pattern ].String();
+
+      tag        = Kmer( pattern ) << ( BitMapPolicy< A >::NumBits * mKmerLength );
+      kmerLength = mKmerLength;
+      derive     = std::equal( str.begin(), str.end(), str.rbegin() );
+    }
+
+    Kmer* out = reverseKmers->data() + first;
+    if( derive ) {
+      // Frame i of the sequence is frame count - 1 - i of the reverse
+      // complement
+      for( size_t i = 0; i < count; i++ ) {
+        const Kmer kmer = kmers[ first + i ];
+        out[ count - 1 - i ] =
+          kmer == AmbiguousKmer
+            ? kmer
+            : ReverseComplementKmer< A >( kmer & ~tag, kmerLength ) | tag;
+      }
+    } else {
+      // Only asymmetric seed patterns get here
+      Kmers< A >( reverseComplement, mSeedPatterns[ pattern ] )
+        .ForEach( [&]( const Kmer kmer, const size_t pos ) {
+          out[ pos ] = kmer == AmbiguousKmer ? kmer : kmer | tag;
+        } );
+    }
+    first += count;
+  }
+}
+
+template < typename A >
+void Database< A >::SetCompressPostings( const bool compressPostings ) {
+  mCompressPostings = compressPostings;
+}
+
+template < typename A >
+void Database< A >::SetSparseIndex( const bool sparse ) {
+  mSparse = sparse;
+}
+
+template < typename A >
+void Database< A >::SetMinimizerWindow( const size_t window ) {
+  if( window < 1 )
+    throw std::invalid_argument( "Minimizer window must be at least 1" );
+  mMinimizerWindow = window;
+}
+
+template < typename A >
+void Database< A >::SetMaxKmerOccurrences( const size_t maxOccurrences ) {
+  mMaxKmerOccurrences = maxOccurrences;
+}
+
+template < typename A >
+template < typename Fn >
+void Database< A >::ForEachIndexedKmer( const Kmer* kmers, const size_t length,
+                                        const Fn& fn ) const {
+  size_t first = 0;
+  for( size_t pattern = 0; pattern < NumSeedPatterns(); pattern++ ) {
+    const size_t count = NumKmerFrames( length, pattern );
+    Minimizers::ForEach( kmers + first, count, mMinimizerWindow,
+                         [&]( const Kmer kmer, const size_t pos ) {
+                           fn( kmer, first + pos );
+                         } );
+    first += count;
+  }
+}
+
+template < typename A >
+template < typename Fn >
+void Database< A >::ForEachSequence( const ProgressType type,
+                                     const Fn&          fn ) const {
+  const size_t numThreads = mThreadRanges.size() - 1;
+
+  std::atomic< size_t > numProcessed( 0 );
+  auto                  work = [&]( const size_t thread ) {
+    std::vector< Kmer > scratch;
+    for( SequenceId seqId = mThreadRanges[ thread ];
+         seqId < mThreadRanges[ thread + 1 ]; seqId++ ) {
+      fn( seqId, scratch );
+      numProcessed++;
+
+      // Progress
+      if( numThreads == 1 && seqId % 512 == 0 ) {
+        mProgressCallback( type, seqId + 1, mSequences.size() );
+      }
+    }
+  };
+
+  if( numThreads == 1 ) {
+    work( 0 );
+  } else {
+    std::mutex              mutex;
+    std::condition_variable finished;
+    size_t                  numFinished = 0;
+
+    std::vector< std::thread > threads;
+    for( size_t thread = 0; thread < numThreads; thread++ ) {
+      threads.push_back( std::thread( [&, thread] {
+        work( thread );
+
+        std::unique_lock< std::mutex > lock( mutex );
+        numFinished++;
+        finished.notify_one();
+      } ) );
+    }
+
+    // The callback is only ever called from this thread
+    {
+      std::unique_lock< std::mutex > lock( mutex );
+      while( !finished.wait_for( lock, std::chrono::milliseconds( 100 ),
+                                 [&] { return numFinished == numThreads; } ) ) {
+        mProgressCallback( type, numProcessed, mSequences.size() );
+      }
+    }
+
+    for( auto& thread : threads ) {
+      thread.join();
     }
   }
 
+  mProgressCallback( type, mSequences.size(), mSequences.size() );
+}
+
+template < typename A >
+template < typename Fn >
+void Database< A >::ParallelFor( const size_t count, const Fn& fn ) const {
+  const size_t numThreads = mThreadRanges.size() - 1;
+  if( numThreads == 1 ) {
+    fn( 0, count );
+    return;
+  }
+
+  std::vector< std::thread > threads;
+  for( size_t thread = 0; thread < numThreads; thread++ ) {
+    threads.push_back( std::thread( fn, count * thread / numThreads,
+                                    count * ( thread + 1 ) / numThreads ) );
+  }
+  for( auto& thread : threads ) {
+    thread.join();
+  }
+}
+
+template < typename A >
+void Database< A >::Initialize( SequenceList< A > sequences ) {
+  mSequences = std::move( sequences );
+  mMapping.reset();
+
+  const size_t numSequences = mSequences.size();
+
+  // Split the sequences into ranges of about equal total length, with
+  // at least minResiduesPerThread per thread
+  const size_t minResiduesPerThread = 1 << 20;
+
+  size_t totalLength = 0;
+  mSequenceLengths.clear();
+  for( auto& seq : mSequences ) {
+    totalLength += seq.Length();
+    mSequenceLengths.push_back( seq.Length() );
+  }
+
+  size_t numThreads =
+    std::max( size_t( 1 ), std::min( mNumThreads, totalLength / minResiduesPerThread ) );
+
+  mThreadRanges = { 0 };
+  size_t length = 0;
+  for( SequenceId seqId = 0; seqId < numSequences; seqId++ ) {
+    length += mSequences[ seqId ].Length();
+    if( length * numThreads >= totalLength * mThreadRanges.size() &&
+        mThreadRanges.size() < numThreads ) {
+      mThreadRanges.push_back( seqId + 1 );
+    }
+  }
+  mThreadRanges.push_back( numSequences );
+  numThreads = mThreadRanges.size() - 1;
+
+  // Sorted distinct indexed kmers of a sequence, without ambiguous ones
+  auto uniqueKmers = [&]( const size_t length, std::vector< Kmer >& kmers ) {
+    if( mMinimizerWindow > 1 ) {
+      std::vector< Kmer > minimizers;
+      ForEachIndexedKmer( kmers.data(), length,
+                          [&]( const Kmer kmer, const size_t pos ) {
+                            minimizers.push_back( kmer );
+                          } );
+      kmers.swap( minimizers );
+    }
+
+    std::sort( kmers.begin(), kmers.end() );
+    kmers.erase( std::unique( kmers.begin(), kmers.end() ), kmers.end() );
+    if( !kmers.empty() && kmers.back() == AmbiguousKmer )
+      kmers.pop_back();
+  };
+
+  if( !mSparse && KmerBits() > MaxDenseKmerBits )
+    throw std::invalid_argument( "Word size " + std::to_string( mKmerLength ) +
+                                 " is too long for a dense kmer table" );
+
+  // Count kmers per sequence, and for the dense table sequences per kmer
+  const size_t numDenseSlots = mSparse ? 0 : size_t( 1 ) << KmerBits();
+
+  std::vector< size_t > kmerCountBySequenceId( numSequences );
+  std::unique_ptr< std::atomic< SequenceId >[] > sequenceCountByKmer(
+    new std::atomic< SequenceId >[ numDenseSlots ]() );
+
+  ForEachSequence( ProgressType::StatsCollection,
+                   [&]( const SequenceId seqId, std::vector< Kmer >& kmers ) {
+    const size_t length = mSequences[ seqId ].Length();
+
+    kmerCountBySequenceId[ seqId ] = 0;
+    for( size_t pattern = 0; pattern < NumSeedPatterns(); pattern++ ) {
+      kmerCountBySequenceId[ seqId ] += NumKmerFrames( length, pattern );
+    }
+    if( mSparse )
+      return;
+
+    kmers.clear();
+    ForEachKmer( mSequences[ seqId ], [&]( const Kmer kmer, const size_t pos ) {
+      kmers.push_back( kmer );
+    } );
+
+    uniqueKmers( length, kmers );
+    for( auto& kmer : kmers ) {
+      sequenceCountByKmer[ kmer ].fetch_add( 1, std::memory_order_relaxed );
+    }
+  } );
+
   // Calculate indices
-  mSequenceIdsOffsetByKmer.resize( mMaxUniqueKmers );
-  for( size_t i = 0; i < mMaxUniqueKmers; i++ ) {
-    mSequenceIdsOffsetByKmer[ i ] =
-      i > 0 ? mSequenceIdsOffsetByKmer[ i - 1 ] + uniqueCount[ i - 1 ] : 0;
+  std::vector< uint64_t > kmerOffsetBySequenceId( numSequences + 1 );
+  size_t                  totalEntries = 0;
+  for( SequenceId seqId = 0; seqId < numSequences; seqId++ ) {
+    kmerOffsetBySequenceId[ seqId ] = totalEntries;
+    totalEntries += kmerCountBySequenceId[ seqId ];
   }
+  kmerOffsetBySequenceId[ numSequences ] = totalEntries;
+
+  // Posting offsets are 32 bit as long as the postings (and the bytes of
+  // their varints) are sure to fit, so that a dense table takes 8 bytes
+  // per slot while it is built, see DenseTableMemory
+  auto indexPostings = [&]( auto zero ) {
+    using Offset = decltype( zero );
 
-  // Populate DB
-  mSequenceIds.resize( totalUniqueEntries );
-  mKmers.resize( totalEntries );
+    // Masked kmers get empty posting lists
+    auto isMasked = [&]( const size_t numSequenceIds ) {
+      return mMaxKmerOccurrences > 0 && numSequenceIds > mMaxKmerOccurrences;
+    };
+    size_t numMaskedKmers = 0, numMaskedPostings = 0;
 
-  // Reset to 0
-  mSequenceIdsCountByKmer = std::vector< size_t >( mMaxUniqueKmers );
-  mKmerCountBySequenceId  = std::vector< size_t >( mSequences.size() );
-  mKmerOffsetBySequenceId = std::vector< size_t >( mSequences.size() );
+    std::vector< Offset > sequenceIdsOffsetByKmer( numDenseSlots + 1 );
+    size_t                totalUniqueEntries = 0;
+    for( size_t kmer = 0; kmer < numDenseSlots; kmer++ ) {
+      size_t count = sequenceCountByKmer[ kmer ];
+      if( isMasked( count ) ) {
+        numMaskedKmers++;
+        numMaskedPostings += count;
+        count = 0;
+      }
 
-  uniqueIndex = std::vector< SequenceId >( mMaxUniqueKmers, -1 );
+      sequenceIdsOffsetByKmer[ kmer ] = totalUniqueEntries;
+      totalUniqueEntries += count;
+      sequenceCountByKmer[ kmer ] = 0; // reused as fill position
+    }
+    sequenceIdsOffsetByKmer[ numDenseSlots ] = totalUniqueEntries;
 
-  auto   kmersData = mKmers.data();
-  size_t kmerCount = 0;
+    // Populate DB. Every sequence saves _every_ kmer, which encodes
+    // the position implicitly. The sparse index collects ( kmer, seqId )
+    // pairs per thread instead of placing them right away.
+    using KmerPosting = std::pair< Kmer, SequenceId >;
 
-  for( SequenceId seqId = 0; seqId < mSequences.size(); seqId++ ) {
-    const Sequence< A >& seq = mSequences[ seqId ];
+    std::vector< SequenceId >                  sequenceIds( totalUniqueEntries );
+    std::vector< std::vector< KmerPosting > > postingsByThread( numThreads );
 
-    mKmerOffsetBySequenceId[ seqId ] = kmerCount;
+    // The kmers of every sequence, 32 bit if they fit
+    const bool              narrowKmers = KmerArray::FitsNarrow( KmerBits() );
+    std::vector< uint32_t > narrowKmersList( narrowKmers ? totalEntries : 0 );
+    std::vector< Kmer >     wideKmersList( narrowKmers ? 0 : totalEntries );
 
-    Kmers< A > kmers( seq, mKmerLength );
-    kmers.ForEach( [&]( const Kmer kmer, const size_t pos ) {
-      // Encode position in kmersData implicitly
-      // by saving _every_ kmer
-      kmersData[ kmerCount++ ] = kmer;
+    ForEachSequence( ProgressType::Indexing,
+                     [&]( const SequenceId seqId, std::vector< Kmer >& kmers ) {
+      const size_t offset = kmerOffsetBySequenceId[ seqId ];
+      kmers.resize( kmerCountBySequenceId[ seqId ] );
+      ForEachKmer( mSequences[ seqId ], [&]( const Kmer kmer, const size_t pos ) {
+        kmers[ pos ] = kmer;
+        if( narrowKmers ) {
+          narrowKmersList[ offset + pos ] = KmerArray::ToNarrow( kmer );
+        } else {
+          wideKmersList[ offset + pos ] = kmer;
+        }
+      } );
 
-      if( kmer == AmbiguousKmer || uniqueIndex[ kmer ] == seqId )
+      uniqueKmers( mSequences[ seqId ].Length(), kmers );
+
+      if( mSparse ) {
+        size_t thread = std::upper_bound( mThreadRanges.begin(),
+                                          mThreadRanges.end(), seqId ) -
+                        mThreadRanges.begin() - 1;
+        for( auto& kmer : kmers ) {
+          postingsByThread[ thread ].emplace_back( kmer, seqId );
+        }
         return;
+      }
+
+      for( auto& kmer : kmers ) {
+        if( sequenceIdsOffsetByKmer[ kmer ] == sequenceIdsOffsetByKmer[ kmer + 1 ] )
+          continue; // masked
+
+        size_t pos =
+          sequenceCountByKmer[ kmer ].fetch_add( 1, std::memory_order_relaxed );
+        sequenceIds[ sequenceIdsOffsetByKmer[ kmer ] + pos ] = seqId;
+      }
+    } );
+    sequenceCountByKmer.reset();
+
+    std::vector< Kmer > indexedKmers;
+    if( mSparse ) {
+      // Sort the pairs of every thread, then merge them. Threads cover
+      // ascending sequence ranges, so the ids of a kmer stay ascending.
+      ParallelFor( numThreads, [&]( const size_t from, const size_t to ) {
+        for( size_t thread = from; thread < to; thread++ ) {
+          std::sort( postingsByThread[ thread ].begin(),
+                     postingsByThread[ thread ].end() );
+        }
+      } );
+
+      std::vector< KmerPosting > postings = std::move( postingsByThread[ 0 ] );
+      for( size_t thread = 1; thread < numThreads; thread++ ) {
+        size_t middle = postings.size();
+        postings.insert( postings.end(), postingsByThread[ thread ].begin(),
+                         postingsByThread[ thread ].end() );
+        postingsByThread[ thread ] = std::vector< KmerPosting >();
+        std::inplace_merge( postings.begin(), postings.begin() + middle,
+                            postings.end() );
+      }
+
+      // Masked kmers are left out altogether
+      sequenceIdsOffsetByKmer.clear();
+      sequenceIds.resize( postings.size() );
+      totalUniqueEntries = 0;
+      for( size_t i = 0, end; i < postings.size(); i = end ) {
+        end = i + 1;
+        while( end < postings.size() && postings[ end ].first == postings[ i ].first ) {
+          end++;
+        }
+        if( isMasked( end - i ) ) {
+          numMaskedKmers++;
+          numMaskedPostings += end - i;
+          continue;
+        }
+
+        indexedKmers.push_back( postings[ i ].first );
+        sequenceIdsOffsetByKmer.push_back( totalUniqueEntries );
+        for( size_t j = i; j < end; j++ ) {
+          sequenceIds[ totalUniqueEntries++ ] = postings[ j ].second;
+        }
+      }
+      sequenceIdsOffsetByKmer.push_back( totalUniqueEntries );
+      sequenceIds.resize( totalUniqueEntries );
+    } else if( numThreads > 1 ) {
+      // Threads fill the postings of a kmer in any order; sort them so that
+      // the index is the same as when built by a single thread
+      ParallelFor( numDenseSlots, [&]( const size_t from, const size_t to ) {
+        for( size_t kmer = from; kmer < to; kmer++ ) {
+          std::sort( sequenceIds.begin() + sequenceIdsOffsetByKmer[ kmer ],
+                     sequenceIds.begin() + sequenceIdsOffsetByKmer[ kmer + 1 ] );
+        }
+      } );
+    }
 
-      uniqueIndex[ kmer ] = seqId;
+    mNumKmerSlots = mSparse ? indexedKmers.size() : numDenseSlots;
+    mNumPostings  = totalUniqueEntries;
+    mNumMaskedKmers    = numMaskedKmers;
+    mNumMaskedPostings = numMaskedPostings;
+    mKmerOffsetBySequenceId.Assign( std::move( kmerOffsetBySequenceId ) );
+    if( narrowKmers ) {
+      mKmers.Assign( std::move( narrowKmersList ) );
+    } else {
+      mKmers.Assign( std::move( wideKmersList ) );
+    }
+    SetIndexedKmers( std::move( indexedKmers ) );
+
+    if( !mCompressPostings ) {
+      mSequenceIdsOffsetByKmer.Assign( std::move( sequenceIdsOffsetByKmer ) );
+      mSequenceIds.Assign( std::move( sequenceIds ) );
+      mCompressedSequenceIds.Clear();
+      return;
+    }
 
-      mSequenceIds[ mSequenceIdsOffsetByKmer[ kmer ] +
-                    mSequenceIdsCountByKmer[ kmer ] ] = seqId;
-      mSequenceIdsCountByKmer[ kmer ]++;
+    // Delta encode the (ascending) posting lists: the first id as is,
+    // then the differences to the previous id
+    auto forEachDelta = [&]( const size_t slot, const auto& fn ) {
+      SequenceId previous = 0;
+      for( size_t i = sequenceIdsOffsetByKmer[ slot ];
+           i < sequenceIdsOffsetByKmer[ slot + 1 ]; i++ ) {
+        fn( sequenceIds[ i ] - previous );
+        previous = sequenceIds[ i ];
+      }
+    };
+
+    std::vector< Offset > byteOffsetBySlot( mNumKmerSlots + 1 );
+    ParallelFor( mNumKmerSlots, [&]( const size_t from, const size_t to ) {
+      for( size_t slot = from; slot < to; slot++ ) {
+        size_t size = 0;
+        forEachDelta( slot, [&]( const SequenceId delta ) {
+          size += Varint::EncodedSize( delta );
+        } );
+        byteOffsetBySlot[ slot + 1 ] = size;
+      }
     } );
+    for( size_t slot = 0; slot < mNumKmerSlots; slot++ ) {
+      byteOffsetBySlot[ slot + 1 ] += byteOffsetBySlot[ slot ];
+    }
+
+    std::vector< uint8_t > compressed( byteOffsetBySlot[ mNumKmerSlots ] );
+    ParallelFor( mNumKmerSlots, [&]( const size_t from, const size_t to ) {
+      for( size_t slot = from; slot < to; slot++ ) {
+        uint8_t* out = &compressed[ byteOffsetBySlot[ slot ] ];
+        forEachDelta( slot, [&]( const SequenceId delta ) {
+          out = Varint::Encode( delta, out );
+        } );
+      }
+    } );
+
+    mSequenceIdsOffsetByKmer.Assign( std::move( byteOffsetBySlot ) );
+    mCompressedSequenceIds.Assign( std::move( compressed ) );
+    mSequenceIds.Clear();
+  };
+
+  if( NarrowOffsets( totalEntries, mCompressPostings ) ) {
+    indexPostings( uint32_t( 0 ) );
+  } else {
+    indexPostings( uint64_t( 0 ) );
+  }
+}
+
+template < typename A >
+void Database< A >::SetIndexedKmers( std::vector< Kmer >&& indexedKmers ) {
+  if( !mSparse ) {
+    mIndexedKmers.Clear();
+    mKmerDirectory.Clear();
+    return;
+  }
+
+  // Directory of the sorted kmers by their top bits, with about four
+  // kmers per bucket, which narrows every lookup down to a few kmers
+  const size_t kmerBits      = KmerBits();
+  size_t       directoryBits = 1;
+  while( directoryBits < kmerBits && directoryBits < MaxDirectoryBits &&
+         ( size_t( 1 ) << ( directoryBits + 2 ) ) < indexedKmers.size() ) {
+    directoryBits++;
+  }
+
+  const size_t numBuckets = size_t( 1 ) << directoryBits;
+  const size_t shift      = kmerBits - directoryBits;
+
+  std::vector< uint64_t > directory( numBuckets + 1 );
+  size_t                  index = 0;
+  for( size_t bucket = 0; bucket <= numBuckets; bucket++ ) {
+    while( index < indexedKmers.size() &&
+           ( indexedKmers[ index ] >> shift ) < bucket ) {
+      index++;
+    }
+    directory[ bucket ] = index;
+  }
 
-    mKmerCountBySequenceId[ seqId ] =
-      kmerCount - mKmerOffsetBySequenceId[ seqId ];
+  mKmerDirectoryShift = shift;
+  mKmerDirectory.Assign( std::move( directory ) );
+  mIndexedKmers.Assign( std::move( indexedKmers ) );
+}
 
-    // Progress
-    if( seqId % 512 == 0 || seqId + 1 == mSequences.size() ) {
-      mProgressCallback( ProgressType::Indexing, seqId + 1, mSequences.size() );
+template < typename A >
+void Database< A >::Save( const std::string& path ) const {
+  uint32_t flags = ( mCompressPostings ? IndexFile::CompressedPostings : 0 ) |
+                   ( mSparse ? IndexFile::SparseIndex : 0 );
+  size_t directoryBits = 0;
+  while( mSparse && ( size_t( 1 ) << directoryBits ) + 1 < mKmerDirectory.Size() ) {
+    directoryBits++;
+  }
+
+  IndexFile::Writer writer( path, A::Name(), mKmerLength, NumSequences(),
+                            mNumPostings, flags, directoryBits );
+
+  // Offsets are written as stored, the reader tells the width from
+  // the section size
+  auto addOffsets = [&]( const OffsetArray& offsets ) {
+    if( offsets.IsWide() ) {
+      writer.AddSection( offsets.Wide().Data(), offsets.Wide().Size() );
+    } else {
+      writer.AddSection( offsets.Narrow().Data(), offsets.Narrow().Size() );
     }
+  };
+
+  addOffsets( mSequenceIdsOffsetByKmer );
+  if( mCompressPostings ) {
+    writer.AddSection( mCompressedSequenceIds.Data(), mCompressedSequenceIds.Size() );
+  } else {
+    writer.AddSection( mSequenceIds.Data(), mSequenceIds.Size() );
+  }
+  addOffsets( mKmerOffsetBySequenceId );
+  if( mKmers.IsWide() ) {
+    writer.AddSection( mKmers.Wide().Data(), mKmers.Wide().Size() );
+  } else {
+    writer.AddSection( mKmers.Narrow().Data(), mKmers.Narrow().Size() );
   }
+  writer.AddSection( mIndexedKmers.Data(), mIndexedKmers.Size() );
+  addOffsets( mKmerDirectory );
+
+  std::vector< uint64_t > textOffsets;
+  std::string             text;
+  for( auto& seq : mSequences ) {
+    textOffsets.push_back( text.size() );
+    text += seq.identifier;
+    textOffsets.push_back( text.size() );
+    text += seq.sequence;
+  }
+  textOffsets.push_back( text.size() );
+
+  writer.AddSection( textOffsets.data(), textOffsets.size() );
+  writer.AddSection( text.data(), text.size() );
+
+  std::string patterns;
+  for( auto& pattern : mSeedPatterns ) {
+    patterns += ( patterns.empty() ? "" : "," ) + pattern.String();
+  }
+  writer.AddSection( patterns.data(), patterns.size() );
+
+  const uint64_t minimizerWindow = mMinimizerWindow;
+  writer.AddSection( &minimizerWindow, 1 );
+
+  const uint64_t masking[] = { mMaxKmerOccurrences, mNumMaskedKmers,
+                               mNumMaskedPostings };
+  writer.AddSection( masking, 3 );
+  writer.Close();
+}
+
+template < typename A >
+void Database< A >::Load( const std::string& path, const bool useMmap,
+                          const bool verifyChecksum ) {
+  IndexFile::Reader reader( path, useMmap );
+
+  const auto& header = reader.GetHeader();
+  if( std::string( header.alphabet ) != A::Name() )
+    throw std::runtime_error( "Index file " + path + " holds a " +
+                              header.alphabet + " database" );
+  if( header.kmerLength < 1 || header.kmerLength > MaxKmerLength() )
+    throw std::runtime_error( "Corrupt index file: " + path );
+  if( verifyChecksum && !reader.VerifyChecksum() )
+    throw std::runtime_error( "Checksum mismatch in index file " + path );
+
+  // Indices written without seed patterns use contiguous kmers
+  std::vector< SeedPattern > seedPatterns;
+  if( header.numSections > IndexSection::SeedPatternsSection ) {
+    size_t      size;
+    const char* data = reader.template SectionData< char >(
+      IndexSection::SeedPatternsSection, &size );
+
+    try {
+      std::string patterns( data, size );
+      for( size_t pos = 0; pos < size; ) {
+        size_t end = std::min( patterns.find( ',', pos ), size );
+        seedPatterns.push_back( SeedPattern( patterns.substr( pos, end - pos ) ) );
+        pos = end + 1;
+      }
+    } catch( const std::invalid_argument& ) {
+      throw std::runtime_error( "Corrupt index file: " + path );
+    }
+
+    for( auto& pattern : seedPatterns ) {
+      if( pattern.Weight() != header.kmerLength ||
+          pattern.Span() * BitMapPolicy< A >::NumBits > sizeof( Kmer ) * 8 )
+        throw std::runtime_error( "Corrupt index file: " + path );
+    }
+  }
+  mSeedPatterns = std::move( seedPatterns );
+  mKmerLength   = header.kmerLength;
+
+  mMinimizerWindow = 1;
+  if( header.numSections > IndexSection::MinimizerWindowSection ) {
+    size_t          count;
+    const uint64_t* window = reader.template SectionData< uint64_t >(
+      IndexSection::MinimizerWindowSection, &count );
+    if( count != 1 || *window < 1 )
+      throw std::runtime_error( "Corrupt index file: " + path );
+    mMinimizerWindow = *window;
+  }
+
+  mMaxKmerOccurrences = mNumMaskedKmers = mNumMaskedPostings = 0;
+  if( header.numSections > IndexSection::MaskingSection ) {
+    size_t          count;
+    const uint64_t* masking = reader.template SectionData< uint64_t >(
+      IndexSection::MaskingSection, &count );
+    if( count != 3 )
+      throw std::runtime_error( "Corrupt index file: " + path );
+    mMaxKmerOccurrences = masking[ 0 ];
+    mNumMaskedKmers     = masking[ 1 ];
+    mNumMaskedPostings  = masking[ 2 ];
+  }
+
+  size_t numSequences = header.numSequences;
+  const size_t kmerBits = KmerBits();
+  const bool   sparse   = header.flags & IndexFile::SparseIndex;
+  if( kmerBits >= sizeof( Kmer ) * 8 || ( !sparse && kmerBits > MaxDenseKmerBits ) )
+    throw std::runtime_error( "Corrupt index file: " + path );
+
+  // Use arrays in place when mapped, copy them otherwise
+  auto load = [&]( const size_t section, const size_t expectedCount,
+                   auto& array ) {
+    using T = typename std::remove_const< typename std::remove_pointer<
+      decltype( array.Data() ) >::type >::type;
+
+    size_t   count;
+    const T* data = reader.template SectionData< T >( section, &count );
+    if( expectedCount != ( size_t ) -1 && count != expectedCount )
+      throw std::runtime_error( "Corrupt index file: " + path );
+
+    if( reader.IsMapped() ) {
+      array.Borrow( data, count );
+    } else {
+      array.Assign( std::vector< T >( data, data + count ) );
+    }
+  };
+
+  // 32 bit kmers if they fit, see KmerArray
+  auto loadKmers = [&]( const size_t section ) {
+    if( KmerArray::FitsNarrow( kmerBits ) ) {
+      size_t          count;
+      const uint32_t* data =
+        reader.template SectionData< uint32_t >( section, &count );
+      if( reader.IsMapped() ) {
+        mKmers.Borrow( data, count );
+      } else {
+        mKmers.Assign( std::vector< uint32_t >( data, data + count ) );
+      }
+    } else {
+      size_t          count;
+      const uint64_t* data =
+        reader.template SectionData< uint64_t >( section, &count );
+      if( reader.IsMapped() ) {
+        mKmers.Borrow( data, count );
+      } else {
+        mKmers.Assign( std::vector< uint64_t >( data, data + count ) );
+      }
+    }
+  };
+
+  // 32 or 64 bit offsets, ascending up to the size of the array they
+  // point into
+  auto loadOffsets = [&]( const size_t section, const size_t expectedCount,
+                          const size_t arraySize, OffsetArray& offsets ) {
+    size_t size;
+    reader.template SectionData< uint8_t >( section, &size );
+
+    size_t count;
+    if( size == expectedCount * sizeof( uint32_t ) ) {
+      const uint32_t* data =
+        reader.template SectionData< uint32_t >( section, &count );
+      if( reader.IsMapped() ) {
+        offsets.Borrow( data, count );
+      } else {
+        offsets.Assign( std::vector< uint32_t >( data, data + count ) );
+      }
+    } else if( size == expectedCount * sizeof( uint64_t ) ) {
+      const uint64_t* data =
+        reader.template SectionData< uint64_t >( section, &count );
+      if( reader.IsMapped() ) {
+        offsets.Borrow( data, count );
+      } else {
+        offsets.Assign( std::vector< uint64_t >( data, data + count ) );
+      }
+    } else {
+      throw std::runtime_error( "Corrupt index file: " + path );
+    }
+
+    for( size_t i = 1; i < count; i++ ) {
+      if( offsets[ i - 1 ] > offsets[ i ] )
+        throw std::runtime_error( "Corrupt index file: " + path );
+    }
+    if( offsets[ 0 ] != 0 || offsets[ count - 1 ] != arraySize )
+      throw std::runtime_error( "Corrupt index file: " + path );
+  };
+
+  mCompressPostings = header.flags & IndexFile::CompressedPostings;
+  if( mCompressPostings ) {
+    mSequenceIds.Clear();
+    load( IndexSection::SequenceIdsSection, -1, mCompressedSequenceIds );
+  } else {
+    mCompressedSequenceIds.Clear();
+    load( IndexSection::SequenceIdsSection, header.numPostings, mSequenceIds );
+  }
+  loadKmers( IndexSection::KmersSection );
+
+  size_t numKmerSlots = size_t( 1 ) << ( sparse ? 0 : kmerBits );
+  if( sparse ) {
+    const size_t directoryBits = header.kmerDirectoryBits;
+    if( directoryBits < 1 || directoryBits > kmerBits ||
+        directoryBits > MaxDirectoryBits )
+      throw std::runtime_error( "Corrupt index file: " + path );
+
+    load( IndexSection::IndexedKmersSection, -1, mIndexedKmers );
+    numKmerSlots = mIndexedKmers.Size();
+    loadOffsets( IndexSection::KmerDirectorySection,
+                 ( size_t( 1 ) << directoryBits ) + 1, numKmerSlots,
+                 mKmerDirectory );
+    mKmerDirectoryShift = kmerBits - directoryBits;
+  } else {
+    mIndexedKmers.Clear();
+    mKmerDirectory.Clear();
+  }
+
+  loadOffsets( IndexSection::SequenceIdsOffsetByKmerSection, numKmerSlots + 1,
+               mCompressPostings ? mCompressedSequenceIds.Size() : mSequenceIds.Size(),
+               mSequenceIdsOffsetByKmer );
+  loadOffsets( IndexSection::KmerOffsetBySequenceIdSection, numSequences + 1,
+               mKmers.Size(), mKmerOffsetBySequenceId );
+
+  // Sequences are always copied
+  size_t          numTextOffsets, textSize;
+  const uint64_t* textOffsets = reader.template SectionData< uint64_t >(
+    IndexSection::SequenceTextOffsetsSection, &numTextOffsets );
+  const char* text =
+    reader.template SectionData< char >( IndexSection::SequenceTextSection, &textSize );
+  if( numTextOffsets != 2 * numSequences + 1 ||
+      textOffsets[ numTextOffsets - 1 ] != textSize )
+    throw std::runtime_error( "Corrupt index file: " + path );
+
+  mSequences.clear();
+  mSequenceLengths.clear();
+  for( size_t i = 0; i < numSequences; i++ ) {
+    const uint64_t* offsets = &textOffsets[ 2 * i ];
+    if( offsets[ 0 ] > offsets[ 1 ] || offsets[ 1 ] > offsets[ 2 ] )
+      throw std::runtime_error( "Corrupt index file: " + path );
+
+    mSequences.push_back( Sequence< A >(
+      std::string( text + offsets[ 0 ], offsets[ 1 ] - offsets[ 0 ] ),
+      std::string( text + offsets[ 1 ], offsets[ 2 ] - offsets[ 1 ] ) ) );
+    mSequenceLengths.push_back( mSequences.back().Length() );
+  }
+
+  // Searches trust the arrays, so check what they index with or use as
+  // lengths: the kmer count of every sequence, the sparse kmers and the
+  // sequence ids of the postings. This reads the whole index once.
+  for( size_t i = 0; i < numSequences; i++ ) {
+    size_t numKmers = 0;
+    for( size_t pattern = 0; pattern < NumSeedPatterns(); pattern++ ) {
+      numKmers += NumKmerFrames( mSequences[ i ].Length(), pattern );
+    }
+    if( mKmerOffsetBySequenceId[ i + 1 ] - mKmerOffsetBySequenceId[ i ] !=
+        numKmers )
+      throw std::runtime_error( "Corrupt index file: " + path );
+  }
+
+  if( sparse ) {
+    // Ascending, and each in the directory bucket of its high bits
+    for( size_t bucket = 0; bucket + 1 < mKmerDirectory.Size(); bucket++ ) {
+      for( size_t i = mKmerDirectory[ bucket ];
+           i < mKmerDirectory[ bucket + 1 ]; i++ ) {
+        const Kmer kmer = mIndexedKmers[ i ];
+        if( kmer >> mKmerDirectoryShift != bucket ||
+            ( i > 0 && mIndexedKmers[ i - 1 ] >= kmer ) )
+          throw std::runtime_error( "Corrupt index file: " + path );
+      }
+    }
+  }
+
+  if( !mCompressPostings ) {
+    for( size_t i = 0; i < mSequenceIds.Size(); i++ ) {
+      if( mSequenceIds[ i ] >= numSequences )
+        throw std::runtime_error( "Corrupt index file: " + path );
+    }
+  } else {
+    // Every list decodes to ascending ids, its last varint ending where
+    // the list does
+    for( size_t slot = 0; slot < numKmerSlots; slot++ ) {
+      const uint8_t* in   = mCompressedSequenceIds.Data() +
+                          mSequenceIdsOffsetByKmer[ slot ];
+      const uint8_t* last = mCompressedSequenceIds.Data() +
+                            mSequenceIdsOffsetByKmer[ slot + 1 ];
+      uint64_t seqId = 0;
+      for( bool first = true; in < last; first = false ) {
+        const uint8_t* end = in;
+        while( end < last && end - in < 5 && ( *end & 0x80 ) ) {
+          end++;
+        }
+        if( end == last || end - in == 5 )
+          throw std::runtime_error( "Corrupt index file: " + path );
+
+        uint32_t delta;
+        in = Varint::Decode( in, &delta );
+        seqId += delta;
+        if( ( !first && delta == 0 ) || seqId >= numSequences )
+          throw std::runtime_error( "Corrupt index file: " + path );
+      }
+    }
+  }
+
+  mSparse       = sparse;
+  mNumKmerSlots = numKmerSlots;
+  mNumPostings  = header.numPostings;
+  mMapping        = reader.Mapping();
 }
 
 template < typename A >
@@ -165,14 +1218,20 @@ Database< A >::GetSequenceById( const SequenceId& seqId ) const {
   return mSequences[ seqId ];
 }
 
+template < typename A >
+size_t Database< A >::SequenceLength( const SequenceId& seqId ) const {
+  assert( seqId < NumSequences() );
+  return mSequenceLengths[ seqId ];
+}
+
 template < typename A >
 size_t Database< A >::NumSequences() const {
   return mSequences.size();
 }
 
 template < typename A >
-size_t Database< A >::MaxUniqueKmers() const {
-  return mMaxUniqueKmers;
+size_t Database< A >::NumKmerSlots() const {
+  return mNumKmerSlots;
 }
 
 template < typename A >
@@ -181,34 +1240,146 @@ size_t Database< A >::KmerLength() const {
 }
 
 template < typename A >
-bool Database< A >::GetKmersForSequenceId( const SequenceId& seqId,
-                                           const Kmer**      kmers,
-                                           size_t*           numKmers ) const {
+bool Database< A >::CompressedPostings() const {
+  return mCompressPostings;
+}
+
+template < typename A >
+bool Database< A >::IsSparse() const {
+  return mSparse;
+}
+
+template < typename A >
+size_t Database< A >::MinimizerWindow() const {
+  return mMinimizerWindow;
+}
+
+template < typename A >
+size_t Database< A >::MaxKmerOccurrences() const {
+  return mMaxKmerOccurrences;
+}
+
+template < typename A >
+size_t Database< A >::NumMaskedKmers() const {
+  return mNumMaskedKmers;
+}
+
+template < typename A >
+size_t Database< A >::NumMaskedPostings() const {
+  return mNumMaskedPostings;
+}
+
+template < typename A >
+size_t Database< A >::NumPostings() const {
+  return mNumPostings;
+}
+
+template < typename A >
+size_t Database< A >::NumUsedKmers() const {
+  size_t numUsed = 0;
+  for( size_t slot = 0; slot < mNumKmerSlots; slot++ ) {
+    numUsed += mSequenceIdsOffsetByKmer[ slot + 1 ] > mSequenceIdsOffsetByKmer[ slot ];
+  }
+  return numUsed;
+}
+
+template < typename A >
+typename Database< A >::MemoryUsage Database< A >::IndexMemoryUsage() const {
+  MemoryUsage usage;
+  usage.offsets =
+    mSequenceIdsOffsetByKmer.SizeInBytes() + mKmerOffsetBySequenceId.SizeInBytes();
+  usage.postings = mCompressPostings ? mCompressedSequenceIds.SizeInBytes()
+                                     : mSequenceIds.SizeInBytes();
+  usage.kmers       = mKmers.SizeInBytes();
+  usage.sparseKmers = mIndexedKmers.SizeInBytes() + mKmerDirectory.SizeInBytes();
+
+  usage.legacyOffsets  = 2 * ( mNumKmerSlots + NumSequences() ) * sizeof( size_t );
+  usage.legacyPostings = mNumPostings * sizeof( SequenceId );
+  usage.legacyKmers    = mKmers.Size() * sizeof( uint32_t );
+  return usage;
+}
+
+template < typename A >
+bool Database< A >::GetKmersForSequenceId( const SequenceId&    seqId,
+                                           const Kmer**         kmers,
+                                           size_t*              numKmers,
+                                           std::vector< Kmer >* buffer ) const {
   if( seqId >= NumSequences() )
     return false;
 
-  const auto& offset = mKmerOffsetBySequenceId[ seqId ];
-  const auto& count  = mKmerCountBySequenceId[ seqId ];
+  const size_t offset = mKmerOffsetBySequenceId[ seqId ];
+  const size_t count  = mKmerOffsetBySequenceId[ seqId + 1 ] - offset;
 
-  *kmers    = &mKmers[ offset ];
+  *kmers    = mKmers.Range( offset, count, buffer );
   *numKmers = count;
   return count > 0;
 }
 
 template < typename A >
-bool Database< A >::GetSequenceIdsIncludingKmer( const Kmer&        kmer,
-                                                 const SequenceId** seqIds,
-                                                 size_t* numSeqIds ) const {
+bool Database< A >::FindKmerSlot( const Kmer& kmer, size_t* slot ) const {
   if( kmer == AmbiguousKmer )
     return false;
 
-  if( kmer >= MaxUniqueKmers() )
+  if( !mSparse ) {
+    if( kmer >= mNumKmerSlots )
+      return false;
+
+    *slot = kmer;
+    return true;
+  }
+
+  const size_t bucket = kmer >> mKmerDirectoryShift;
+  const Kmer*  first  = mIndexedKmers.Data() + mKmerDirectory[ bucket ];
+  const Kmer*  last   = mIndexedKmers.Data() + mKmerDirectory[ bucket + 1 ];
+
+  const Kmer* it = std::lower_bound( first, last, kmer );
+  if( it == last || *it != kmer )
     return false;
 
-  const auto& offset = mSequenceIdsOffsetByKmer[ kmer ];
-  const auto& count  = mSequenceIdsCountByKmer[ kmer ];
+  *slot = it - mIndexedKmers.Data();
+  return true;
+}
 
-  *seqIds    = &mSequenceIds[ offset ];
-  *numSeqIds = count;
-  return count > 0;
+template < typename A >
+bool Database< A >::GetSequenceIdsIncludingKmer(
+  const Kmer& kmer, const SequenceId** seqIds, size_t* numSeqIds,
+  std::vector< SequenceId >* buffer ) const {
+  size_t slot;
+  if( !FindKmerSlot( kmer, &slot ) )
+    return false;
+
+  return GetSequenceIdsInSlot( slot, seqIds, numSeqIds, buffer );
+}
+
+template < typename A >
+bool Database< A >::GetSequenceIdsInSlot(
+  const size_t slot, const SequenceId** seqIds, size_t* numSeqIds,
+  std::vector< SequenceId >* buffer ) const {
+  assert( slot < mNumKmerSlots );
+
+  const size_t offset = mSequenceIdsOffsetByKmer[ slot ];
+  const size_t end    = mSequenceIdsOffsetByKmer[ slot + 1 ];
+
+  if( !mCompressPostings ) {
+    *seqIds    = mSequenceIds.Data() + offset;
+    *numSeqIds = end - offset;
+    return end > offset;
+  }
+
+  assert( buffer );
+  buffer->clear();
+
+  const uint8_t* in    = mCompressedSequenceIds.Data() + offset;
+  const uint8_t* last  = mCompressedSequenceIds.Data() + end;
+  SequenceId     seqId = 0;
+  while( in < last ) {
+    uint32_t delta;
+    in = Varint::Decode( in, &delta );
+    seqId += delta;
+    buffer->push_back( seqId );
+  }
+
+  *seqIds    = buffer->data();
+  *numSeqIds = buffer->size();
+  return !buffer->empty();
 }
@@ -4,14 +4,27 @@
 
 #include "../Alignment/BandedAlign.h"
 #include "../Alignment/Common.h"
+#include "../Alignment/EditDistance.h"
 #include "../Alignment/ExtendAlign.h"
 #include "../Database.h"
 
+#include <cmath>
+#include <limits>
 #include <set>
-#include <cstring>
 
 using Counter = unsigned short;
 
+// Whether SearchParams ask for the edit distance filter, which only DNA
+// searches have
+template < typename Alphabet >
+inline bool EditDistanceFilter( const SearchParams< Alphabet >& ) {
+  return false;
+}
+
+inline bool EditDistanceFilter( const SearchParams< DNA >& params ) {
+  return params.editDistanceFilter;
+}
+
 template < typename Alphabet >
 class GlobalSearch : public Search< Alphabet > {
 public:
@@ -20,13 +33,89 @@ public:
 protected:
   using Search< Alphabet >::mDB;
   using Search< Alphabet >::mParams;
+  using Search< Alphabet >::mStats;
 
   void SearchForHits( const Sequence< Alphabet >&              query,
                       const SearchForHitsCallback< Alphabet >& callback );
-
-  std::vector< Counter >  mHits;
+  void SearchForHitsBothStrands(
+    const Sequence< Alphabet >&                         query,
+    const Sequence< Alphabet >&                         reverseComplement,
+    const SearchForHitsBothStrandsCallback< Alphabet >& callback );
+
+  // Counts the indexed kmers every database sequence shares with the
+  // query and ranks them in mHighscore as idOffset + seqId
+  void CountHits( const Sequence< Alphabet >& query,
+                  const std::vector< Kmer >&  kmers,
+                  const size_t                idOffset );
+
+  // Range of target lengths to consider for a query, see
+  // SearchParams::lengthFilter
+  void LengthBounds( const size_t queryLength, size_t* minLength,
+                     size_t* maxLength ) const;
+
+  // False if the edit distance of query and candidate rules out
+  // minIdentity, see SearchParams::editDistanceFilter. queryDistance has
+  // the query set as its pattern.
+  bool WithinEditDistance( const Sequence< Alphabet >& query,
+                           EditDistance< Alphabet >*   queryDistance,
+                           const SequenceId            seqId );
+
+  // Global alignment of the query to a candidate through its HSPs,
+  // true if it has the minimum identity
+  bool AlignCandidate( const Sequence< Alphabet >& query,
+                       const std::vector< Kmer >&  kmers,
+                       const SequenceId            seqId,
+                       Cigar*                      alignment );
+
+  // An HSP with the seed match it was extended from, so that its
+  // traceback can be redone when needed
+  struct SeededHSP : public HSP {
+    HSP seed;
+
+    SeededHSP( const HSP& seed, const size_t a1, const size_t a2,
+               const size_t b1, const size_t b2, const int score )
+        : HSP( a1, a2, b1, b2, score ), seed( seed ) {}
+  };
+
+  // Extends a seed match to both sides, by score alone
+  SeededHSP ExtendSeed( const Sequence< Alphabet >& query,
+                        const Sequence< Alphabet >& candidateSeq,
+                        const HSP&                  seed );
+
+  // Alignment of an HSP: its extensions and the seed match in between
+  void AlignHSP( const Sequence< Alphabet >& query,
+                 const Sequence< Alphabet >& candidateSeq,
+                 const SeededHSP& hsp, Cigar* cigar );
+
+  // Global alignment through a chain of HSPs, filled in with banded
+  // alignments. After each piece, canContinue( counts, a, b ) is given
+  // the CigarCounts of the alignment so far, and the number of residues
+  // of query and candidate it aligns. The chain is abandoned (false) as
+  // soon as it returns false.
+  template < typename Chain, typename CanContinue >
+  bool AlignChain( const Sequence< Alphabet >& query,
+                   const Sequence< Alphabet >& candidateSeq,
+                   const Chain& chain, Cigar* alignment,
+                   const CanContinue& canContinue );
+
+  // Scratch reused from query to query. Only the entries a query
+  // touched are reset, so that its cost does not depend on the size of
+  // the database.
+  std::vector< Counter >    mHits;
+  std::vector< SequenceId > mHitSeqIds;    // sequences with a counter > 0
+  std::vector< Kmer >       mQueryKmers;
+  std::vector< Kmer >       mReverseComplementKmers;
+  Highscore                 mHighscore;
+  std::vector< SequenceId > mSeqIdsBuffer; // decoded posting list
+  std::vector< bool >       mUniqueCheck;  // kmer slots of the query seen so far
+  std::vector< size_t >     mQuerySlots;
+  KmerPositions             mCandidatePositions;
+  std::vector< Kmer >       mCandidateKmers; // widened kmers of a candidate
   ExtendAlign< Alphabet > mExtendAlign;
   BandedAlign< Alphabet > mBandedAlign;
+  EditDistance< Alphabet > mQueryDistance;
+  EditDistance< Alphabet > mReverseComplementDistance;
+  EditDistance< Alphabet > mCandidateDistance;
 };
 
 template < typename A >
@@ -38,222 +127,467 @@ GlobalSearch< A >::GlobalSearch( const Database< A >&     db,
 
 template < typename A >
 void GlobalSearch< A >::SearchForHits( const Sequence< A >&              query,
-                                  const SearchForHitsCallback< A >& callback ) {
-  const size_t defaultMinHSPLength = 16;
-  const size_t maxHSPJoinDistance  = 16;
+                                       const SearchForHitsCallback< A >& callback ) {
+  mHighscore.Reset( mParams.maxAccepts + mParams.maxRejects );
 
-  size_t minHSPLength = std::min( defaultMinHSPLength, query.Length() / 2 );
+  mQueryKmers.clear();
+  mDB.ForEachKmer( query, [&]( const Kmer kmer, const size_t pos ) {
+    mQueryKmers.push_back( kmer );
+  } );
+  CountHits( query, mQueryKmers, 0 );
 
-  // Go through each kmer, find hits
-  if( mHits.size() < mDB.NumSequences() ) {
-    mHits.resize( mDB.NumSequences() );
+  const bool filterDistances = EditDistanceFilter( mParams );
+  if( filterDistances )
+    mQueryDistance.SetPattern( query );
+
+  // For each candidate:
+  // - Get HSPs,
+  // - Check for good HSP (>= similarity threshold)
+  // - Join HSP together
+  // - Align
+  // - Check similarity
+  int numHits    = 0;
+  int numRejects = 0;
+
+  Cigar alignment;
+  for( auto& entry : mHighscore.EntriesFromTopToBottom() ) {
+    const SequenceId seqId = entry.id;
+
+    bool accept =
+      ( !filterDistances ||
+        WithinEditDistance( query, &mQueryDistance, seqId ) ) &&
+      AlignCandidate( query, mQueryKmers, seqId, &alignment );
+    if( accept ) {
+      callback( mDB.GetSequenceById( seqId ), alignment );
+      numHits++;
+      mStats.numAccepted++;
+      if( numHits >= mParams.maxAccepts )
+        break;
+    } else {
+      numRejects++;
+      mStats.numRejected++;
+      if( numRejects >= mParams.maxRejects )
+        break;
+    }
   }
+}
 
-  // Fast counter reset
-  memset( mHits.data(), 0, sizeof( Counter ) * mHits.capacity() );
+// The candidates of both strands share one ranking (minus strand ids
+// offset by the number of sequences), so maxAccepts and maxRejects
+// apply to both strands together. The kmers of the reverse complement
+// are derived from those of the query.
+template < typename A >
+void GlobalSearch< A >::SearchForHitsBothStrands(
+  const Sequence< A >& query, const Sequence< A >& reverseComplement,
+  const SearchForHitsBothStrandsCallback< A >& callback ) {
+  mHighscore.Reset( mParams.maxAccepts + mParams.maxRejects );
+
+  mQueryKmers.clear();
+  mDB.ForEachKmer( query, [&]( const Kmer kmer, const size_t pos ) {
+    mQueryKmers.push_back( kmer );
+  } );
+  mDB.ReverseComplementKmers( reverseComplement, mQueryKmers,
+                              &mReverseComplementKmers );
+
+  const size_t minusOffset = mDB.NumSequences();
+  CountHits( query, mQueryKmers, 0 );
+  CountHits( reverseComplement, mReverseComplementKmers, minusOffset );
+
+  const bool filterDistances = EditDistanceFilter( mParams );
+  if( filterDistances ) {
+    mQueryDistance.SetPattern( query );
+    mReverseComplementDistance.SetPattern( reverseComplement );
+  }
 
-  Highscore highscore( mParams.maxAccepts + mParams.maxRejects );
+  int numHits    = 0;
+  int numRejects = 0;
+
+  Cigar alignment;
+  for( auto& entry : mHighscore.EntriesFromTopToBottom() ) {
+    const bool       minus = entry.id >= minusOffset;
+    const SequenceId seqId = minus ? entry.id - minusOffset : entry.id;
+
+    bool accept;
+    if( minus ) {
+      accept = ( !filterDistances ||
+                 WithinEditDistance( reverseComplement,
+                                     &mReverseComplementDistance, seqId ) ) &&
+               AlignCandidate( reverseComplement, mReverseComplementKmers,
+                               seqId, &alignment );
+    } else {
+      accept = ( !filterDistances ||
+                 WithinEditDistance( query, &mQueryDistance, seqId ) ) &&
+               AlignCandidate( query, mQueryKmers, seqId, &alignment );
+    }
+    if( accept ) {
+      callback( mDB.GetSequenceById( seqId ), alignment,
+                minus ? DNA::Strand::Minus : DNA::Strand::Plus );
+      numHits++;
+      mStats.numAccepted++;
+      if( numHits >= mParams.maxAccepts )
+        break;
+    } else {
+      numRejects++;
+      mStats.numRejected++;
+      if( numRejects >= mParams.maxRejects )
+        break;
+    }
+  }
+}
 
-  auto hitsData = mHits.data();
+template < typename A >
+void GlobalSearch< A >::CountHits( const Sequence< A >&       query,
+                                   const std::vector< Kmer >& kmers,
+                                   const size_t               idOffset ) {
+  // Go through each kmer, find hits
+  if( mHits.size() < idOffset + mDB.NumSequences() ) {
+    mHits.resize( idOffset + mDB.NumSequences(), 0 );
+  }
+  mHitSeqIds.clear();
+
+  auto hitsData = mHits.data() + idOffset;
 
-  std::vector< Kmer > kmers;
-  std::vector< bool > uniqueCheck( mDB.MaxUniqueKmers(), false );
-  Kmers< A >( query, mDB.KmerLength() )
-    .ForEach( [&]( const Kmer kmer, const size_t pos ) {
-      kmers.push_back( kmer );
+  if( mUniqueCheck.size() < mDB.NumKmerSlots() ) {
+    mUniqueCheck.resize( mDB.NumKmerSlots(), false );
+  }
+  mQuerySlots.clear();
 
-      if( kmer == AmbiguousKmer || uniqueCheck[ kmer ] )
-        return;
+  size_t     minLength, maxLength;
+  const bool filterLengths = mParams.lengthFilter;
+  LengthBounds( query.Length(), &minLength, &maxLength );
 
-      uniqueCheck[ kmer ] = true;
+  // Only the kmers the database indexes, e.g. minimizers, are looked up
+  mDB.ForEachIndexedKmer(
+    kmers.data(), query.Length(), [&]( const Kmer kmer, const size_t pos ) {
+    size_t slot;
+    if( !mDB.FindKmerSlot( kmer, &slot ) || mUniqueCheck[ slot ] )
+      return;
 
-      size_t            numSeqIds;
-      const SequenceId* seqIds;
+    mUniqueCheck[ slot ] = true;
+    mQuerySlots.push_back( slot );
 
-      if( !mDB.GetSequenceIdsIncludingKmer( kmer, &seqIds, &numSeqIds ) )
-        return;
+    size_t            numSeqIds;
+    const SequenceId* seqIds;
 
-      for( size_t i = 0; i < numSeqIds; i++ ) {
-        const auto& seqId   = seqIds[ i ];
-        Counter     counter = ++hitsData[ seqId ];
+    if( !mDB.GetSequenceIdsInSlot( slot, &seqIds, &numSeqIds, &mSeqIdsBuffer ) )
+      return;
 
-        highscore.Set( seqId, counter );
+    for( size_t i = 0; i < numSeqIds; i++ ) {
+      const auto& seqId = seqIds[ i ];
+      if( filterLengths ) {
+        const size_t length = mDB.SequenceLength( seqId );
+        if( length < minLength || length > maxLength )
+          continue;
       }
-    } );
 
-  // For each candidate:
-  // - Get HSPs,
-  // - Check for good HSP (>= similarity threshold)
-  // - Join HSP together
-  // - Align
-  // - Check similarity
-  int numHits    = 0;
-  int numRejects = 0;
+      Counter counter = ++hitsData[ seqId ];
+      if( counter == 1 )
+        mHitSeqIds.push_back( seqId );
 
-  auto highscores = highscore.EntriesFromTopToBottom();
+      mHighscore.Set( idOffset + seqId, counter );
+    }
+  } );
 
-  HitList< A > hits;
+  for( auto& slot : mQuerySlots ) {
+    mUniqueCheck[ slot ] = false;
+  }
+  for( auto& seqId : mHitSeqIds ) {
+    hitsData[ seqId ] = 0;
+  }
+}
+
+template < typename A >
+void GlobalSearch< A >::LengthBounds( const size_t queryLength,
+                                      size_t*      minLength,
+                                      size_t*      maxLength ) const {
+  *minLength = 0;
+  *maxLength = std::numeric_limits< size_t >::max();
+  if( !mParams.lengthFilter || mParams.minIdentity <= 0.0f )
+    return;
+
+  // Rounded in favour of keeping a target
+  const double minIdentity = mParams.minIdentity;
+  const double slack       = 1e-6;
+  *minLength = size_t( std::ceil( minIdentity * queryLength - slack ) );
+  if( minIdentity <= 1.0 ) {
+    *maxLength = size_t( std::floor( queryLength / minIdentity + slack ) );
+  }
+}
+
+template < typename A >
+bool GlobalSearch< A >::WithinEditDistance( const Sequence< A >& query,
+                                            EditDistance< A >*   queryDistance,
+                                            const SequenceId     seqId ) {
+  const double minIdentity = mParams.minIdentity;
+  if( minIdentity <= 0.0 )
+    return true;
+
+  // The shorter sequence is the pattern, aligned from end to end
+  const Sequence< A >& candidateSeq = mDB.GetSequenceById( seqId );
+  EditDistance< A >*   distance     = queryDistance;
+  const Sequence< A >* text         = &candidateSeq;
+  if( candidateSeq.Length() < query.Length() ) {
+    mCandidateDistance.SetPattern( candidateSeq );
+    distance = &mCandidateDistance;
+    text     = &query;
+  }
+
+  // With at most as many matches as the pattern has residues, the
+  // identity matches / ( matches + edits ) is below minIdentity beyond
+  // this many edits. Rounded in favour of keeping a candidate.
+  const size_t patternLength = std::min( query.Length(), candidateSeq.Length() );
+  const double slack         = 1e-6;
+  const size_t maxDistance   = size_t( std::max(
+    0.0,
+    std::floor( patternLength * ( 1.0 - minIdentity ) / minIdentity + slack ) ) );
+
+  if( distance->Distance( *text, maxDistance ) <= maxDistance )
+    return true;
 
-  for( auto it = highscores.cbegin(); it != highscores.cend(); ++it ) {
-    const size_t         seqId        = it->id;
-    const Sequence< A >& candidateSeq = mDB.GetSequenceById( seqId );
+  mStats.numPrefiltered++;
+  return false;
+}
+
+template < typename A >
+bool GlobalSearch< A >::AlignCandidate( const Sequence< A >&       query,
+                                        const std::vector< Kmer >& kmers,
+                                        const SequenceId           seqId,
+                                        Cigar*                     alignment ) {
+  const size_t defaultMinHSPLength = 16;
+  const size_t maxHSPJoinDistance  = 16;
 
-    std::deque< HSP > sps;
+  size_t minHSPLength = std::min( defaultMinHSPLength, query.Length() / 2 );
 
-    for( size_t pos = 0; pos < kmers.size(); pos++ ) {
-      const Kmer* kmers2;
-      size_t      kmers2count;
-      if( !mDB.GetKmersForSequenceId( seqId, &kmers2, &kmers2count ) )
+  const Sequence< A >& candidateSeq = mDB.GetSequenceById( seqId );
+  mStats.numCandidates++;
+
+  std::deque< HSP > sps;
+
+  const Kmer* allKmers2;
+  size_t      allKmers2count;
+  const bool  hasKmers2 =
+    mDB.GetKmersForSequenceId( seqId, &allKmers2, &allKmers2count,
+                               &mCandidateKmers );
+  if( hasKmers2 )
+    mCandidatePositions.Assign( allKmers2, allKmers2count );
+
+  // Diagonals are followed within the kmers of one seed pattern. The
+  // candidate positions of every query kmer come from a hash of the
+  // candidate's kmers, in ascending order.
+  size_t offset = 0, offset2 = 0;
+  for( size_t pattern = 0; hasKmers2 && pattern < mDB.NumSeedPatterns();
+       pattern++ ) {
+    const Kmer*  kmers1      = kmers.data() + offset;
+    const Kmer*  kmers2      = allKmers2 + offset2;
+    const size_t kmers1count = mDB.NumKmerFrames( query.Length(), pattern );
+    const size_t kmers2count =
+      mDB.NumKmerFrames( candidateSeq.Length(), pattern );
+
+    for( size_t pos = 0; pos < kmers1count; pos++ ) {
+      const uint32_t* positions;
+      size_t          numPositions;
+      if( !mCandidatePositions.Find( kmers1[ pos ], &positions, &numPositions ) )
         continue;
 
-      for( size_t pos2 = 0; pos2 < kmers2count; pos2++ ) {
-        if( kmers2[ pos2 ] != kmers[ pos ] )
-          continue;
+      for( size_t i = 0; i < numPositions; i++ ) {
+        const size_t pos2 = positions[ i ] - offset2;
 
         // Look for the start of a "diagonal" (alignment matrix), then follow it
-        if( pos == 0 || pos2 == 0 || kmers[ pos - 1 ] == AmbiguousKmer ||
+        if( pos == 0 || pos2 == 0 || kmers1[ pos - 1 ] == AmbiguousKmer ||
             kmers2[ pos2 - 1 ] == AmbiguousKmer ||
-            ( kmers[ pos - 1 ] != kmers2[ pos2 - 1 ] ) ) {
-          size_t length = mDB.KmerLength();
-
+            ( kmers1[ pos - 1 ] != kmers2[ pos2 - 1 ] ) ) {
           size_t cur  = pos + 1;
           size_t cur2 = pos2 + 1;
-          while( cur < kmers.size() && cur2 < kmers2count &&
-                 kmers[ cur ] != AmbiguousKmer &&
-                 kmers2[ cur ] != AmbiguousKmer &&
-                 kmers[ cur ] == kmers2[ cur2 ] ) {
+          while( cur < kmers1count && cur2 < kmers2count &&
+                 kmers1[ cur ] != AmbiguousKmer &&
+                 kmers2[ cur2 ] != AmbiguousKmer &&
+                 kmers1[ cur ] == kmers2[ cur2 ] ) {
             cur++;
             cur2++;
-            length++;
           }
 
           sps.emplace_back( pos, cur - 1, pos2, cur2 - 1 );
         }
       }
-    };
-
-    // Find all HSP
-    // Sort by length
-    // Try to find best chain
-    // Fill space between with banded align
-    std::set< HSP > hsps;
-    for( auto& sp : sps ) {
-      size_t queryPos, candidatePos;
-
-      size_t a1 = sp.a1, a2 = sp.a2, b1 = sp.b1, b2 = sp.b2;
-
-      Cigar leftCigar;
-      int   leftScore =
-        mExtendAlign.Extend( query, candidateSeq, &queryPos, &candidatePos,
-                             &leftCigar, AlignmentDirection::Reverse, a1, b1 );
-      if( !leftCigar.empty() ) {
-        a1 = queryPos;
-        b1 = candidatePos;
-      }
-
-      Cigar  rightCigar;
-      size_t rightQuery, rightCandidate;
-      int    rightScore = mExtendAlign.Extend(
-        query, candidateSeq, &queryPos, &candidatePos, &rightCigar,
-        AlignmentDirection::Forward, a2 + 1, b2 + 1 );
-      if( !rightCigar.empty() ) {
-        a2 = queryPos;
-        b2 = candidatePos;
-      }
+    }
 
-      HSP hsp( a1, a2, b1, b2 );
-      if( hsp.Length() >= minHSPLength ) {
-        // Construct hsp cigar (spaced seeds so we cannot assume full match)
-        Cigar middleCigar;
-        int   middleScore = 0;
-        for( size_t a = sp.a1, b = sp.b1; a <= sp.a2 && b <= sp.b2; a++, b++ ) {
-          auto   chA = query[ a ], chB = candidateSeq[ b ];
-          bool   match = MatchPolicy< A >::Match( chA, chB );
-          int8_t score = ScorePolicy< A >::Score( chA, chB );
-          middleCigar.Add( match ? CigarOp::Match : CigarOp::Mismatch );
-          middleScore += score;
-        }
-        hsp.score = leftScore + middleScore + rightScore;
-        hsp.cigar = leftCigar + middleCigar + rightCigar;
+    offset += kmers1count;
+    offset2 += kmers2count;
+  }
 
-        // Save HSP
-        hsps.insert( hsp );
-      }
+  // Find all HSP
+  // Sort by length
+  // Try to find best chain
+  // Fill space between with banded align
+  std::set< SeededHSP > hsps;
+  for( auto& sp : sps ) {
+    SeededHSP hsp = ExtendSeed( query, candidateSeq, sp );
+    if( hsp.Length() >= minHSPLength ) {
+      // Save HSP
+      hsps.insert( hsp );
     }
+  }
 
-    // Greedy join HSPs if close
-    struct HSPChainOrdering {
-      bool operator()( const HSP& left, const HSP& right ) const {
-        return left.a1 < right.a1 && left.b1 < right.b1;
-      }
-    };
-
-    std::set< HSP, HSPChainOrdering > chain;
-    for( auto it = hsps.rbegin(); it != hsps.rend(); ++it ) {
-      const HSP& hsp = *it;
-      bool       hasNoOverlaps =
-        std::none_of( chain.begin(), chain.end(), [&]( const HSP& existing ) {
-          return hsp.IsOverlapping( existing );
+  // Greedy join HSPs if close
+  struct HSPChainOrdering {
+    bool operator()( const HSP& left, const HSP& right ) const {
+      return left.a1 < right.a1 && left.b1 < right.b1;
+    }
+  };
+
+  std::set< SeededHSP, HSPChainOrdering > chain;
+  for( auto it = hsps.rbegin(); it != hsps.rend(); ++it ) {
+    const SeededHSP& hsp = *it;
+    bool             hasNoOverlaps =
+      std::none_of( chain.begin(), chain.end(), [&]( const HSP& existing ) {
+        return hsp.IsOverlapping( existing );
+      } );
+    if( hasNoOverlaps ) {
+      bool anyHSPJoinable =
+        std::any_of( chain.begin(), chain.end(), [&]( const HSP& existing ) {
+          return hsp.DistanceTo( existing ) <= maxHSPJoinDistance;
         } );
-      if( hasNoOverlaps ) {
-        bool anyHSPJoinable =
-          std::any_of( chain.begin(), chain.end(), [&]( const HSP& existing ) {
-            return hsp.DistanceTo( existing ) <= maxHSPJoinDistance;
-          } );
-
-        if( chain.empty() || anyHSPJoinable ) {
-          chain.insert( hsp );
-        }
+
+      if( chain.empty() || anyHSPJoinable ) {
+        chain.insert( hsp );
       }
     }
+  }
 
-    bool accept = false;
-    if( chain.size() > 0 ) {
-      Cigar alignment;
-      Cigar cigar;
-
-      // Align first HSP's start to whole sequences begin
-      auto& first = *chain.cbegin();
-      mBandedAlign.Align( query, candidateSeq, &cigar,
-                          AlignmentDirection::Reverse, first.a1, first.b1 );
-      alignment += cigar;
-
-      // Align in between the HSP's
-      for( auto it1 = chain.cbegin(), it2 = ++chain.cbegin();
-           it1 != chain.cend() && it2 != chain.cend(); ++it1, ++it2 ) {
-        auto& current = *it1;
-        auto& next    = *it2;
-
-        alignment += current.cigar;
-        mBandedAlign.Align( query, candidateSeq, &cigar,
-                            AlignmentDirection::Forward, current.a2 + 1,
-                            current.b2 + 1, next.a1, next.b1 );
-        alignment += cigar;
-      }
+  if( chain.empty() )
+    return false;
+
+  // The identity the chain can still reach is checked piece by piece,
+  // so that hopeless chains are given up on before they are aligned to
+  // the end
+  bool complete = AlignChain(
+    query, candidateSeq, chain, alignment,
+    [&]( const CigarCounts& aligned, const size_t a, const size_t b ) {
+      return aligned.MaxIdentity( query.Length() - a,
+                                  candidateSeq.Length() - b ) >=
+             mParams.minIdentity;
+    } );
+  if( !complete ) {
+    mStats.numAbandoned++;
+    return false;
+  }
 
-      // Align last HSP's end to whole sequences end
-      auto& last = *chain.crbegin();
-      alignment += last.cigar;
-      mBandedAlign.Align( query, candidateSeq, &cigar,
-                          AlignmentDirection::Forward, last.a2 + 1,
-                          last.b2 + 1 );
-      alignment += cigar;
-
-      float identity = alignment.Identity();
-      if( identity >= mParams.minIdentity ) {
-        accept = true;
-        callback( candidateSeq, alignment );
-      }
-    }
+  return alignment->Identity() >= mParams.minIdentity;
+}
 
-    if( accept ) {
-      numHits++;
-      if( numHits >= mParams.maxAccepts )
-        break;
-    } else {
-      numRejects++;
-      if( numRejects >= mParams.maxRejects )
-        break;
-    }
+template < typename A >
+typename GlobalSearch< A >::SeededHSP
+GlobalSearch< A >::ExtendSeed( const Sequence< A >& query,
+                               const Sequence< A >& candidateSeq,
+                               const HSP&           seed ) {
+  // Scores and end points only, without traceback
+  Cigar* const noCigar = NULL;
+  size_t       queryPos, candidatePos;
+
+  size_t a1 = seed.a1, a2 = seed.a2, b1 = seed.b1, b2 = seed.b2;
+
+  int leftScore =
+    mExtendAlign.Extend( query, candidateSeq, &queryPos, &candidatePos, noCigar,
+                         AlignmentDirection::Reverse, a1, b1 );
+  if( leftScore > 0 ) {
+    a1 = queryPos;
+    b1 = candidatePos;
+  }
+
+  int rightScore =
+    mExtendAlign.Extend( query, candidateSeq, &queryPos, &candidatePos, noCigar,
+                         AlignmentDirection::Forward, a2 + 1, b2 + 1 );
+  if( rightScore > 0 ) {
+    a2 = queryPos;
+    b2 = candidatePos;
+  }
+
+  int middleScore = 0;
+  for( size_t a = seed.a1, b = seed.b1; a <= seed.a2 && b <= seed.b2;
+       a++, b++ ) {
+    middleScore += ScorePolicy< A >::Score( query[ a ], candidateSeq[ b ] );
+  }
+
+  return SeededHSP( seed, a1, a2, b1, b2,
+                    leftScore + middleScore + rightScore );
+}
+
+template < typename A >
+void GlobalSearch< A >::AlignHSP( const Sequence< A >& query,
+                                  const Sequence< A >& candidateSeq,
+                                  const SeededHSP& hsp, Cigar* cigar ) {
+  const HSP& seed = hsp.seed;
+
+  Cigar extension;
+  cigar->Clear();
+
+  mExtendAlign.Extend( query, candidateSeq, NULL, NULL, &extension,
+                       AlignmentDirection::Reverse, seed.a1, seed.b1 );
+  *cigar += extension;
+
+  // Construct hsp cigar (spaced seeds so we cannot assume full match)
+  for( size_t a = seed.a1, b = seed.b1; a <= seed.a2 && b <= seed.b2;
+       a++, b++ ) {
+    bool match = MatchPolicy< A >::Match( query[ a ], candidateSeq[ b ] );
+    cigar->Add( match ? CigarOp::Match : CigarOp::Mismatch );
+  }
+
+  mExtendAlign.Extend( query, candidateSeq, NULL, NULL, &extension,
+                       AlignmentDirection::Forward, seed.a2 + 1, seed.b2 + 1 );
+  *cigar += extension;
+}
+
+template < typename A >
+template < typename Chain, typename CanContinue >
+bool GlobalSearch< A >::AlignChain( const Sequence< A >& query,
+                                    const Sequence< A >& candidateSeq,
+                                    const Chain& chain, Cigar* alignment,
+                                    const CanContinue& canContinue ) {
+  Cigar       cigar;
+  CigarCounts counts;
+  alignment->Clear();
+
+  // Align first HSP's start to whole sequences begin
+  auto& first = *chain.cbegin();
+  mBandedAlign.Align( query, candidateSeq, &cigar,
+                      AlignmentDirection::Reverse, first.a1, first.b1 );
+  *alignment += cigar;
+  counts += cigar;
+  if( !canContinue( counts, first.a1, first.b1 ) )
+    return false;
+
+  // Align in between the HSP's
+  for( auto it1 = chain.cbegin(), it2 = ++chain.cbegin();
+       it1 != chain.cend() && it2 != chain.cend(); ++it1, ++it2 ) {
+    auto& current = *it1;
+    auto& next    = *it2;
+
+    AlignHSP( query, candidateSeq, current, &cigar );
+    *alignment += cigar;
+    counts += cigar;
+    if( !canContinue( counts, current.a2 + 1, current.b2 + 1 ) )
+      return false;
+
+    mBandedAlign.Align( query, candidateSeq, &cigar,
+                        AlignmentDirection::Forward, current.a2 + 1,
+                        current.b2 + 1, next.a1, next.b1 );
+    *alignment += cigar;
+    counts += cigar;
+    if( !canContinue( counts, next.a1, next.b1 ) )
+      return false;
   }
+
+  // Align last HSP's end to whole sequences end
+  auto& last = *chain.crbegin();
+  AlignHSP( query, candidateSeq, last, &cigar );
+  *alignment += cigar;
+  counts += cigar;
+  if( !canContinue( counts, last.a2 + 1, last.b2 + 1 ) )
+    return false;
+
+  mBandedAlign.Align( query, candidateSeq, &cigar,
+                      AlignmentDirection::Forward, last.a2 + 1,
+                      last.b2 + 1 );
+  *alignment += cigar;
+  return true;
 }
@@ -1,9 +1,9 @@
 #pragma once
 
-#include "../Alignment/Cigar.h"
-
+#include <algorithm>
 #include <cassert>
 #include <cmath>
+#include <cstddef>
 
 // High-scoring segment pair
 // HSP: first and last character in sequence (i.e. seq[a1] - seq[a2])
@@ -12,7 +12,6 @@ public:
   size_t a1, a2;
   size_t b1, b2;
   int    score;
-  Cigar  cigar;
 
   HSP( const size_t a1, const size_t a2, const size_t b1, const size_t b2,
        const int score = 0 )
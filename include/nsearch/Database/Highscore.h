@@ -1,8 +1,15 @@
 #pragma once
 
+#include <cstdint>
 #include <vector>
 #include <algorithm>
 
+/*
+ * The numHighestEntriesToKeep ids with the highest scores, as an indexed
+ * min-heap: the lowest kept score is on top, and the heap position of
+ * every kept id is looked up directly, so that Set is O(log n).
+ * Reused from query to query with Reset.
+ */
 class Highscore {
   class Entry {
   public:
@@ -15,53 +22,93 @@ class Highscore {
   };
 
 public:
-  Highscore( const size_t numHighestEntriesToKeep ) : mLowestScore( 0 ) {
-    mEntries.resize( numHighestEntriesToKeep );
+  Highscore( const size_t numHighestEntriesToKeep = 0 )
+      : mNumEntriesToKeep( numHighestEntriesToKeep ) {}
+
+  // Forgets all entries, in O(entries kept)
+  void Reset( const size_t numHighestEntriesToKeep ) {
+    for( auto& entry : mHeap ) {
+      mPositions[ entry.id ] = NotKept;
+    }
+    mHeap.clear();
+    mNumEntriesToKeep = numHighestEntriesToKeep;
   }
 
   // score is assumed to increase for every id
   void Set( const size_t id, const size_t score ) {
-    if( score < mLowestScore )
-      return;
-
-    auto it = std::find_if(
-      mEntries.begin(), mEntries.end(),
-      [id]( const Entry& candidate ) { return id == candidate.id; } );
-
-    if( it == mEntries.end() ) {
-      it = std::find_if(
-        mEntries.begin(), mEntries.end(),
-        [score]( const Entry& candidate ) { return score > candidate.score; } );
+    if( id >= mPositions.size() ) {
+      mPositions.resize( id + 1, uint32_t( NotKept ) );
     }
 
-    if( it != mEntries.end() ) {
-      it->id    = id;
-      it->score = score;
+    Entry entry;
+    entry.id    = id;
+    entry.score = score;
 
-      mLowestScore =
-        std::min_element( mEntries.begin(), mEntries.end() )->score;
+    const uint32_t pos = mPositions[ id ];
+    if( pos != NotKept ) {
+      // Higher score: moves away from the top
+      mHeap[ pos ] = entry;
+      SiftDown( pos );
+    } else if( mHeap.size() < mNumEntriesToKeep ) {
+      mHeap.push_back( entry );
+      SiftUp( mHeap.size() - 1 );
+    } else if( !mHeap.empty() && score > mHeap.front().score ) {
+      // Replaces the lowest score
+      mPositions[ mHeap.front().id ] = NotKept;
+      mHeap.front() = entry;
+      SiftDown( 0 );
     }
   }
 
+  // Highest score first, lowest id first among equal scores
   std::vector< Entry > EntriesFromTopToBottom() const {
-    std::vector< Entry > sorted = mEntries;
-
-    // remove empty elements
-    sorted.erase(
-      std::remove_if( sorted.begin(), sorted.end(),
-                      []( const Entry& e ) { return e.score == 0; } ),
-      sorted.end() );
-
-    // sort
+    std::vector< Entry > sorted = mHeap;
     std::sort( sorted.begin(), sorted.end(),
-               []( const Entry& a, const Entry& b ) { return a < b; } );
-
-    // reverse
-    std::reverse( sorted.begin(), sorted.end() );
+               []( const Entry& a, const Entry& b ) {
+                 return a.score != b.score ? a.score > b.score : a.id < b.id;
+               } );
     return sorted;
   }
 
 private:
-  size_t               mLowestScore;
-  std::vector< Entry > mEntries;
+  static const uint32_t NotKept = ( uint32_t ) -1;
+
+  void Place( const size_t pos, const Entry& entry ) {
+    mHeap[ pos ]           = entry;
+    mPositions[ entry.id ] = pos;
+  }
+
+  void SiftUp( size_t pos ) {
+    const Entry entry = mHeap[ pos ];
+    while( pos > 0 ) {
+      const size_t parent = ( pos - 1 ) / 2;
+      if( !( entry < mHeap[ parent ] ) )
+        break;
+
+      Place( pos, mHeap[ parent ] );
+      pos = parent;
+    }
+    Place( pos, entry );
+  }
+
+  void SiftDown( size_t pos ) {
+    const Entry entry = mHeap[ pos ];
+    while( true ) {
+      size_t child = 2 * pos + 1;
+      if( child >= mHeap.size() )
+        break;
+      if( child + 1 < mHeap.size() && mHeap[ child + 1 ] < mHeap[ child ] )
+        child++;
+      if( !( mHeap[ child ] < entry ) )
+        break;
+
+      Place( pos, mHeap[ child ] );
+      pos = child;
+    }
+    Place( pos, entry );
+  }
+
+  size_t                  mNumEntriesToKeep;
+  std::vector< Entry >    mHeap;
+  std::vector< uint32_t > mPositions; // heap position by id, or NotKept
 };
@@ -0,0 +1,68 @@
+#pragma once
+
+#include <cassert>
+#include <vector>
+
+// Flat array of index data. Either owns its values, or points into
+// memory owned by someone else (e.g. a memory mapped index file).
+template < typename T >
+class IndexArray {
+public:
+  IndexArray() : mData( NULL ), mSize( 0 ) {}
+
+  IndexArray( IndexArray&& other ) {
+    *this = std::move( other );
+  }
+
+  IndexArray& operator=( IndexArray&& other ) {
+    bool owned = other.mData == other.mValues.data();
+    mValues    = std::move( other.mValues );
+    mData      = owned ? mValues.data() : other.mData;
+    mSize      = other.mSize;
+    other.Clear();
+    return *this;
+  }
+
+  IndexArray( const IndexArray& ) = delete;
+  IndexArray& operator=( const IndexArray& ) = delete;
+
+  void Assign( std::vector< T >&& values ) {
+    mValues = std::move( values );
+    mData   = mValues.data();
+    mSize   = mValues.size();
+  }
+
+  void Borrow( const T* data, const size_t size ) {
+    mValues = std::vector< T >();
+    mData   = data;
+    mSize   = size;
+  }
+
+  void Clear() {
+    mValues = std::vector< T >();
+    mData   = NULL;
+    mSize   = 0;
+  }
+
+  inline const T& operator[]( const size_t index ) const {
+    assert( index < mSize );
+    return mData[ index ];
+  }
+
+  const T* Data() const {
+    return mData;
+  }
+
+  size_t Size() const {
+    return mSize;
+  }
+
+  size_t SizeInBytes() const {
+    return mSize * sizeof( T );
+  }
+
+private:
+  std::vector< T > mValues;
+  const T*         mData;
+  size_t           mSize;
+};
@@ -0,0 +1,330 @@
+#pragma once
+
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
+#include <algorithm>
+#include <cstdint>
+#include <cstring>
+#include <fstream>
+#include <memory>
+#include <stdexcept>
+#include <string>
+#include <vector>
+
+/*
+ * On-disk kmer index
+ *
+ * Header, followed by the index arrays. Every array starts at an offset
+ * aligned to IndexFile::Alignment, so that the arrays can be used in
+ * place when the file is memory mapped.
+ */
+namespace IndexFile {
+
+static const char     Magic[ 8 ]  = { 'N', 'P', 'Y', 'S', 'I', 'D', 'X', '\0' };
+static const uint32_t Version     = 3;
+static const uint32_t ByteOrder   = 0x01020304;
+static const size_t   Alignment   = 64;
+static const size_t   MaxSections = 16;
+
+// Header flags
+static const uint32_t CompressedPostings = 1 << 0;
+static const uint32_t SparseIndex        = 1 << 1;
+
+struct Section {
+  uint64_t offset; // from beginning of file
+  uint64_t size;   // in bytes
+};
+
+struct Header {
+  char     magic[ 8 ];
+  uint32_t version;
+  uint32_t byteOrder;
+  char     alphabet[ 16 ];
+  uint32_t kmerLength;
+  uint32_t sizeOfSizeT;
+  uint64_t numSequences;
+  uint64_t numPostings;
+  uint32_t flags;
+  uint32_t kmerDirectoryBits; // sparse index only
+  uint64_t numSections;
+  uint64_t checksum; // of everything after the header
+  Section  sections[ MaxSections ];
+};
+
+static inline size_t AlignedOffset( const size_t offset ) {
+  return ( offset + Alignment - 1 ) / Alignment * Alignment;
+}
+
+// 64-bit FNV-1a variant which consumes eight bytes per round.
+// The result does not depend on how the data is split into updates.
+class Checksum {
+public:
+  Checksum() : mHash( 0xcbf29ce484222325ULL ), mPendingSize( 0 ) {}
+
+  void Update( const void* data, size_t size ) {
+    const uint8_t* ptr = static_cast< const uint8_t* >( data );
+
+    // Complete a word left over from the previous update
+    if( mPendingSize > 0 ) {
+      const size_t fill = std::min( size, sizeof( mPending ) - mPendingSize );
+      memcpy( mPending + mPendingSize, ptr, fill );
+      mPendingSize += fill;
+      ptr += fill;
+      size -= fill;
+      if( mPendingSize < sizeof( mPending ) )
+        return;
+
+      Round( mPending );
+      mPendingSize = 0;
+    }
+
+    for( ; size >= sizeof( uint64_t ); size -= sizeof( uint64_t ) ) {
+      Round( ptr );
+      ptr += sizeof( uint64_t );
+    }
+
+    // Less than a word is left, and nothing is pending
+    memcpy( mPending, ptr, size );
+    mPendingSize = size;
+  }
+
+  uint64_t Value() const {
+    uint64_t hash = mHash;
+    for( size_t i = 0; i < mPendingSize; i++ ) {
+      hash = ( hash ^ mPending[ i ] ) * Prime;
+    }
+    return hash;
+  }
+
+private:
+  static const uint64_t Prime = 0x100000001b3ULL;
+
+  inline void Round( const uint8_t* ptr ) {
+    uint64_t word;
+    memcpy( &word, ptr, sizeof( uint64_t ) );
+    mHash = ( mHash ^ word ) * Prime;
+  }
+
+  uint64_t mHash;
+  uint8_t  mPending[ sizeof( uint64_t ) ];
+  size_t   mPendingSize;
+};
+
+// Header only, e.g. to find out which alphabet an index file holds
+static inline Header ReadHeader( const std::string& path ) {
+  Header        header;
+  std::ifstream file( path, std::ios::binary );
+  if( !file )
+    throw std::runtime_error( "Cannot open index file " + path );
+
+  file.read( reinterpret_cast< char* >( &header ), sizeof( Header ) );
+  if( !file || memcmp( header.magic, Magic, sizeof( Magic ) ) != 0 )
+    throw std::runtime_error( "Not an index file: " + path );
+
+  header.alphabet[ sizeof( header.alphabet ) - 1 ] = '\0';
+  return header;
+}
+
+// Read-only memory mapping of a whole file
+class MappedFile {
+public:
+  MappedFile( const std::string& path ) : mData( NULL ), mSize( 0 ) {
+    int fd = open( path.c_str(), O_RDONLY );
+    if( fd == -1 )
+      throw std::runtime_error( "Cannot open index file " + path );
+
+    struct stat st;
+    if( fstat( fd, &st ) == 0 && st.st_size > 0 ) {
+      mSize = st.st_size;
+      void* data = mmap( NULL, mSize, PROT_READ, MAP_SHARED, fd, 0 );
+      if( data != MAP_FAILED )
+        mData = static_cast< const char* >( data );
+    }
+    close( fd );
+
+    if( !mData )
+      throw std::runtime_error( "Cannot map index file " + path );
+  }
+
+  ~MappedFile() {
+    if( mData )
+      munmap( const_cast< char* >( mData ), mSize );
+  }
+
+  MappedFile( const MappedFile& ) = delete;
+  MappedFile& operator=( const MappedFile& ) = delete;
+
+  const char* Data() const {
+    return mData;
+  }
+
+  size_t Size() const {
+    return mSize;
+  }
+
+private:
+  const char* mData;
+  size_t      mSize;
+};
+
+// Index file contents, either mapped or read into memory
+class Reader {
+public:
+  Reader( const std::string& path, const bool useMmap ) {
+    if( useMmap ) {
+      mMapping.reset( new MappedFile( path ) );
+      mData = mMapping->Data();
+      mSize = mMapping->Size();
+    } else {
+      std::ifstream file( path, std::ios::binary | std::ios::ate );
+      if( !file )
+        throw std::runtime_error( "Cannot open index file " + path );
+
+      // uint64_t keeps the sections aligned
+      mSize = file.tellg();
+      mBuffer.resize( ( mSize + sizeof( uint64_t ) - 1 ) / sizeof( uint64_t ) );
+      file.seekg( 0 );
+      file.read( reinterpret_cast< char* >( mBuffer.data() ), mSize );
+      if( !file )
+        throw std::runtime_error( "Cannot read index file " + path );
+      mData = reinterpret_cast< const char* >( mBuffer.data() );
+    }
+
+    if( mSize < sizeof( Header ) )
+      throw std::runtime_error( "Not an index file: " + path );
+
+    memcpy( &mHeader, mData, sizeof( Header ) );
+    mHeader.alphabet[ sizeof( mHeader.alphabet ) - 1 ] = '\0';
+
+    if( memcmp( mHeader.magic, Magic, sizeof( Magic ) ) != 0 )
+      throw std::runtime_error( "Not an index file: " + path );
+    if( mHeader.version != Version )
+      throw std::runtime_error( "Unsupported index file version " +
+                                std::to_string( mHeader.version ) );
+    if( mHeader.byteOrder != ByteOrder ||
+        mHeader.sizeOfSizeT != sizeof( size_t ) )
+      throw std::runtime_error(
+        "Index file was written on an incompatible platform" );
+    if( mHeader.numSections > MaxSections )
+      throw std::runtime_error( "Corrupt index file: " + path );
+
+    for( size_t i = 0; i < mHeader.numSections; i++ ) {
+      const Section& section = mHeader.sections[ i ];
+      if( section.offset % Alignment != 0 || section.offset > mSize ||
+          section.size > mSize - section.offset )
+        throw std::runtime_error( "Corrupt index file: " + path );
+    }
+  }
+
+  const Header& GetHeader() const {
+    return mHeader;
+  }
+
+  bool VerifyChecksum() const {
+    Checksum checksum;
+    checksum.Update( mData + sizeof( Header ), mSize - sizeof( Header ) );
+    return checksum.Value() == mHeader.checksum;
+  }
+
+  // Pointer to the values of section #index
+  template < typename T >
+  const T* SectionData( const size_t index, size_t* count ) const {
+    if( index >= mHeader.numSections )
+      throw std::runtime_error( "Corrupt index file" );
+
+    const Section& section = mHeader.sections[ index ];
+    if( section.size % sizeof( T ) != 0 )
+      throw std::runtime_error( "Corrupt index file" );
+
+    *count = section.size / sizeof( T );
+    return reinterpret_cast< const T* >( mData + section.offset );
+  }
+
+  // Keeps the memory the section pointers refer to alive
+  std::shared_ptr< MappedFile > Mapping() const {
+    return mMapping;
+  }
+
+  bool IsMapped() const {
+    return mMapping != nullptr;
+  }
+
+private:
+  Header                        mHeader;
+  std::shared_ptr< MappedFile > mMapping;
+  std::vector< uint64_t >       mBuffer;
+  const char*                   mData;
+  size_t                        mSize;
+};
+
+class Writer {
+public:
+  Writer( const std::string& path, const std::string& alphabet,
+          const size_t kmerLength, const size_t numSequences,
+          const size_t numPostings, const uint32_t flags,
+          const size_t kmerDirectoryBits )
+      : mPath( path ), mFile( path, std::ios::binary | std::ios::trunc ) {
+    if( !mFile )
+      throw std::runtime_error( "Cannot write index file " + path );
+
+    memset( &mHeader, 0, sizeof( Header ) );
+    memcpy( mHeader.magic, Magic, sizeof( Magic ) );
+    mHeader.version   = Version;
+    mHeader.byteOrder = ByteOrder;
+    strncpy( mHeader.alphabet, alphabet.c_str(), sizeof( mHeader.alphabet ) - 1 );
+    mHeader.kmerLength   = kmerLength;
+    mHeader.sizeOfSizeT  = sizeof( size_t );
+    mHeader.numSequences = numSequences;
+    mHeader.numPostings  = numPostings;
+    mHeader.flags        = flags;
+    mHeader.kmerDirectoryBits = kmerDirectoryBits;
+
+    // Placeholder, rewritten once all sections are known
+    mFile.write( reinterpret_cast< const char* >( &mHeader ), sizeof( Header ) );
+    mOffset = sizeof( Header );
+  }
+
+  template < typename T >
+  void AddSection( const T* values, const size_t count ) {
+    if( mHeader.numSections >= MaxSections )
+      throw std::runtime_error( "Too many index file sections" );
+
+    // Pad to alignment
+    static const char padding[ Alignment ] = {};
+    size_t            aligned              = AlignedOffset( mOffset );
+    Write( padding, aligned - mOffset );
+
+    Section& section = mHeader.sections[ mHeader.numSections++ ];
+    section.offset   = aligned;
+    section.size     = count * sizeof( T );
+    Write( values, section.size );
+  }
+
+  void Close() {
+    mHeader.checksum = mChecksum.Value();
+    mFile.seekp( 0 );
+    mFile.write( reinterpret_cast< const char* >( &mHeader ), sizeof( Header ) );
+    mFile.close();
+
+    if( !mFile )
+      throw std::runtime_error( "Cannot write index file " + mPath );
+  }
+
+private:
+  void Write( const void* data, const size_t size ) {
+    mFile.write( static_cast< const char* >( data ), size );
+    mChecksum.Update( data, size );
+    mOffset += size;
+  }
+
+  std::string   mPath;
+  std::ofstream mFile;
+  Header        mHeader;
+  Checksum      mChecksum;
+  size_t        mOffset;
+};
+
+} // namespace IndexFile
@@ -0,0 +1,105 @@
+#pragma once
+
+#include <cstdint>
+#include <limits>
+#include <vector>
+
+#include "IndexArray.h"
+#include "Kmers.h"
+
+// The kmers of every sequence, one after another. Stored with 32 bits per
+// kmer when no valid kmer reaches the 32 bit AmbiguousKmer, i.e. kmers
+// (with the pattern index) of fewer than 32 bits, with 64 bits otherwise.
+class KmerArray {
+public:
+  static const uint32_t NarrowAmbiguousKmer =
+    std::numeric_limits< uint32_t >::max();
+
+  static bool FitsNarrow( const size_t kmerBits ) {
+    return kmerBits < sizeof( uint32_t ) * 8;
+  }
+
+  static inline uint32_t ToNarrow( const Kmer kmer ) {
+    return kmer == AmbiguousKmer ? NarrowAmbiguousKmer : uint32_t( kmer );
+  }
+
+  static inline Kmer FromNarrow( const uint32_t kmer ) {
+    return kmer == NarrowAmbiguousKmer ? AmbiguousKmer : Kmer( kmer );
+  }
+
+  KmerArray() : mWide( false ) {}
+
+  void Assign( std::vector< uint32_t >&& kmers ) {
+    mWide = false;
+    mWideKmers.Clear();
+    mNarrow.Assign( std::move( kmers ) );
+  }
+
+  void Assign( std::vector< uint64_t >&& kmers ) {
+    mWide = true;
+    mNarrow.Clear();
+    mWideKmers.Assign( std::move( kmers ) );
+  }
+
+  void Borrow( const uint32_t* data, const size_t size ) {
+    mWide = false;
+    mWideKmers.Clear();
+    mNarrow.Borrow( data, size );
+  }
+
+  void Borrow( const uint64_t* data, const size_t size ) {
+    mWide = true;
+    mNarrow.Clear();
+    mWideKmers.Borrow( data, size );
+  }
+
+  void Clear() {
+    mWide = false;
+    mNarrow.Clear();
+    mWideKmers.Clear();
+  }
+
+  inline Kmer operator[]( const size_t index ) const {
+    return mWide ? mWideKmers[ index ] : FromNarrow( mNarrow[ index ] );
+  }
+
+  // The count kmers from offset: in place when wide, widened into buffer
+  // otherwise
+  const Kmer* Range( const size_t offset, const size_t count,
+                     std::vector< Kmer >* buffer ) const {
+    if( mWide )
+      return mWideKmers.Data() + offset;
+
+    buffer->resize( count );
+    const uint32_t* narrow = mNarrow.Data() + offset;
+    for( size_t i = 0; i < count; i++ ) {
+      ( *buffer )[ i ] = FromNarrow( narrow[ i ] );
+    }
+    return buffer->data();
+  }
+
+  bool IsWide() const {
+    return mWide;
+  }
+
+  const IndexArray< uint32_t >& Narrow() const {
+    return mNarrow;
+  }
+
+  const IndexArray< uint64_t >& Wide() const {
+    return mWideKmers;
+  }
+
+  size_t Size() const {
+    return mWide ? mWideKmers.Size() : mNarrow.Size();
+  }
+
+  size_t SizeInBytes() const {
+    return mWide ? mWideKmers.SizeInBytes() : mNarrow.SizeInBytes();
+  }
+
+private:
+  bool                   mWide;
+  IndexArray< uint32_t > mNarrow;
+  IndexArray< uint64_t > mWideKmers;
+};
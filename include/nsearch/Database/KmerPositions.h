@@ -0,0 +1,91 @@
+#pragma once
+
+#include <cstdint>
+#include <cstddef>
+#include <vector>
+
+#include "Kmers.h"
+
+/*
+ * Positions of the kmers of one sequence by kmer (open addressing), to
+ * find the kmers two sequences share without comparing every pair of
+ * positions. Reused from sequence to sequence.
+ */
+class KmerPositions {
+public:
+  KmerPositions() : mShift( 64 ) {}
+
+  // Ambiguous kmers are left out
+  void Assign( const Kmer* kmers, const size_t count ) {
+    size_t bits = 4;
+    while( ( size_t( 1 ) << bits ) < 2 * count ) {
+      bits++;
+    }
+    mShift = 64 - bits;
+    mSlots.assign( size_t( 1 ) << bits, Slot{ AmbiguousKmer, 0, 0 } );
+
+    // Count, then lay out the positions of every kmer one after another
+    for( size_t pos = 0; pos < count; pos++ ) {
+      if( kmers[ pos ] == AmbiguousKmer )
+        continue;
+
+      Slot& slot = mSlots[ Probe( kmers[ pos ] ) ];
+      slot.kmer  = kmers[ pos ];
+      slot.count++;
+    }
+
+    uint32_t first = 0;
+    for( auto& slot : mSlots ) {
+      slot.first = first;
+      first += slot.count;
+      slot.count = 0;
+    }
+
+    mPositions.resize( first );
+    for( size_t pos = 0; pos < count; pos++ ) {
+      if( kmers[ pos ] == AmbiguousKmer )
+        continue;
+
+      Slot& slot = mSlots[ Probe( kmers[ pos ] ) ];
+      mPositions[ slot.first + slot.count++ ] = pos;
+    }
+  }
+
+  // Ascending positions of kmer, false if the sequence does not have it
+  bool Find( const Kmer kmer, const uint32_t** positions,
+             size_t* numPositions ) const {
+    if( kmer == AmbiguousKmer || mSlots.empty() )
+      return false;
+
+    const Slot& slot = mSlots[ Probe( kmer ) ];
+    if( slot.kmer != kmer )
+      return false;
+
+    *positions    = mPositions.data() + slot.first;
+    *numPositions = slot.count;
+    return true;
+  }
+
+private:
+  struct Slot {
+    Kmer     kmer; // AmbiguousKmer: empty
+    uint32_t first;
+    uint32_t count;
+  };
+
+  // Slot holding kmer, or the empty slot where it belongs
+  size_t Probe( const Kmer kmer ) const {
+    const size_t mask = mSlots.size() - 1;
+
+    size_t index = ( kmer * 0x9e3779b97f4a7c15ULL ) >> mShift;
+    while( mSlots[ index ].kmer != kmer &&
+           mSlots[ index ].kmer != AmbiguousKmer ) {
+      index = ( index + 1 ) & mask;
+    }
+    return index;
+  }
+
+  size_t                  mShift;
+  std::vector< Slot >     mSlots;
+  std::vector< uint32_t > mPositions;
+};
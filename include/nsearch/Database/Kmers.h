@@ -4,20 +4,119 @@
 #include "../Utils.h"
 
 #include <functional>
+#include <stdexcept>
+#include <string>
+#include <vector>
 
-using Kmer = uint32_t;
+using Kmer = uint64_t;
 const Kmer AmbiguousKmer = ( Kmer )-1;
 
+// Kmer of the reverse complement of the length residues in kmer (oldest
+// residue in the lowest bits), see BitMapComplementPolicy
+template < typename Alphabet >
+inline Kmer ReverseComplementKmer( const Kmer kmer, const size_t length ) {
+  const size_t numBits = BitMapPolicy< Alphabet >::NumBits;
+  const Kmer   mask    = ( Kmer( 1 ) << numBits ) - 1;
+
+  Kmer reverseComplement = 0;
+  for( size_t i = 0; i < length; i++ ) {
+    int8_t bits = ( kmer >> ( i * numBits ) ) & mask;
+    reverseComplement = ( reverseComplement << numBits ) |
+                        Kmer( BitMapComplementPolicy< Alphabet >::Complement( bits ) );
+  }
+  return reverseComplement;
+}
+
+// Spaced seed: residues at the '1' positions of the pattern make up the
+// kmer, those at '0' positions are skipped. E.g. 1101 gives 3-mers
+// spanning 4 residues, which still match across a mismatch at the third.
+class SeedPattern {
+public:
+  // Consecutive '1' positions
+  struct Run {
+    size_t offset;
+    size_t length;
+  };
+
+  SeedPattern( const std::string& pattern )
+      : mPattern( pattern ), mWeight( 0 ), mCareMask( 0 ) {
+    if( pattern.empty() || pattern.front() != '1' || pattern.back() != '1' ||
+        pattern.find_first_not_of( "01" ) != std::string::npos )
+      throw std::invalid_argument( "Seed pattern '" + pattern +
+                                   "' must consist of 0 and 1 and start "
+                                   "and end with 1" );
+    if( pattern.size() > sizeof( uint64_t ) * 8 )
+      throw std::invalid_argument( "Seed pattern '" + pattern + "' is too long" );
+
+    for( size_t pos = 0; pos < pattern.size(); pos++ ) {
+      if( pattern[ pos ] != '1' )
+        continue;
+
+      mWeight++;
+      mCareMask |= uint64_t( 1 ) << pos;
+      if( pos > 0 && pattern[ pos - 1 ] == '1' ) {
+        mRuns.back().length++;
+      } else {
+        mRuns.push_back( { pos, 1 } );
+      }
+    }
+  }
+
+  const std::string& String() const {
+    return mPattern;
+  }
+
+  size_t Span() const {
+    return mPattern.size();
+  }
+
+  size_t Weight() const {
+    return mWeight;
+  }
+
+  bool IsContiguous() const {
+    return mRuns.size() == 1;
+  }
+
+  // Bit i set for a '1' at position i
+  uint64_t CareMask() const {
+    return mCareMask;
+  }
+
+  const std::vector< Run >& Runs() const {
+    return mRuns;
+  }
+
+private:
+  std::string        mPattern;
+  size_t             mWeight;
+  uint64_t           mCareMask;
+  std::vector< Run > mRuns;
+};
+
 template< typename Alphabet >
 class Kmers {
 public:
   using Callback = const std::function< void( const Kmer, const size_t ) >;
 
-  Kmers( const Sequence< Alphabet >& ref, const size_t length ) : mRef( ref ) {
+  Kmers( const Sequence< Alphabet >& ref, const size_t length )
+      : mRef( ref ), mPattern( NULL ) {
     mLength = std::min( { length, mRef.Length(), sizeof( Kmer ) * 8 / BitMapPolicy< Alphabet >::NumBits } );
   }
 
+  // The pattern has to span at most 64 bits of residues. Sequences
+  // shorter than the pattern get a single ambiguous kmer.
+  Kmers( const Sequence< Alphabet >& ref, const SeedPattern& pattern )
+      : mRef( ref ), mPattern( &pattern ) {
+    mLength = std::min( pattern.Span(), mRef.Length() );
+  }
+
   void ForEach( const Callback& block ) const {
+    if( mPattern ) {
+      ForEachSpaced( block );
+      return;
+    }
+
     const char* ptr = mRef.sequence.data();
 
     auto bitIndex = []( const size_t pos ) {
@@ -36,7 +135,7 @@ public:
       if( val < 0 ) {
         lastAmbigIndex = k;
       } else {
-        kmer |= ( val << bitIndex( k ) );
+        kmer |= ( Kmer( val ) << bitIndex( k ) );
       }
       ptr++;
     }
@@ -55,7 +154,7 @@ public:
       if( val < 0 ) {
         lastAmbigIndex = frame + mLength - 1;
       } else {
-        kmer |= ( val << bitIndex( mLength - 1 ) );
+        kmer |= ( Kmer( val ) << bitIndex( mLength - 1 ) );
       }
 
       if( lastAmbigIndex == ( size_t ) -1 || frame > lastAmbigIndex ) {
@@ -71,6 +170,55 @@ public:
   }
 
 private:
+  // Slides a window of Span() residues along the sequence, the oldest
+  // residue in the lowest bits like for contiguous kmers, and gathers
+  // the runs of the pattern from it
+  void ForEachSpaced( const Callback& block ) const {
+    const size_t numBits = BitMapPolicy< Alphabet >::NumBits;
+    const size_t span    = mPattern->Span();
+
+    if( mRef.Length() < span ) {
+      block( AmbiguousKmer, 0 );
+      return;
+    }
+
+    auto lowBits = []( const size_t count ) {
+      return count >= sizeof( Kmer ) * 8 ? ~Kmer( 0 ) : ( Kmer( 1 ) << count ) - 1;
+    };
+
+    const char* ptr       = mRef.sequence.data();
+    Kmer        window    = 0;
+    uint64_t    ambiguous = 0; // one bit per residue of the window
+    for( size_t pos = 0; pos < mRef.Length(); pos++ ) {
+      int8_t val = BitMapPolicy< Alphabet >::BitMap( ptr[ pos ] );
+
+      window = ( window >> numBits ) |
+               ( Kmer( val < 0 ? 0 : val ) << ( ( span - 1 ) * numBits ) );
+      ambiguous =
+        ( ambiguous >> 1 ) | ( uint64_t( val < 0 ) << ( span - 1 ) );
+
+      if( pos + 1 < span )
+        continue;
+
+      const size_t frame = pos + 1 - span;
+      if( ambiguous & mPattern->CareMask() ) {
+        block( AmbiguousKmer, frame );
+        continue;
+      }
+
+      Kmer   kmer  = 0;
+      size_t shift = 0;
+      for( auto& run : mPattern->Runs() ) {
+        kmer |= ( ( window >> ( run.offset * numBits ) ) &
+                  lowBits( run.length * numBits ) )
+                << shift;
+        shift += run.length * numBits;
+      }
+      block( kmer, frame );
+    }
+  }
+
   size_t                      mLength;
   const Sequence< Alphabet >& mRef;
+  const SeedPattern*          mPattern;
 };
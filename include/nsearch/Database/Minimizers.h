@@ -0,0 +1,68 @@
+#pragma once
+
+#include <cstdint>
+#include <cstddef>
+#include <vector>
+
+#include "Kmers.h"
+
+/*
+ * ( w, k )-minimizers: of every w consecutive kmers the one with the
+ * smallest hash, the leftmost on ties. Two sequences sharing w + k - 1
+ * residues share the minimizer of that stretch, while only about 2 / ( w + 1 )
+ * of the kmers are selected.
+ */
+namespace Minimizers {
+
+// Invertible mix, so that the order does not favour kmers like AAAA
+static inline uint64_t Hash( Kmer kmer ) {
+  kmer ^= kmer >> 33;
+  kmer *= 0xff51afd7ed558ccdULL;
+  kmer ^= kmer >> 33;
+  kmer *= 0xc4ceb9fe1a85ec53ULL;
+  kmer ^= kmer >> 33;
+  return kmer;
+}
+
+// fn( kmer, pos ) for the minimizers of kmers[ 0, count ), in order and
+// every position once. Ambiguous kmers are never selected. With fewer
+// than window kmers the minimizer of all of them is selected.
+template < typename Fn >
+static void ForEach( const Kmer* kmers, const size_t count, const size_t window,
+                     const Fn& fn ) {
+  if( window <= 1 ) {
+    for( size_t pos = 0; pos < count; pos++ ) {
+      if( kmers[ pos ] != AmbiguousKmer )
+        fn( kmers[ pos ], pos );
+    }
+    return;
+  }
+
+  // Positions with ascending hashes, the front being the minimizer of
+  // the current window
+  std::vector< size_t >   queue( count );
+  std::vector< uint64_t > hashes( count );
+  size_t                  head = 0, tail = 0;
+  size_t                  last = ( size_t ) -1;
+
+  for( size_t pos = 0; pos < count; pos++ ) {
+    if( kmers[ pos ] != AmbiguousKmer ) {
+      hashes[ pos ] = Hash( kmers[ pos ] );
+      while( tail > head && hashes[ queue[ tail - 1 ] ] > hashes[ pos ] ) {
+        tail--;
+      }
+      queue[ tail++ ] = pos;
+    }
+    while( tail > head && queue[ head ] + window <= pos ) {
+      head++;
+    }
+
+    if( ( pos + 1 >= window || pos + 1 == count ) && tail > head &&
+        queue[ head ] != last ) {
+      last = queue[ head ];
+      fn( kmers[ last ], last );
+    }
+  }
+}
+
+} // namespace Minimizers
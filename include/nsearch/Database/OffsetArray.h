@@ -0,0 +1,82 @@
+#pragma once
+
+#include <cstdint>
+#include <limits>
+#include <vector>
+
+#include "IndexArray.h"
+
+// Row offsets into a flat array (CSR): row i spans [ offsets[ i ],
+// offsets[ i + 1 ] ). Stored with 32 bits per entry when the last offset
+// fits, with 64 bits otherwise.
+class OffsetArray {
+public:
+  OffsetArray() : mWide( false ) {}
+
+  void Assign( std::vector< uint64_t >&& offsets ) {
+    mWide = !offsets.empty() &&
+            offsets.back() > std::numeric_limits< uint32_t >::max();
+    if( mWide ) {
+      mNarrow.Clear();
+      mWideOffsets.Assign( std::move( offsets ) );
+    } else {
+      mWideOffsets.Clear();
+      mNarrow.Assign( std::vector< uint32_t >( offsets.begin(), offsets.end() ) );
+      offsets = std::vector< uint64_t >();
+    }
+  }
+
+  void Assign( std::vector< uint32_t >&& offsets ) {
+    mWide = false;
+    mWideOffsets.Clear();
+    mNarrow.Assign( std::move( offsets ) );
+  }
+
+  void Borrow( const uint32_t* data, const size_t size ) {
+    mWide = false;
+    mWideOffsets.Clear();
+    mNarrow.Borrow( data, size );
+  }
+
+  void Borrow( const uint64_t* data, const size_t size ) {
+    mWide = true;
+    mNarrow.Clear();
+    mWideOffsets.Borrow( data, size );
+  }
+
+  void Clear() {
+    mWide = false;
+    mNarrow.Clear();
+    mWideOffsets.Clear();
+  }
+
+  inline uint64_t operator[]( const size_t index ) const {
+    return mWide ? mWideOffsets[ index ] : mNarrow[ index ];
+  }
+
+  bool IsWide() const {
+    return mWide;
+  }
+
+  const IndexArray< uint32_t >& Narrow() const {
+    return mNarrow;
+  }
+
+  const IndexArray< uint64_t >& Wide() const {
+    return mWideOffsets;
+  }
+
+  // Number of offsets, i.e. number of rows + 1
+  size_t Size() const {
+    return mWide ? mWideOffsets.Size() : mNarrow.Size();
+  }
+
+  size_t SizeInBytes() const {
+    return mWide ? mWideOffsets.SizeInBytes() : mNarrow.SizeInBytes();
+  }
+
+private:
+  bool                   mWide;
+  IndexArray< uint32_t > mNarrow;
+  IndexArray< uint64_t > mWideOffsets;
+};
@@ -13,6 +13,13 @@ struct BaseSearchParams {
   int   maxAccepts  = 1;
   int   maxRejects  = 16;
   float minIdentity = 0.75f;
+
+  // Skip the targets whose length alone rules out minIdentity: with the
+  // terminal gaps counted, the identity is at most the ratio of the
+  // shorter to the longer length. Off by default, since the identity of
+  // hits leaves out terminal gaps, so that e.g. a target contained in
+  // the query can be a hit whatever its length.
+  bool lengthFilter = false;
 };
 
 template < typename Alphabet >
@@ -21,6 +28,44 @@ struct SearchParams : public BaseSearchParams {};
 template <>
 struct SearchParams< DNA > : public BaseSearchParams {
   DNA::Strand strand = DNA::Strand::Plus;
+
+  // With DNA::Strand::Both, rank the candidates of both strands together
+  // instead of searching one strand after the other
+  bool jointStrands = false;
+
+  // Skip the candidates whose edit distance to the query rules out
+  // minIdentity, before any of their alignment is done. The distance is
+  // computed bit-parallel, with the shorter of query and candidate
+  // aligned from end to end and free terminal gaps in the longer one.
+  // Off by default, since a hit whose terminal gaps are in the shorter
+  // sequence can be skipped.
+  bool editDistanceFilter = false;
+};
+
+// What searches did with their candidates, summed over queries
+struct SearchStats {
+  size_t numQueries    = 0;
+  size_t numCandidates = 0; // aligned to a query
+  size_t numAccepted   = 0;
+  size_t numRejected   = 0;
+
+  // Rejected candidates whose alignment was given up on before it was
+  // complete, as it could no longer reach minIdentity
+  size_t numAbandoned = 0;
+
+  // Rejected candidates skipped by SearchParams::editDistanceFilter,
+  // without being aligned
+  size_t numPrefiltered = 0;
+
+  SearchStats& operator+=( const SearchStats& other ) {
+    numQueries += other.numQueries;
+    numCandidates += other.numCandidates;
+    numAccepted += other.numAccepted;
+    numRejected += other.numRejected;
+    numAbandoned += other.numAbandoned;
+    numPrefiltered += other.numPrefiltered;
+    return *this;
+  }
 };
 
 template < typename Alphabet >
@@ -46,6 +91,10 @@ template < typename Alphabet >
 using SearchForHitsCallback =
   std::function< void( const Sequence< Alphabet >&, const Cigar& ) >;
 
+template < typename Alphabet >
+using SearchForHitsBothStrandsCallback = std::function< void(
+  const Sequence< Alphabet >&, const Cigar&, const DNA::Strand ) >;
+
 template < typename Alphabet >
 class Search {
 public:
@@ -55,6 +104,7 @@ public:
 
   inline HitList< Alphabet > Query( const Sequence< Alphabet >& query ) {
     HitList< Alphabet > hits;
+    mStats.numQueries++;
 
     SearchForHits(
       query, [&]( const Sequence< Alphabet >& target, const Cigar& alignment ) {
@@ -64,13 +114,28 @@ public:
     return hits;
   }
 
+  // Statistics of the queries since the last reset
+  const SearchStats& Stats() const {
+    return mStats;
+  }
+
+  void ResetStats() {
+    mStats = SearchStats();
+  }
+
 protected:
   virtual void
   SearchForHits( const Sequence< Alphabet >&              query,
                  const SearchForHitsCallback< Alphabet >& callback ) = 0;
 
+  virtual void SearchForHitsBothStrands(
+    const Sequence< Alphabet >&                         query,
+    const Sequence< Alphabet >&                         reverseComplement,
+    const SearchForHitsBothStrandsCallback< Alphabet >& callback ) = 0;
+
   const Database< Alphabet >&     mDB;
   const SearchParams< Alphabet >& mParams;
+  SearchStats                     mStats;
 };
 
 /*
@@ -79,9 +144,20 @@ protected:
 template <>
 inline HitList< DNA > Search< DNA >::Query( const Sequence< DNA >& query ) {
   HitList< DNA > hits;
+  mStats.numQueries++;
 
   auto strand = mParams.strand;
 
+  if( strand == DNA::Strand::Both && mParams.jointStrands ) {
+    SearchForHitsBothStrands(
+      query, query.Reverse().Complement(),
+      [&]( const Sequence< DNA >& target, const Cigar& alignment,
+           const DNA::Strand hitStrand ) {
+        hits.push_back( { target, alignment, hitStrand } );
+      } );
+    return hits;
+  }
+
   if( strand == DNA::Strand::Plus || strand == DNA::Strand::Both ) {
     SearchForHits(
       query, [&]( const Sequence< DNA >& target, const Cigar& alignment ) {
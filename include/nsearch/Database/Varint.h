@@ -0,0 +1,38 @@
+#pragma once
+
+#include <cstdint>
+#include <cstddef>
+
+// LEB128: seven bits per byte, high bit set on all but the last byte
+namespace Varint {
+
+static inline size_t EncodedSize( uint32_t value ) {
+  size_t size = 1;
+  while( value >= 0x80 ) {
+    value >>= 7;
+    size++;
+  }
+  return size;
+}
+
+static inline uint8_t* Encode( uint32_t value, uint8_t* out ) {
+  while( value >= 0x80 ) {
+    *out++ = uint8_t( value ) | 0x80;
+    value >>= 7;
+  }
+  *out++ = uint8_t( value );
+  return out;
+}
+
+static inline const uint8_t* Decode( const uint8_t* in, uint32_t* value ) {
+  uint32_t result = 0;
+  int      shift  = 0;
+  while( *in & 0x80 ) {
+    result |= uint32_t( *in++ & 0x7f ) << shift;
+    shift += 7;
+  }
+  *value = result | ( uint32_t( *in++ ) << shift );
+  return in;
+}
+
+} // namespace Varint
@@ -29,7 +29,8 @@ public:
       sequence += line;
     }
 
-    UpcaseString( sequence );
+    if( mUpcase )
+      UpcaseString( sequence );
     seq = Sequence< Alphabet >( identifier.substr( 1 ), sequence );
 
     return *this;
@@ -37,6 +38,7 @@ public:
 
 private:
   using SequenceReader< Alphabet >::mTextReader;
+  using SequenceReader< Alphabet >::mUpcase;
 
   std::string mLastLine;
 };
@@ -18,14 +18,17 @@ public:
     // delete '>'
     seq.identifier.erase( seq.identifier.begin(), seq.identifier.begin() + 1 );
 
-    UpcaseString( seq.sequence ); // atc -> ATC
-    UpcaseString( seq.quality );
+    if( mUpcase ) {
+      UpcaseString( seq.sequence ); // atc -> ATC
+      UpcaseString( seq.quality );
+    }
 
     return *this;
   }
 
 private:
   using SequenceReader< Alphabet >::mTextReader;
+  using SequenceReader< Alphabet >::mUpcase;
 };
 
 } // namespace FASTQ
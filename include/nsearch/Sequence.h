@@ -85,14 +85,14 @@ Sequence< A >::Sequence() : Sequence( "", "", "" ) {}
 
 template < typename A >
 Sequence< A >::Sequence( const Sequence& sequence )
-    : sequence( sequence.sequence ), identifier( sequence.identifier ),
-      quality( sequence.quality ) {}
+    : identifier( sequence.identifier ), quality( sequence.quality ),
+      sequence( sequence.sequence ) {}
 
 template < typename A >
 Sequence< A >::Sequence( Sequence< A >&& sequence )
-    : sequence( std::move( sequence.sequence ) ),
-      identifier( std::move( sequence.identifier ) ),
-      quality( std::move( sequence.quality ) ) {}
+    : identifier( std::move( sequence.identifier ) ),
+      quality( std::move( sequence.quality ) ),
+      sequence( std::move( sequence.sequence ) ) {}
 
 template < typename A >
 Sequence< A >& Sequence< A >::operator=( const Sequence< A >& other ) {
@@ -121,7 +121,7 @@ Sequence< A >::Sequence(
   const std::string&                               identifier,
   const std::basic_string< typename A::CharType >& sequence,
   const std::string&                               quality )
-    : identifier( identifier ), sequence( sequence ), quality( quality ) {}
+    : identifier( identifier ), quality( quality ), sequence( sequence ) {}
 
 template < typename A >
 size_t Sequence< A >::Length() const {
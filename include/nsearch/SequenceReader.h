@@ -27,6 +27,11 @@ public:
     return mTextReader->NumBytesTotal();
   }
 
+  // Sequences are upper-cased as they are read, unless switched off
+  void SetUpcase( const bool upcase ) {
+    mUpcase = upcase;
+  }
+
   virtual SequenceReader< Alphabet >& operator>>( Sequence< Alphabet >& seq ) = 0;
 
   void Read( const size_t count, SequenceList< Alphabet >* out ) {
@@ -42,4 +47,5 @@ public:
 
 protected:
   std::unique_ptr< TextReader > mTextReader;
+  bool                          mUpcase = true;
 };
@@ -0,0 +1,28 @@
+#pragma once
+
+#if defined( __GNUC__ ) && ( defined( __x86_64__ ) || defined( __i386__ ) )
+#define NSEARCH_X86_SIMD
+#include <immintrin.h>
+#endif
+
+// Vector instruction sets kernels are written for, in increasing order
+enum class SimdLevel { None, SSE41, AVX2 };
+
+// The highest level the CPU (and OS) supports, detected once at runtime.
+// Kernels for higher levels are compiled with per-function target
+// attributes, so that the extension itself runs on any x86-64 CPU.
+inline SimdLevel CpuSimdLevel() {
+#ifdef NSEARCH_X86_SIMD
+  static const SimdLevel level = []() {
+    __builtin_cpu_init();
+    if( __builtin_cpu_supports( "avx2" ) )
+      return SimdLevel::AVX2;
+    if( __builtin_cpu_supports( "sse4.1" ) )
+      return SimdLevel::SSE41;
+    return SimdLevel::None;
+  }();
+  return level;
+#else
+  return SimdLevel::None;
+#endif
+}
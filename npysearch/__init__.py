@@ -1,5 +1,9 @@
 from _npysearch import *
+import asyncio
+import functools
 import os
+import warnings
+from itertools import islice
 from time import localtime, strftime
 
 
@@ -47,7 +51,8 @@ def cigarString(query, target):
 
 def readFasta(filepath):
     """
-    Simple FASTA file reader
+    FASTA file reader, also reading FASTQ files (by the .fq/.fastq
+    extension). Parsing is done in C++ with a buffered reader.
 
     Input
     -----
@@ -56,26 +61,38 @@ def readFasta(filepath):
     Output
     ------
     sequences = dict, keys = sequence id, values = sequence. Both keys
-                and values are strings.
+                and values are strings. Sequences are as they are in
+                the file (searches upper-case them).
     """
 
     # Ensure file exists
     if not os.path.isfile(filepath):
         raise IOError("File does not exist.")
 
-    sequences = {}
-    with open(filepath, 'r') as f:
-        lines = f.readlines()
-        for line in lines:
-            if line.strip()[0] == ">":
-                current_sequence = line.strip()[1:]
-                sequences[current_sequence] = ""
-            elif line.strip() == "":
-                continue
-            else:
-                sequences[current_sequence] += line.strip()
+    return read_fasta(filepath)
+
+def iterFasta(filepath):
+    """
+    Lazy FASTA file reader, also reading FASTQ files (by the .fq/.fastq
+    extension). Only a small batch of sequences is held in memory at a
+    time.
+
+    Input
+    -----
+    filepath  = str, path to the fasta file to be read
+    
+    Output
+    ------
+    iterator of (sequence id, sequence) tuples of strings, in file
+    order. Sequences are as they are in the file (searches upper-case
+    them).
+    """
+
+    # Ensure file exists
+    if not os.path.isfile(filepath):
+        raise IOError("File does not exist.")
 
-    return sequences
+    return iter_fasta(filepath)
 
 def writeFasta(filepath, sequences, wrapAfter = 0):
     """
@@ -119,6 +136,11 @@ def writeCSV(filepath, csvPath):
     """
     Function to read the text output file from the dna_blast and 
     protein_blast functions written in C++
+
+    Deprecated: hits are collected in C++, and written as CSV directly
+    by dna_blast, protein_blast and Database.search (outputToFile). This
+    parser only reads ALNOUT files with exactly one hit per query, and
+    will be removed in a future release.
     
     Input
     -----
@@ -131,6 +153,10 @@ def writeCSV(filepath, csvPath):
     None
     """
     
+    warnings.warn("writeCSV is deprecated, write CSV output directly with "
+                  "Database.search(outputToFile = True) or a .csv outputPath",
+                  DeprecationWarning, stacklevel = 2)
+
     # Column names for the csv file
     header = ["QueryId", "TargetId", "QueryMatchStart",
               "QueryMatchEnd", "TargetMatchStart", "TargetMatchEnd",
@@ -182,8 +208,15 @@ def readCSV(filepath):
     ------
     dictionary = dict, keys = column names, values = columns. 
                  Contains 5 str, 8 int, and 1 float columns.
+
+    Deprecated: blast and Database.search return the results as a dict
+    of columns already. Will be removed in a future release.
     """
 
+    warnings.warn("readCSV is deprecated, blast and Database.search return "
+                  "the results as a dict of columns",
+                  DeprecationWarning, stacklevel = 2)
+
     with open(filepath, "r") as f:
         # Column names
         header = f.readline().strip().split(",")
@@ -205,21 +238,379 @@ def readCSV(filepath):
     return dictionary
 
 
+def setThreadPoolSize(size = 0):
+    """
+    Resizes the thread pool shared by all searches. The pool is created
+    with one thread per core and kept alive between calls; use the
+    threads argument of the search functions to limit single searches.
+
+    Input
+    -----
+    size      = int, number of threads, 0 for one per core (Default = 0)
+
+    Output
+    ------
+    None
+    """
+
+    assert isinstance(size, int) and size >= 0, "size must be a whole number of type int."
+    set_thread_pool_size(size)
+    return None
+
+def threadPoolInfo():
+    """
+    Reports the state of the thread pool shared by all searches
+
+    Output
+    ------
+    info      = dict, "size" (number of threads), "busy" (threads
+                currently running a search task) and "queued" (tasks
+                waiting for a thread)
+    """
+
+    return thread_pool_info()
+
+
+class Database:
+    """
+    Sequence database that is read and indexed once, and can then be
+    searched repeatedly with different queries without rebuilding the
+    kmer index
+
+    Input
+    -----
+    database     = dict, list or str. Either a dictionary of sequences
+                   with sequence ids as keys and sequences as values, a
+                   list of (sequence id, sequence) tuples, or a path str
+                   to the fasta file containing the sequences. Sequences
+                   may be str or bytes-like objects
+    alphabet     = str, "nucleotide" or "protein" to specify the 
+                   database alphabet (Default = "nucleotide")
+    threads      = int, number of threads used to build the kmer index,
+                   0 for one per core (Default = 0)
+    compress     = boolean, set to True to store the lists of sequences
+                   per kmer delta encoded. Takes less memory, at the
+                   cost of decoding them while searching (Default = False)
+    wordSize     = int, None or "auto", length of the kmers indexed. None
+                   uses 8 for nucleotide and 5 for protein databases.
+                   "auto" picks a longer word for large databases, so
+                   that fewer sequences share each kmer, as long as the
+                   kmer table fits in targetMemory (Default = None)
+    sparse       = boolean or None. A sparse index keeps only the kmers
+                   found in the database, sorted, instead of a table with
+                   a slot for every possible kmer. Required for long words
+                   (up to 31 for nucleotide, 15 for protein). None uses a
+                   sparse index when the table would exceed targetMemory
+                   (Default = None)
+    targetMemory = int, memory in bytes building the kmer table may take
+                   with wordSize = "auto" or sparse = None, 8 bytes per
+                   possible kmer unless the database has billions of
+                   residues (Default = 1 GiB)
+    seeds        = str, list of str or None. Spaced seed patterns of 1s
+                   (positions that must match) and 0s (positions that
+                   may differ), e.g. "11011011", used instead of
+                   contiguous kmers. Several patterns need the same
+                   number of 1s, which becomes the word size. Excludes
+                   wordSize (Default = None)
+    minimizerWindow = int, index only the minimizer of every
+                   minimizerWindow consecutive kmers (the one with the
+                   smallest hash), about 2 / (minimizerWindow + 1) of
+                   them. A smaller index with shorter lookups, at some
+                   loss of sensitivity for distant hits. 1 indexes every
+                   kmer (Default = 1)
+    maxKmerOccurrences = int or None, mask kmers found in more than
+                   this many sequences, such as poly-A stretches or
+                   primer regions shared by a whole amplicon database.
+                   Their lists of sequences are dropped from the index,
+                   which bounds the work per query kmer. None masks
+                   nothing (Default = None)
+    """
+
+    def __init__(self, database, alphabet = "nucleotide", threads = 0,
+                 compress = False, wordSize = None, sparse = None,
+                 targetMemory = 1 << 30, seeds = None,
+                 minimizerWindow = 1, maxKmerOccurrences = None):
+        if alphabet not in ("nucleotide", "protein"):
+            raise ValueError("alphabet must be 'nucleotide' or 'protein'")
+        self.alphabet = alphabet
+
+        # Checking what form the database was input in
+        # str for path to fasta file, dict or list of (id, sequence)
+        # pairs for sequences kept in memory
+        if type(database) == str:
+            # Ensure file exists
+            if not os.path.isfile(database):
+                raise IOError("Database file does not exist.")
+
+        elif not isinstance(database, (dict, list, tuple)):
+            raise TypeError("database must be of type string, dict or list")
+
+        if alphabet == "nucleotide":
+            self._db = DNADatabase(database, threads, compress, wordSize,
+                                   sparse, targetMemory, seeds,
+                                   minimizerWindow, maxKmerOccurrences)
+        else:
+            self._db = ProteinDatabase(database, threads, compress, wordSize,
+                                       sparse, targetMemory, seeds,
+                                       minimizerWindow, maxKmerOccurrences)
+
+    @classmethod
+    def load(cls, indexPath, mmap = True, verify = False):
+        """
+        Loads a database index written by Database.save, without
+        reading or indexing the sequences again
+
+        Input
+        -----
+        indexPath    = str, path to the index file
+        mmap         = boolean, set to True to memory map the kmer index
+                       arrays so that they are shared between processes,
+                       False to read them into memory. The sequences are
+                       read into memory either way, and every array is
+                       checked once, so loading takes time in proportion
+                       to the database size (Default = True)
+        verify       = boolean, set to True to check the index file
+                       checksum before using it (Default = False)
+
+        Output
+        ------
+        db           = Database, with the alphabet stored in the index
+        """
+
+        # Ensure file exists
+        if not os.path.isfile(indexPath):
+            raise IOError("Index file does not exist.")
+
+        db = cls.__new__(cls)
+        db._db = load_database(indexPath, mmap, verify)
+        db.alphabet = "nucleotide" if isinstance(db._db, DNADatabase) else "protein"
+        return db
+
+    def stream(self, maxAccepts = 1, maxRejects = 16, minIdentity = 0.75,
+               strand = "both", threads = 0, lengthFilter = False,
+               editDistanceFilter = False):
+        """
+        Opens a search stream on this database, see iterBlast
+        """
+
+        if self.alphabet == "nucleotide":
+            return self._db.stream(maxAccepts, maxRejects, minIdentity, strand, threads,
+                                   lengthFilter, editDistanceFilter)
+        else:
+            return self._db.stream(maxAccepts, maxRejects, minIdentity, threads,
+                                   lengthFilter)
+
+    def save(self, indexPath):
+        """
+        Writes the kmer index and the sequences to a file, which can be
+        loaded with Database.load
+
+        Input
+        -----
+        indexPath    = str, path to the index file to be written
+
+        Output
+        ------
+        None
+        """
+
+        self._db.save(indexPath)
+        return None
+
+    def memoryUsage(self):
+        """
+        Reports the memory taken by the kmer index
+
+        Output
+        ------
+        usage        = dict with the layout ("csr", or "csr+varint" for
+                       a compressed database) and the bytes taken by
+                       the offsets, postings (sequences per kmer), kmers
+                       (kmers per sequence), sparseKmers (kmers of a
+                       sparse index) and in total. "legacy" holds the
+                       same figures for the previous index layout with
+                       separate offset and count arrays, None for a
+                       sparse index
+        """
+
+        return self._db.memory_usage()
+
+    def indexStats(self):
+        """
+        Reports how the kmer index is populated
+
+        Output
+        ------
+        stats        = dict with the wordSize, the seeds (None for
+                       contiguous kmers), whether the index is
+                       sparse, the minimizerWindow, the
+                       maxKmerOccurrences cap with the number of
+                       maskedKmers and maskedPostings, the number of kmerSlots and of usedKmers
+                       (found in any sequence), the number of postings
+                       (sequences per kmer), the meanPostingLength of the
+                       used kmers and the indexSize in bytes
+        """
+
+        return self._db.index_stats()
+
+    def searchStats(self, reset = False):
+        """
+        Reports what the searches of this database did with their
+        candidates, summed over all searches since the database was
+        created, loaded or last reset
+
+        Input
+        -----
+        reset        = boolean, set to True to reset the counts after
+                       reading them (Default = False)
+
+        Output
+        ------
+        stats        = dict with the number of queries searched, of
+                       candidates aligned, of those accepted and
+                       rejected, of rejected candidates abandoned
+                       before their alignment was complete, because it
+                       could no longer reach minIdentity, and of
+                       candidates rejected by editDistanceFilter without
+                       being aligned ("prefiltered")
+        """
+
+        return self._db.search_stats(reset)
+
+    def __len__(self):
+        return len(self._db)
+
+    @property
+    def wordSize(self):
+        return self._db.wordSize
+
+    def search(self, query, maxAccepts = 1, maxRejects = 16,
+               minIdentity = 0.75, strand = "both", outputToFile = False,
+               threads = 0, lengthFilter = False,
+               editDistanceFilter = False):
+        """
+        Runs BLAST sequence comparison algorithm against this database
+
+        Input
+        -----
+        query        = dict, list or str. Either a dictionary of sequences
+                       with sequence ids as keys and sequences as values,
+                       a list of (sequence id, sequence) tuples, or a path
+                       str to the fasta file containing the sequences
+        maxAccepts   = int, number specifying the maximum accepted hits.
+                       Candidates sharing equally many kmers with the
+                       query are tried in database order, so of equally
+                       good hits the earliest in the database are
+                       reported (Default = 1)
+        maxRejects   = int, number specifying the maximum rejected hits 
+                       (Default = 16)
+        minIdentity  = float, number specifying the minimal accepted 
+                       sequence similarity between the query and database
+                       sequences (Default = 0.75)
+        strand       = str, specify the strand to search: "plus", "minus",
+                       or "both". Only affects nucleotide searches. 
+                       "joint" searches both strands in one pass, ranking
+                       their candidates together so that maxAccepts and
+                       maxRejects apply across both strands
+                       (Default = "both")
+        outputToFile = boolean, set to True to get the results table as a
+                       csv file in the working directory and False to 
+                       return the results as a dictionary of columns
+                       (Default = False)
+        threads      = int, maximum number of threads of the shared
+                       thread pool used for the search, 0 for all of
+                       them (Default = 0)
+        lengthFilter = boolean, set to True to skip database sequences
+                       whose length alone rules out minIdentity, i.e.
+                       shorter than minIdentity times the query length
+                       or longer than the query length divided by
+                       minIdentity. Hits leave terminal gaps out of the
+                       identity, so this can drop hits where one
+                       sequence is contained in the other
+                       (Default = False)
+        editDistanceFilter = boolean, set to True to skip candidates
+                       whose edit distance to the query rules out
+                       minIdentity before aligning them. The distance
+                       aligns the shorter sequence from end to end, so
+                       this can drop hits with terminal gaps in the
+                       shorter sequence. Only affects nucleotide
+                       searches (Default = False)
+        
+        Output
+        ------
+        table        = dict of columns, see blast
+            OR
+
+        csvPath      = str, path to the csv file containing the results, 
+                       stored in the working directory
+        """
+
+        # Checking what form the query was input in
+        # str for path to fasta file, dict or list of (id, sequence)
+        # pairs for sequences kept in memory
+        if type(query) == str:
+            # Ensure file exists
+            if not os.path.isfile(query):
+                raise IOError("Query file does not exist.")
+
+        elif not isinstance(query, (dict, list, tuple)):
+            raise TypeError("query must be of type string, dict or list")
+
+        if outputToFile:
+            outputPath = "output_" + strftime("%Y-%m-%d-%H:%M:%S", localtime()) + ".csv"
+        else:
+            outputPath = None
+
+        if self.alphabet == "nucleotide":
+            table = self._db.search(query, outputPath, maxAccepts, maxRejects, minIdentity, strand, threads,
+                                    lengthFilter, editDistanceFilter)
+        else:
+            table = self._db.search(query, outputPath, maxAccepts, maxRejects, minIdentity, threads,
+                                    lengthFilter)
+
+        if outputToFile:
+            return outputPath
+        else:
+            return table
+
+    async def searchAsync(self, query, maxAccepts = 1, maxRejects = 16,
+                          minIdentity = 0.75, strand = "both",
+                          outputToFile = False, threads = 0,
+                          lengthFilter = False, editDistanceFilter = False,
+                          executor = None):
+        """
+        Coroutine version of search. The search runs in executor (the
+        event loop's default thread pool if None) without holding the
+        GIL, so the event loop keeps serving other tasks meanwhile.
+        Arguments and output are the same as for search.
+        """
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            executor, functools.partial(self.search, query, maxAccepts,
+                                        maxRejects, minIdentity, strand,
+                                        outputToFile, threads,
+                                        lengthFilter, editDistanceFilter))
+
 
 def blast(query, database, maxAccepts = 1, maxRejects = 16, 
           minIdentity = 0.75, alphabet = "nucleotide", strand = "both",
-          outputToFile = False):
+          outputToFile = False, threads = 0, wordSize = None,
+          lengthFilter = False, editDistanceFilter = False):
     """
     Runs BLAST sequence comparison algorithm
 
+    To search many queries against the same database, build a Database
+    once and call its search method instead; blast indexes the database
+    on every call.
+
     Input
     -----
-    query        = dict or str. Either a dictionary of sequences with 
-                   sequence ids as keys and sequences as values, or a
-                   path str to the fasta file containing the sequences
-    database     = dict or str. Either a dictionary of sequences with
-                   sequence ids as keys and sequences as values, or a
-                   path str to the fasta file containing the sequences
+    query        = dict, list or str. Either a dictionary of sequences
+                   with sequence ids as keys and sequences as values, a
+                   list of (sequence id, sequence) tuples, or a path str
+                   to the fasta file containing the sequences
+    database     = dict, list or str. Same forms as query
     maxAccepts   = int, number specifying the maximum accepted hits 
                    (Default = 1)
     maxRejects   = int, number specifying the maximum rejected hits 
@@ -231,17 +622,29 @@ def blast(query, database, maxAccepts = 1, maxRejects = 16,
                    and database alphabet (Default = "nucleotide")
     strand       = str, specify the strand to search: "plus", "minus",
                    or "both". Only affects nucleotide searches. 
+                   "joint" searches both strands in one pass, ranking
+                   their candidates together so that maxAccepts and
+                   maxRejects apply across both strands
                    (Default = "both")
     outputToFile = boolean, set to True to get the results table as a
                    csv file in the working directory and False to 
-                   return the results as a dictionary of lists
+                   return the results as a dictionary of columns
                    (Default = False)
+    threads      = int, maximum number of threads of the shared thread
+                   pool used for the search, 0 for all of them. See
+                   setThreadPoolSize. Also the number of threads used
+                   to index the database (Default = 0)
+    wordSize     = int, None or "auto", see Database (Default = None)
+    lengthFilter = boolean, see Database.search (Default = False)
+    editDistanceFilter = boolean, see Database.search (Default = False)
     
     Output
     ------
-    table        = dict of lists, results table in the form of a dict
-                   of lists with column names as keys and columns as 
-                   values. Contains 5 str, 8 int, and 1 float columns.
+    table        = dict of columns, results table with column names as
+                   keys and columns as values, one row per hit in query
+                   order. The 5 str columns are lists of str, the 8 int
+                   (int64) and 1 float (float64) columns are NumPy 
+                   arrays, or array.array if NumPy is not installed.
                    Can be converted easily to a pandas dataframe using
                    pandas.DataFrame.from_dict()
         OR
@@ -250,62 +653,110 @@ def blast(query, database, maxAccepts = 1, maxRejects = 16,
                    stored in the working directory
     """
 
-    startTime = strftime("%Y-%m-%d-%H:%M:%S", localtime())
-    
-    # Checking what form the query was input in
-    # str for path to fasta file and dict for sequences
-    # If dict, write to file
-    if type(query) == str:
-        queryPath = query
-        # Ensure file exists
-        if not os.path.isfile(queryPath):
-            raise IOError("Query file does not exist.")
-
-    elif type(query) == dict:
-        queryPath = "query_" + startTime + ".fasta"
-        writeFasta(queryPath, query)
-    
-    else:
-        raise TypeError("query must be of type string or dict")
-
-    # Checking what form the database was input in
-    # str for path to fasta file and dict for sequences
-    # If dict, write to file
-    if type(database) == str:
-        databasePath = database
-        # Ensure file exists
-        if not os.path.isfile(databasePath):
-            raise IOError("Database file does not exist.")
+    db = Database(database, alphabet, threads, wordSize = wordSize)
+    return db.search(query, maxAccepts, maxRejects, minIdentity, strand,
+                     outputToFile, threads, lengthFilter,
+                     editDistanceFilter)
 
-    elif type(database) == dict:
-        databasePath = "database_" + startTime + ".fasta"
-        writeFasta(databasePath, database)
-    
-    else:
-        raise TypeError("database must be of type string or dict")
-
-    outputPath = "output_" + startTime + ".txt"
+def iterBlast(query, database, maxAccepts = 1, maxRejects = 16,
+              minIdentity = 0.75, alphabet = "nucleotide", strand = "both",
+              chunkSize = 10000, maxPending = 2, threads = 0,
+              wordSize = None, lengthFilter = False,
+              editDistanceFilter = False):
+    """
+    Runs BLAST sequence comparison algorithm and yields the hits query by
+    query, while the following queries are searched in the background.
+    Queries are pulled from query in chunks of chunkSize, and at most
+    maxPending chunks are in flight, so memory use stays bounded however
+    many queries there are.
 
-    if alphabet == "nucleotide":
-        dna_blast(queryPath, databasePath, outputPath, maxAccepts, maxRejects, minIdentity, strand)
-    elif alphabet == "protein":
-        protein_blast(queryPath, databasePath, outputPath, maxAccepts, maxRejects, minIdentity)
+    Input
+    -----
+    query        = dict, iterable or str. Either a dictionary of sequences
+                   with sequence ids as keys and sequences as values, an
+                   iterable (e.g. a generator) of (sequence id, sequence)
+                   tuples, or a path str to the fasta file containing the
+                   sequences
+    database     = Database, dict, list or str. Either an already indexed
+                   Database, or any database input accepted by blast
+    maxAccepts   = int, see blast (Default = 1)
+    maxRejects   = int, see blast (Default = 16)
+    minIdentity  = float, see blast (Default = 0.75)
+    alphabet     = str, see blast. Ignored if database is a Database
+                   (Default = "nucleotide")
+    strand       = str, see blast (Default = "both")
+    chunkSize    = int, number of queries searched per chunk
+                   (Default = 10000)
+    maxPending   = int, number of chunks searched ahead of the consumer
+                   (Default = 2)
+    threads      = int, see blast (Default = 0)
+    wordSize     = int, None or "auto", see Database. Ignored if
+                   database is a Database (Default = None)
+    lengthFilter = boolean, see Database.search (Default = False)
+    editDistanceFilter = boolean, see Database.search (Default = False)
 
-    csvPath = "output_" + strftime("%Y-%m-%d-%H:%M:%S", localtime()) + ".csv"
-    writeCSV(outputPath, csvPath)
+    Output
+    ------
+    generator of (queryId, hits) tuples, in query order. Queries without
+    hits are skipped. hits is a dict of columns like the blast results
+    table, restricted to the rows of that query.
+    """
 
-    # Delete query, database, and output files, if they were 
-    # constructed in this function
-    if type(query) == dict:
-        os.remove(queryPath)
-    if type(database) == dict:
-        os.remove(databasePath)
+    assert isinstance(chunkSize, int) and chunkSize > 0, "chunkSize must be a positive int."
+    assert isinstance(maxPending, int) and maxPending > 0, "maxPending must be a positive int."
 
-    os.remove(outputPath)
+    if not isinstance(database, Database):
+        database = Database(database, alphabet, threads, wordSize = wordSize)
 
-    if outputToFile:
-        return csvPath
+    if type(query) == str:
+        queries = iterFasta(query)
+    elif isinstance(query, dict):
+        queries = iter(query.items())
     else:
-        table = readCSV(csvPath)
-        os.remove(csvPath)
-        return table
\ No newline at end of file
+        queries = iter(query)
+
+    stream = database.stream(maxAccepts, maxRejects, minIdentity, strand,
+                             threads, lengthFilter, editDistanceFilter)
+
+    def enqueueChunk():
+        chunk = list(islice(queries, chunkSize))
+        if chunk:
+            stream.enqueue(chunk)
+        return len(chunk) > 0
+
+    while len(stream) < maxPending and enqueueChunk():
+        pass
+
+    while len(stream) > 0:
+        queryIds, numHitsByQuery, columns = stream.next()
+
+        # Keep the workers busy while this chunk is consumed
+        enqueueChunk()
+
+        start = 0
+        for queryId, numHits in zip(queryIds, numHitsByQuery):
+            if numHits > 0:
+                end = start + numHits
+                yield queryId, {key : column[start:end] for key, column in columns.items()}
+                start = end
+
+async def blastAsync(query, database, maxAccepts = 1, maxRejects = 16,
+                     minIdentity = 0.75, alphabet = "nucleotide",
+                     strand = "both", outputToFile = False, threads = 0,
+                     wordSize = None, lengthFilter = False,
+                     editDistanceFilter = False, executor = None):
+    """
+    Coroutine version of blast, for use from asyncio code. Indexing and
+    search run in executor (the event loop's default thread pool if
+    None) without holding the GIL, so the event loop keeps serving
+    other tasks meanwhile. Arguments and output are the same as for
+    blast.
+    """
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        executor, functools.partial(blast, query, database, maxAccepts,
+                                    maxRejects, minIdentity, alphabet,
+                                    strand, outputToFile, threads,
+                                    wordSize, lengthFilter,
+                                    editDistanceFilter))
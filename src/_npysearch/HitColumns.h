@@ -0,0 +1,76 @@
+#pragma once
+
+#include <nsearch/CSV/Row.h>
+#include <nsearch/Database/Search.h>
+
+#include <cstdint>
+#include <string>
+#include <vector>
+
+/*
+ * Hits stored column by column (same columns as the CSV output),
+ * so that they can be handed to Python as typed arrays in one go
+ */
+class HitColumns {
+public:
+  std::vector< std::string > queryId, targetId;
+  std::vector< int64_t >     queryMatchStart, queryMatchEnd;
+  std::vector< int64_t >     targetMatchStart, targetMatchEnd;
+  std::vector< std::string > queryMatchSeq, targetMatchSeq;
+  std::vector< int64_t >     numColumns, numMatches, numMismatches, numGaps;
+  std::vector< double >      identity;
+  std::vector< std::string > alignment;
+
+  size_t Size() const {
+    return queryId.size();
+  }
+
+  template < typename A >
+  void Add( const Sequence< A >& query, const Hit< A >& hit ) {
+    CSV::Row< A > row( query, hit );
+
+    queryId.push_back( query.identifier );
+    targetId.push_back( hit.target.identifier );
+    queryMatchStart.push_back( row.queryMatchStart );
+    queryMatchEnd.push_back( row.queryMatchEnd );
+    targetMatchStart.push_back( row.targetMatchStart );
+    targetMatchEnd.push_back( row.targetMatchEnd );
+    queryMatchSeq.push_back( std::move( row.queryMatchSeq ) );
+    targetMatchSeq.push_back( std::move( row.targetMatchSeq ) );
+    numColumns.push_back( row.numColumns );
+    numMatches.push_back( row.numMatches );
+    numMismatches.push_back( row.numMismatches );
+    numGaps.push_back( row.numGaps );
+    identity.push_back( double( row.numMatches ) / double( row.numColumns ) );
+    alignment.push_back( row.alignment.ToString() );
+  }
+
+  void Append( HitColumns&& other ) {
+    Append( queryId, other.queryId );
+    Append( targetId, other.targetId );
+    Append( queryMatchStart, other.queryMatchStart );
+    Append( queryMatchEnd, other.queryMatchEnd );
+    Append( targetMatchStart, other.targetMatchStart );
+    Append( targetMatchEnd, other.targetMatchEnd );
+    Append( queryMatchSeq, other.queryMatchSeq );
+    Append( targetMatchSeq, other.targetMatchSeq );
+    Append( numColumns, other.numColumns );
+    Append( numMatches, other.numMatches );
+    Append( numMismatches, other.numMismatches );
+    Append( numGaps, other.numGaps );
+    Append( identity, other.identity );
+    Append( alignment, other.alignment );
+  }
+
+private:
+  template < typename T >
+  static void Append( std::vector< T >& to, std::vector< T >& from ) {
+    if( to.empty() ) {
+      to = std::move( from );
+      return;
+    }
+
+    to.insert( to.end(), std::make_move_iterator( from.begin() ),
+               std::make_move_iterator( from.end() ) );
+  }
+};
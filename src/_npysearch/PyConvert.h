@@ -0,0 +1,152 @@
+#pragma once
+
+#include <pybind11/pybind11.h>
+#include <pybind11/numpy.h>
+
+#include <nsearch/Sequence.h>
+#include <nsearch/Utils.h>
+
+#include <cstdint>
+#include <string>
+#include <stdexcept>
+#include <vector>
+
+#include "HitColumns.h"
+
+namespace py = pybind11;
+
+/*
+ * Conversion of Python objects into nsearch sequences.
+ * All functions here require the GIL to be held.
+ */
+static std::string StringFromPython( const py::handle& obj, const char* what ) {
+  if( py::isinstance< py::str >( obj ) ) {
+    return obj.cast< std::string >();
+  }
+
+  if( PyObject_CheckBuffer( obj.ptr() ) ) {
+    // bytes, bytearray, memoryview, numpy uint8/S1 arrays...
+    py::buffer_info info = py::reinterpret_borrow< py::buffer >( obj ).request();
+    if( info.itemsize != 1 || info.ndim > 1 ||
+        ( info.ndim == 1 && info.strides[ 0 ] != 1 ) ) {
+      throw py::type_error( std::string( what ) +
+                            " buffer must be a contiguous array of bytes" );
+    }
+    return std::string( static_cast< const char* >( info.ptr ), info.size );
+  }
+
+  throw py::type_error( std::string( what ) +
+                        " must be a str or a bytes-like object" );
+}
+
+template < typename A >
+static void AppendSequenceFromPython( const py::handle&  identifier,
+                                      const py::handle&  sequence,
+                                      SequenceList< A >* sequences ) {
+  std::string seq = StringFromPython( sequence, "sequence" );
+  UpcaseString( seq );
+  sequences->push_back(
+    Sequence< A >( StringFromPython( identifier, "sequence id" ), seq ) );
+}
+
+// Accepts a dict {id: sequence} or an iterable of (id, sequence) pairs
+template < typename A >
+static SequenceList< A > SequencesFromPython( const py::handle& obj ) {
+  SequenceList< A > sequences;
+
+  if( py::isinstance< py::dict >( obj ) ) {
+    for( auto item : py::reinterpret_borrow< py::dict >( obj ) ) {
+      AppendSequenceFromPython< A >( item.first, item.second, &sequences );
+    }
+    return sequences;
+  }
+
+  if( !py::isinstance< py::iterable >( obj ) || py::isinstance< py::str >( obj ) ) {
+    throw py::type_error(
+      "sequences must be a dict or an iterable of (id, sequence) pairs" );
+  }
+
+  for( auto item : py::reinterpret_borrow< py::iterable >( obj ) ) {
+    if( !py::isinstance< py::sequence >( item ) || py::len( item ) != 2 ) {
+      throw py::type_error(
+        "sequences must be a dict or an iterable of (id, sequence) pairs" );
+    }
+    auto pair = py::reinterpret_borrow< py::sequence >( item );
+    AppendSequenceFromPython< A >( pair[ 0 ], pair[ 1 ], &sequences );
+  }
+  return sequences;
+}
+
+/*
+ * Conversion of hit columns into Python objects: numeric columns become
+ * NumPy arrays when NumPy is installed, array.array otherwise
+ */
+static bool HasNumPy() {
+  static const bool hasNumPy = [] {
+    try {
+      py::module_::import( "numpy" );
+      return true;
+    } catch( py::error_already_set& ) {
+      return false;
+    }
+  }();
+  return hasNumPy;
+}
+
+template < typename T >
+static const char* ArrayTypeCode();
+
+template <>
+inline const char* ArrayTypeCode< int64_t >() {
+  return "q";
+}
+
+template <>
+inline const char* ArrayTypeCode< double >() {
+  return "d";
+}
+
+template < typename T >
+static py::object ColumnToPython( std::vector< T >&& column ) {
+  if( HasNumPy() ) {
+    // Hand the buffer over to NumPy without copying
+    auto*      data = new std::vector< T >( std::move( column ) );
+    py::capsule owner( data, []( void* ptr ) {
+      delete static_cast< std::vector< T >* >( ptr );
+    } );
+    return py::array_t< T >( data->size(), data->data(), owner );
+  }
+
+  py::bytes bytes( reinterpret_cast< const char* >( column.data() ),
+                   column.size() * sizeof( T ) );
+  return py::module_::import( "array" ).attr( "array" )( ArrayTypeCode< T >(),
+                                                         bytes );
+}
+
+static py::list ColumnToPython( std::vector< std::string >&& column ) {
+  py::list list( column.size() );
+  for( size_t i = 0; i < column.size(); i++ ) {
+    list[ i ] = py::str( column[ i ] );
+  }
+  column.clear();
+  return list;
+}
+
+static py::dict ColumnsToPython( HitColumns&& columns ) {
+  py::dict dict;
+  dict[ "QueryId" ]          = ColumnToPython( std::move( columns.queryId ) );
+  dict[ "TargetId" ]         = ColumnToPython( std::move( columns.targetId ) );
+  dict[ "QueryMatchStart" ]  = ColumnToPython( std::move( columns.queryMatchStart ) );
+  dict[ "QueryMatchEnd" ]    = ColumnToPython( std::move( columns.queryMatchEnd ) );
+  dict[ "TargetMatchStart" ] = ColumnToPython( std::move( columns.targetMatchStart ) );
+  dict[ "TargetMatchEnd" ]   = ColumnToPython( std::move( columns.targetMatchEnd ) );
+  dict[ "QueryMatchSeq" ]    = ColumnToPython( std::move( columns.queryMatchSeq ) );
+  dict[ "TargetMatchSeq" ]   = ColumnToPython( std::move( columns.targetMatchSeq ) );
+  dict[ "NumColumns" ]       = ColumnToPython( std::move( columns.numColumns ) );
+  dict[ "NumMatches" ]       = ColumnToPython( std::move( columns.numMatches ) );
+  dict[ "NumMismatches" ]    = ColumnToPython( std::move( columns.numMismatches ) );
+  dict[ "NumGaps" ]          = ColumnToPython( std::move( columns.numGaps ) );
+  dict[ "Identity" ]         = ColumnToPython( std::move( columns.identity ) );
+  dict[ "Alignment" ]        = ColumnToPython( std::move( columns.alignment ) );
+  return dict;
+}
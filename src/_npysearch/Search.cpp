@@ -4,115 +4,378 @@
 namespace py = pybind11;
 
 #include "Search.h"
-
-#include <nsearch/FASTA/Reader.h>
-#include <nsearch/Database.h>
-#include <nsearch/Database/HitWriter.h>
-#include <nsearch/Database/GlobalSearch.h>
-#include <nsearch/Sequence.h>
-#include <nsearch/Alphabet/DNA.h>
-#include <nsearch/Alphabet/Protein.h>
+#include "SearchDatabase.h"
+#include "SearchStream.h"
+#include "SequenceIterator.h"
+#include "PyConvert.h"
 
 #include <string>
-#include <memory>
-#include <stdexcept>
 
-#include "Common.h"
-#include "FileFormat.h"
-#include "WorkerQueue.h"
+static SearchParams< DNA > DNASearchParams( int maxAccepts, int maxRejects,
+                                            double             minIdentity,
+                                            const std::string& strand,
+                                            bool lengthFilter = false,
+                                            bool editDistanceFilter = false ) {
+  SearchParams< DNA > searchParams;
+
+  searchParams.maxAccepts = maxAccepts;
+  searchParams.maxRejects = maxRejects;
+  searchParams.minIdentity = minIdentity;
+  searchParams.lengthFilter = lengthFilter;
+  searchParams.strand = ParseStrand( strand );
+  searchParams.jointStrands = strand == "joint";
+  searchParams.editDistanceFilter = editDistanceFilter;
+  return searchParams;
+}
+
+static SearchParams< Protein > ProteinSearchParams( int maxAccepts, int maxRejects,
+                                                    double minIdentity,
+                                                    bool lengthFilter = false ) {
+  SearchParams< Protein > searchParams;
+
+  searchParams.maxAccepts = maxAccepts;
+  searchParams.maxRejects = maxRejects;
+  searchParams.minIdentity = minIdentity;
+  searchParams.lengthFilter = lengthFilter;
+  return searchParams;
+}
+
+// wordSize is None (default for the alphabet), an int or "auto",
+// sparse is None (decided by the word size) or a bool
+template < typename A >
+static IndexParams MakeIndexParams( int threads, bool compress,
+                                    const py::object& wordSize,
+                                    const py::object& sparse,
+                                    size_t targetMemory,
+                                    const py::object& seeds,
+                                    int minimizerWindow,
+                                    const py::object& maxKmerOccurrences ) {
+  IndexParams indexParams;
+
+  indexParams.numThreads = threads;
+  indexParams.compressPostings = compress;
+  indexParams.targetMemory = targetMemory;
+  if( !sparse.is_none() )
+    indexParams.sparseIndex = sparse.cast< bool >();
+
+  if( py::isinstance< py::str >( wordSize ) ) {
+    if( wordSize.cast< std::string >() != "auto" )
+      throw py::value_error( "wordSize must be an int, None or 'auto'" );
+    indexParams.wordSize = AutoWordSize;
+  } else if( !wordSize.is_none() ) {
+    int value = wordSize.cast< int >();
+    if( value < 1 || value > ( int ) Database< A >::MaxKmerLength() )
+      throw py::value_error( "wordSize must be between 1 and " +
+                             std::to_string( Database< A >::MaxKmerLength() ) );
+    indexParams.wordSize = value;
+  }
+
+  if( py::isinstance< py::str >( seeds ) ) {
+    indexParams.seedPatterns.push_back( seeds.cast< std::string >() );
+  } else if( !seeds.is_none() ) {
+    for( auto seed : seeds.cast< py::iterable >() ) {
+      if( !py::isinstance< py::str >( seed ) )
+        throw py::type_error( "seeds must be a str or a list of str" );
+      indexParams.seedPatterns.push_back( seed.cast< std::string >() );
+    }
+    if( indexParams.seedPatterns.empty() )
+      throw py::value_error( "seeds must not be empty" );
+  }
+  if( !indexParams.seedPatterns.empty() && !wordSize.is_none() )
+    throw py::value_error( "wordSize and seeds cannot be combined" );
+
+  if( minimizerWindow < 1 )
+    throw py::value_error( "minimizerWindow must be at least 1" );
+  indexParams.minimizerWindow = minimizerWindow;
+
+  if( !maxKmerOccurrences.is_none() ) {
+    long long value = maxKmerOccurrences.cast< long long >();
+    if( value < 1 )
+      throw py::value_error( "maxKmerOccurrences must be at least 1" );
+    indexParams.maxKmerOccurrences = value;
+  }
+  return indexParams;
+}
 
+// Python sequences are converted while holding the GIL,
+// indexing happens without it
 template < typename A >
-using QueryWithHits     = std::pair< Sequence< A >, HitList< A > >;
+static std::unique_ptr< SearchDatabase< A > >
+SearchDatabaseFromPython( const py::object& sequences, int threads,
+                          bool compress, const py::object& wordSize,
+                          const py::object& sparse, size_t targetMemory,
+                          const py::object& seeds, int minimizerWindow,
+                          const py::object& maxKmerOccurrences ) {
+  IndexParams indexParams =
+    MakeIndexParams< A >( threads, compress, wordSize, sparse, targetMemory,
+                          seeds, minimizerWindow, maxKmerOccurrences );
+  SequenceList< A > list = SequencesFromPython< A >( sequences );
+
+  py::gil_scoped_release release;
+  return std::unique_ptr< SearchDatabase< A > >(
+    new SearchDatabase< A >( std::move( list ), indexParams ) );
+}
 
 template < typename A >
-using QueryWithHitsList = std::deque< QueryWithHits< A > >;
+static std::unique_ptr< SearchDatabase< A > >
+SearchDatabaseFromFile( const std::string& databasePath, int threads,
+                        bool compress, const py::object& wordSize,
+                        const py::object& sparse, size_t targetMemory,
+                        const py::object& seeds, int minimizerWindow,
+                        const py::object& maxKmerOccurrences ) {
+  IndexParams indexParams =
+    MakeIndexParams< A >( threads, compress, wordSize, sparse, targetMemory,
+                          seeds, minimizerWindow, maxKmerOccurrences );
+
+  py::gil_scoped_release release;
+  return std::unique_ptr< SearchDatabase< A > >(
+    new SearchDatabase< A >( databasePath, indexParams ) );
+}
 
 template < typename A >
-class QueueItemInfo< QueryWithHitsList< A > > {
-public:
-  static size_t Count( const QueryWithHitsList< A >& list ) {
-    return std::accumulate(
-      list.begin(), list.end(), 0,
-      []( int sum, const QueryWithHits< A >& q ) { return sum + q.second.size(); } );
+static py::dict IndexStatsToPython( const SearchDatabase< A >& db ) {
+  const auto& database = db.GetDatabase();
+
+  size_t numUsedKmers;
+  {
+    py::gil_scoped_release release;
+    numUsedKmers = database.NumUsedKmers();
   }
-};
+
+  py::dict dict;
+  dict[ "wordSize" ]  = database.KmerLength();
+
+  py::list seeds;
+  for( auto& pattern : database.SeedPatterns() ) {
+    seeds.append( pattern.String() );
+  }
+  dict[ "seeds" ] = seeds.empty() ? py::object( py::none() ) : py::object( seeds );
+  dict[ "sparse" ]    = database.IsSparse();
+  dict[ "minimizerWindow" ] = database.MinimizerWindow();
+  dict[ "maxKmerOccurrences" ] =
+    database.MaxKmerOccurrences() > 0
+      ? py::object( py::int_( database.MaxKmerOccurrences() ) )
+      : py::object( py::none() );
+  dict[ "maskedKmers" ]   = database.NumMaskedKmers();
+  dict[ "maskedPostings" ] = database.NumMaskedPostings();
+  dict[ "kmerSlots" ] = database.NumKmerSlots();
+  dict[ "usedKmers" ] = numUsedKmers;
+  dict[ "postings" ]  = database.NumPostings();
+  dict[ "meanPostingLength" ] =
+    numUsedKmers > 0 ? double( database.NumPostings() ) / numUsedKmers : 0.0;
+  dict[ "indexSize" ] = database.IndexMemoryUsage().Total();
+  return dict;
+}
 
 template < typename A >
-class SearchResultsWriterWorker {
-public:
-  SearchResultsWriterWorker( const std::string& path )
-      : mWriter( std::move(
-          DetectFileFormatAndOpenHitWriter< A >( path, FileFormat::ALNOUT ) ) ) {}
+static py::dict MemoryUsageToPython( const SearchDatabase< A >& db ) {
+  auto usage = db.GetDatabase().IndexMemoryUsage();
+
+  py::dict dict;
+  dict[ "layout" ]   = db.GetDatabase().CompressedPostings() ? "csr+varint" : "csr";
+  dict[ "offsets" ]  = usage.offsets;
+  dict[ "postings" ] = usage.postings;
+  dict[ "kmers" ]    = usage.kmers;
+  dict[ "sparseKmers" ] = usage.sparseKmers;
+  dict[ "total" ]    = usage.Total();
+
+  // The legacy layout had no sparse index
+  if( db.GetDatabase().IsSparse() ) {
+    dict[ "legacy" ] = py::none();
+    return dict;
+  }
+
+  py::dict legacy;
+  legacy[ "offsets" ]  = usage.legacyOffsets;
+  legacy[ "postings" ] = usage.legacyPostings;
+  legacy[ "kmers" ]    = usage.legacyKmers;
+  legacy[ "total" ]    = usage.LegacyTotal();
+  dict[ "legacy" ]     = legacy;
+  return dict;
+}
 
-  void Process( const QueryWithHitsList< A >& queryWithHitsList ) {
-    for( auto& queryWithHits : queryWithHitsList ) {
-      ( *mWriter ) << queryWithHits;
+template < typename A >
+static py::dict SearchStatsToPython( const SearchDatabase< A >& db,
+                                     const bool                 reset ) {
+  auto&       collected = db.SearchStatistics();
+  SearchStats stats     = reset ? collected.Take() : collected.Get();
+
+  py::dict dict;
+  dict[ "queries" ]     = stats.numQueries;
+  dict[ "candidates" ]  = stats.numCandidates;
+  dict[ "accepted" ]    = stats.numAccepted;
+  dict[ "rejected" ]    = stats.numRejected;
+  dict[ "abandoned" ]   = stats.numAbandoned;
+  dict[ "prefiltered" ] = stats.numPrefiltered;
+  return dict;
+}
+
+// Queries are either a path to a FASTA/FASTQ file or Python sequences.
+// Hits are written to outputPath if one is given, otherwise they are
+// returned as a dict of columns.
+template < typename A >
+static py::object SearchFromPython( const SearchDatabase< A >& db,
+                                    const py::object&          queries,
+                                    const py::object&          outputPath,
+                                    const SearchParams< A >&   searchParams,
+                                    const int                  numThreads ) {
+  bool toFile = !outputPath.is_none();
+  std::string path = toFile ? outputPath.cast< std::string >() : "";
+
+  if( py::isinstance< py::str >( queries ) ) {
+    std::string queryPath = queries.cast< std::string >();
+
+    if( toFile ) {
+      py::gil_scoped_release release;
+      db.Search( queryPath, path, searchParams, numThreads );
+      return py::none();
     }
+
+    HitColumns columns;
+    {
+      py::gil_scoped_release release;
+      columns = db.Search( queryPath, searchParams, numThreads );
+    }
+    return ColumnsToPython( std::move( columns ) );
   }
 
-private:
-  std::unique_ptr< HitWriter< A > > mWriter;
-};
+  SequenceList< A > list = SequencesFromPython< A >( queries );
+
+  if( toFile ) {
+    py::gil_scoped_release release;
+    db.Search( std::move( list ), path, searchParams, numThreads );
+    return py::none();
+  }
+
+  HitColumns columns;
+  {
+    py::gil_scoped_release release;
+    columns = db.Search( std::move( list ), searchParams, numThreads );
+  }
+  return ColumnsToPython( std::move( columns ) );
+}
 
 template < typename A >
-using SearchResultsWriter =
-  WorkerQueue< SearchResultsWriterWorker< A >, QueryWithHitsList< A >,
-               const std::string& >;
+static void EnqueueFromPython( SearchStream< A >& stream,
+                               const py::object&  queries ) {
+  SequenceList< A > list = SequencesFromPython< A >( queries );
+  stream.Enqueue( std::move( list ) );
+}
 
+// Returns (queryIds, numHitsByQuery, columns) of the oldest pending chunk
 template < typename A >
-class QueueItemInfo< SequenceList< A > > {
-public:
-  static size_t Count( const SequenceList< A >& list ) {
-    return list.size();
+static py::tuple NextToPython( SearchStream< A >& stream ) {
+  std::vector< std::string > queryIds;
+  std::vector< size_t >      numHitsByQuery;
+  HitColumns                 columns;
+  {
+    py::gil_scoped_release release;
+    columns = stream.Next( &queryIds, &numHitsByQuery );
+  }
+
+  py::list numHits( numHitsByQuery.size() );
+  for( size_t i = 0; i < numHitsByQuery.size(); i++ ) {
+    numHits[ i ] = py::int_( numHitsByQuery[ i ] );
   }
-};
+
+  return py::make_tuple( ColumnToPython( std::move( queryIds ) ), numHits,
+                         ColumnsToPython( std::move( columns ) ) );
+}
 
 template < typename A >
-class QueryDatabaseSearcherWorker {
-public:
-  QueryDatabaseSearcherWorker( SearchResultsWriter< A >* writer,
-                               const Database< A >*      database,
-                               const SearchParams< A > &params )
-      : mWriter( *writer ),
-        mGlobalSearch( *database, params ) {}
+static void BindSearchStream( py::module_& m, const char* name ) {
+  py::class_< SearchStream< A > >( m, name, R"pbdoc(
+          Chunks of queries searched in the background, see
+          DNADatabase.stream and ProteinDatabase.stream
+        )pbdoc" )
+    .def( "enqueue", &EnqueueFromPython< A >, R"pbdoc(
+          Start searching a chunk of queries (dict or iterable of
+          (id, sequence) pairs).
+        )pbdoc",
+          py::arg( "queries" ) )
+    .def( "next", &NextToPython< A >, R"pbdoc(
+          Wait for the oldest chunk and return (queryIds, numHitsByQuery,
+          columns), with the hit rows in query order.
+        )pbdoc" )
+    .def( "__len__", &SearchStream< A >::NumPending );
+}
 
-  void Process( const SequenceList< A >& queries ) {
-    QueryWithHitsList< A > list;
+// Files are parsed without the GIL, in batches of numSequencesPerBatch
+static const size_t numSequencesPerBatch = 1024;
 
-    for( auto& query : queries ) {
-      auto hits = mGlobalSearch.Query( query );
-      if( hits.empty() )
-        continue;
+py::dict read_fasta( const std::string& path )
+{
+  SequenceIterator            it( path );
+  SequenceList< AnyAlphabet > batch;
+  py::dict                    sequences;
+
+  while( true ) {
+    {
+      py::gil_scoped_release release;
+      if( !it.NextBatch( numSequencesPerBatch, &batch ) )
+        break;
+    }
 
-      list.push_back( { query, hits } );
+    for( auto& seq : batch ) {
+      sequences[ py::str( seq.identifier ) ] = py::str( seq.sequence );
     }
+  }
+  return sequences;
+}
+
+// Python iterator over (id, sequence) tuples
+class PySequenceIterator {
+public:
+  PySequenceIterator( const std::string& path ) : mIterator( path ) {}
 
-    if( !list.empty() ) {
-      mWriter.Enqueue( list );
+  py::tuple Next() {
+    if( mBatch.empty() ) {
+      py::gil_scoped_release release;
+      mIterator.NextBatch( numSequencesPerBatch, &mBatch );
     }
+    if( mBatch.empty() )
+      throw py::stop_iteration();
+
+    py::tuple item = py::make_tuple( py::str( mBatch.front().identifier ),
+                                     py::str( mBatch.front().sequence ) );
+    mBatch.pop_front();
+    return item;
   }
 
 private:
-  GlobalSearch< A >         mGlobalSearch;
-  SearchResultsWriter< A >& mWriter;
+  SequenceIterator            mIterator;
+  SequenceList< AnyAlphabet > mBatch;
 };
 
+// Index files are saved and loaded without the GIL
 template < typename A >
-using QueryDatabaseSearcher =
-  WorkerQueue< QueryDatabaseSearcherWorker< A >, SequenceList< A >,
-               SearchResultsWriter< A >*, const Database< A >*,
-               const SearchParams< A >& >;
+static void SaveSearchDatabase( const SearchDatabase< A >& db,
+                                const std::string&         indexPath ) {
+  py::gil_scoped_release release;
+  db.Save( indexPath );
+}
 
 template < typename A >
-struct WordSize {
-  static const int VALUE = 8; // DNA, default
-};
+static std::unique_ptr< SearchDatabase< A > >
+LoadSearchDatabase( const std::string& indexPath, bool useMmap,
+                    bool verifyChecksum ) {
+  py::gil_scoped_release release;
+  return SearchDatabase< A >::Load( indexPath, useMmap, verifyChecksum );
+}
 
-template <>
-struct WordSize< Protein > {
-  static const int VALUE = 5;
-};
+// Returns a DNADatabase or ProteinDatabase, depending on the index file
+py::object load_database( const std::string& indexPath, bool mmap = true,
+                          bool verify = false ) {
+  std::string alphabet = IndexFile::ReadHeader( indexPath ).alphabet;
 
+  if( alphabet == DNA::Name() ) {
+    return py::cast( LoadSearchDatabase< DNA >( indexPath, mmap, verify ) );
+  }
+  if( alphabet == Protein::Name() ) {
+    return py::cast( LoadSearchDatabase< Protein >( indexPath, mmap, verify ) );
+  }
+  throw std::runtime_error( "Unknown alphabet in index file " + indexPath );
+}
 
 void dna_blast(const std::string& queryPath,
                const std::string& databasePath,
@@ -120,104 +383,16 @@ void dna_blast(const std::string& queryPath,
                int maxAccepts = 1,
                int maxRejects =  16,
                double minIdentity = 0.75,
-               std::string strand = "both") 
+               std::string strand = "both",
+               int threads = 0) 
 {
-  ProgressOutput progress;
-  
-  Sequence< DNA > seq;
-  SequenceList< DNA > sequences;
-
-  auto dbReader = DetectFileFormatAndOpenReader< DNA >( databasePath, FileFormat::FASTA );
-
-  enum ProgressType {
-                     ReadDBFile,
-                     StatsDB,
-                     IndexDB,
-                     ReadQueryFile,
-                     SearchDB,
-                     WriteHits
-  };
-
-  progress.Add( ProgressType::ReadDBFile, "Read database", UnitType::BYTES );
-  progress.Add( ProgressType::StatsDB, "Analyze database" );
-  progress.Add( ProgressType::IndexDB, "Index database" );
-  progress.Add( ProgressType::ReadQueryFile, "Read queries", UnitType::BYTES );
-  progress.Add( ProgressType::SearchDB, "Search database" );
-  progress.Add( ProgressType::WriteHits, "Write hits" );
-
-  // Read DB
-  progress.Activate( ProgressType::ReadDBFile );
-  while( !dbReader->EndOfFile() ) {
-    ( *dbReader ) >> seq;
-    sequences.push_back( std::move( seq ) );
-    progress.Set( ProgressType::ReadDBFile, dbReader->NumBytesRead(),
-                  dbReader->NumBytesTotal() );
-  }
-
-  // Index DB
-  Database< DNA > db( WordSize< DNA >::VALUE );
-  db.SetProgressCallback(
-                         [&]( typename Database< DNA >::ProgressType type, size_t num, size_t total ) {
-                           switch( type ) {
-                           case Database< DNA >::ProgressType::StatsCollection:
-                             progress.Activate( ProgressType::StatsDB )
-                               .Set( ProgressType::StatsDB, num, total );
-                             break;
-
-                           case Database< DNA >::ProgressType::Indexing:
-                             progress.Activate( ProgressType::IndexDB )
-                               .Set( ProgressType::IndexDB, num, total );
-                             break;
-
-                           default:
-                             break;
-                           }
-                         } );
-  db.Initialize( sequences );
-
-  // Read and process queries
-  const int numQueriesPerWorkItem = 64;
-  
-  SearchParams< DNA > searchParams;
-
-  searchParams.maxAccepts = maxAccepts;
-  searchParams.maxRejects = maxRejects;
-  searchParams.minIdentity = minIdentity;
-
-  if (strand == "both") searchParams.strand = DNA::Strand::Both;
-  else if (strand == "plus") searchParams.strand = DNA::Strand::Plus;
-  else if (strand == "minus") searchParams.strand = DNA::Strand::Minus;
-  else throw std::invalid_argument("Strand must be 'plus', 'minus' or 'both'.");
-
-  SearchResultsWriter< DNA >   writer( 1, outputPath );
-  QueryDatabaseSearcher< DNA > searcher( -1, &writer, &db, searchParams );
-
-  searcher.OnProcessed( [&]( size_t numProcessed, size_t numEnqueued ) {
-                          progress.Set( ProgressType::SearchDB, numProcessed, numEnqueued );
-                        } );
-  writer.OnProcessed( [&]( size_t numProcessed, size_t numEnqueued ) {
-                        progress.Set( ProgressType::WriteHits, numProcessed, numEnqueued );
-                      } );
-
-  auto qryReader = DetectFileFormatAndOpenReader< DNA >( queryPath, FileFormat::FASTA );
-
-  SequenceList< DNA > queries;
-  progress.Activate( ProgressType::ReadQueryFile );
-  while( !qryReader->EndOfFile() ) {
-    qryReader->Read( numQueriesPerWorkItem, &queries );
-    searcher.Enqueue( queries );
-    progress.Set( ProgressType::ReadQueryFile, qryReader->NumBytesRead(),
-                  qryReader->NumBytesTotal() );
-  }
+  IndexParams indexParams;
+  indexParams.numThreads = threads;
 
-  // Search
-  progress.Activate( ProgressType::SearchDB );
-  searcher.WaitTillDone();
-
-  progress.Activate( ProgressType::WriteHits );
-  writer.WaitTillDone();
-
-  std::cout << "\n";
+  SearchDatabase< DNA > db( databasePath, indexParams );
+  db.Search( queryPath, outputPath,
+             DNASearchParams( maxAccepts, maxRejects, minIdentity, strand ),
+             threads );
 }
 
 void protein_blast(const std::string& queryPath,
@@ -225,100 +400,33 @@ void protein_blast(const std::string& queryPath,
                    const std::string& outputPath,
                    int maxAccepts = 1,
                    int maxRejects =  16,
-                   double minIdentity = 0.75) 
+                   double minIdentity = 0.75,
+                   int threads = 0) 
 {
-  ProgressOutput progress;
-  
-  Sequence< Protein > seq;
-  SequenceList< Protein > sequences;
-
-  auto dbReader = DetectFileFormatAndOpenReader< Protein >( databasePath, FileFormat::FASTA );
-
-  enum ProgressType {
-                     ReadDBFile,
-                     StatsDB,
-                     IndexDB,
-                     ReadQueryFile,
-                     SearchDB,
-                     WriteHits
-  };
-
-  progress.Add( ProgressType::ReadDBFile, "Read database", UnitType::BYTES );
-  progress.Add( ProgressType::StatsDB, "Analyze database" );
-  progress.Add( ProgressType::IndexDB, "Index database" );
-  progress.Add( ProgressType::ReadQueryFile, "Read queries", UnitType::BYTES );
-  progress.Add( ProgressType::SearchDB, "Search database" );
-  progress.Add( ProgressType::WriteHits, "Write hits" );
-
-  // Read DB
-  progress.Activate( ProgressType::ReadDBFile );
-  while( !dbReader->EndOfFile() ) {
-    ( *dbReader ) >> seq;
-    sequences.push_back( std::move( seq ) );
-    progress.Set( ProgressType::ReadDBFile, dbReader->NumBytesRead(),
-                  dbReader->NumBytesTotal() );
-  }
+  IndexParams indexParams;
+  indexParams.numThreads = threads;
 
-  // Index DB
-  Database< Protein > db( WordSize< Protein >::VALUE );
-  db.SetProgressCallback(
-                         [&]( typename Database< Protein >::ProgressType type, size_t num, size_t total ) {
-                           switch( type ) {
-                           case Database< Protein >::ProgressType::StatsCollection:
-                             progress.Activate( ProgressType::StatsDB )
-                               .Set( ProgressType::StatsDB, num, total );
-                             break;
-
-                           case Database< Protein >::ProgressType::Indexing:
-                             progress.Activate( ProgressType::IndexDB )
-                               .Set( ProgressType::IndexDB, num, total );
-                             break;
-
-                           default:
-                             break;
-                           }
-                         } );
-  db.Initialize( sequences );
-
-  // Read and process queries
-  const int numQueriesPerWorkItem = 64;
-  
-  SearchParams< Protein > searchParams;
-
-  searchParams.maxAccepts = maxAccepts;
-  searchParams.maxRejects = maxRejects;
-  searchParams.minIdentity = minIdentity;
-
-  SearchResultsWriter< Protein >   writer( 1, outputPath );
-  QueryDatabaseSearcher< Protein > searcher( -1, &writer, &db, searchParams );
-
-  searcher.OnProcessed( [&]( size_t numProcessed, size_t numEnqueued ) {
-                          progress.Set( ProgressType::SearchDB, numProcessed, numEnqueued );
-                        } );
-  writer.OnProcessed( [&]( size_t numProcessed, size_t numEnqueued ) {
-                        progress.Set( ProgressType::WriteHits, numProcessed, numEnqueued );
-                      } );
-
-  // std::unique_ptr< SequenceReader< Protein > > qryReader( new FASTA::Reader< Protein >( query_table ) );
-  auto qryReader = DetectFileFormatAndOpenReader< Protein >( queryPath, FileFormat::FASTA );
-
-  SequenceList< Protein > queries;
-  progress.Activate( ProgressType::ReadQueryFile );
-  while( !qryReader->EndOfFile() ) {
-    qryReader->Read( numQueriesPerWorkItem, &queries );
-    searcher.Enqueue( queries );
-    progress.Set( ProgressType::ReadQueryFile, qryReader->NumBytesRead(),
-                  qryReader->NumBytesTotal() );
-  }
+  SearchDatabase< Protein > db( databasePath, indexParams );
+  db.Search( queryPath, outputPath,
+             ProteinSearchParams( maxAccepts, maxRejects, minIdentity ),
+             threads );
+}
 
-  // Search
-  progress.Activate( ProgressType::SearchDB );
-  searcher.WaitTillDone();
+// Searches share one pool of threads, which lives as long as the module
+void set_thread_pool_size(int size)
+{
+  SharedThreadPool().Resize( size );
+}
 
-  progress.Activate( ProgressType::WriteHits );
-  writer.WaitTillDone();
+py::dict thread_pool_info()
+{
+  ThreadPool& pool = SharedThreadPool();
 
-  std::cout << "\n";
+  py::dict info;
+  info[ "size" ]   = pool.Size();
+  info[ "busy" ]   = pool.NumBusy();
+  info[ "queued" ] = pool.NumQueued();
+  return info;
 }
 
 // Python bindings
@@ -328,34 +436,259 @@ PYBIND11_MODULE(_npysearch, m) {
         -----------------------
           DNA_blast
           Protein_blast
+          DNADatabase
+          ProteinDatabase
+          load_database
+          set_thread_pool_size
+          read_fasta
+          iter_fasta
+          thread_pool_info
     )pbdoc";
 
+    // The searches only touch C++ objects, so Python threads (and event
+    // loops) keep running while they are in progress
     m.def("dna_blast", &dna_blast, R"pbdoc(
           BLAST-like algorithm for poly-nucleotides
         )pbdoc",
+          py::call_guard< py::gil_scoped_release >(),
           py::arg("queryPath"),
           py::arg("databasePath"),
           py::arg("outputPath"),
           py::arg("maxAccepts") = 1,
           py::arg("maxRejects") = 16,
           py::arg("minIdentity") = 0.75,
-          py::arg("strand") = "both"
+          py::arg("strand") = "both",
+          py::arg("threads") = 0
     );
 
     m.def("protein_blast", &protein_blast, R"pbdoc(
           BLAST-like algorithm for proteins
         )pbdoc",
+          py::call_guard< py::gil_scoped_release >(),
           py::arg("queryPath"),
           py::arg("databasePath"),
           py::arg("outputPath"),
           py::arg("maxAccepts") = 1,
           py::arg("maxRejects") = 16,
-          py::arg("minIdentity") = 0.75
+          py::arg("minIdentity") = 0.75,
+          py::arg("threads") = 0
     );
 
+    m.def("set_thread_pool_size", &set_thread_pool_size, R"pbdoc(
+          Resize the thread pool shared by all searches. 0 means one
+          thread per core, which is also the initial size.
+        )pbdoc",
+          py::call_guard< py::gil_scoped_release >(),
+          py::arg("size"));
+
+    m.def("thread_pool_info", &thread_pool_info, R"pbdoc(
+          Size of the shared thread pool, number of busy threads and
+          number of queued tasks
+        )pbdoc");
+
+    m.def("load_database", &load_database, R"pbdoc(
+          Load a database index written by DNADatabase.save or
+          ProteinDatabase.save. The index is memory mapped unless mmap
+          is False; verify checks the file checksum first.
+        )pbdoc",
+          py::arg("indexPath"),
+          py::arg("mmap") = true,
+          py::arg("verify") = false
+    );
+
+    m.def("read_fasta", &read_fasta, R"pbdoc(
+          Read a FASTA (or, by extension, FASTQ) file into a dict
+          {id: sequence}, with the sequences as they are in the file.
+        )pbdoc",
+          py::arg("path"));
+
+    py::class_< PySequenceIterator >( m, "iter_fasta", R"pbdoc(
+          Iterate over the (id, sequence) pairs of a FASTA (or, by
+          extension, FASTQ) file without loading it into memory, with
+          the sequences as they are in the file.
+        )pbdoc" )
+      .def( py::init< const std::string& >(), py::arg( "path" ) )
+      .def( "__iter__", []( PySequenceIterator& it ) -> PySequenceIterator& { return it; } )
+      .def( "__next__", &PySequenceIterator::Next );
+
+    BindSearchStream< DNA >( m, "DNASearchStream" );
+    BindSearchStream< Protein >( m, "ProteinSearchStream" );
+
+    py::class_< SearchDatabase< DNA > >( m, "DNADatabase", R"pbdoc(
+          Poly-nucleotide database, indexed once and searchable many times.
+          Built from a FASTA/FASTQ path, a dict {id: sequence} or an
+          iterable of (id, sequence) pairs.
+        )pbdoc" )
+      .def( py::init( &SearchDatabaseFromFile< DNA > ), py::arg( "databasePath" ),
+            py::arg( "threads" ) = 0, py::arg( "compress" ) = false,
+            py::arg( "wordSize" ) = py::none(), py::arg( "sparse" ) = py::none(),
+            py::arg( "targetMemory" ) = IndexParams().targetMemory,
+            py::arg( "seeds" ) = py::none(),
+            py::arg( "minimizerWindow" ) = 1,
+            py::arg( "maxKmerOccurrences" ) = py::none() )
+      .def( py::init( &SearchDatabaseFromPython< DNA > ), py::arg( "sequences" ),
+            py::arg( "threads" ) = 0, py::arg( "compress" ) = false,
+            py::arg( "wordSize" ) = py::none(), py::arg( "sparse" ) = py::none(),
+            py::arg( "targetMemory" ) = IndexParams().targetMemory,
+            py::arg( "seeds" ) = py::none(),
+            py::arg( "minimizerWindow" ) = 1,
+            py::arg( "maxKmerOccurrences" ) = py::none() )
+      .def( "search",
+            []( const SearchDatabase< DNA >& db, const py::object& queries,
+                const py::object& outputPath, int maxAccepts, int maxRejects,
+                double minIdentity, const std::string& strand, int threads,
+                bool lengthFilter, bool editDistanceFilter ) {
+              return SearchFromPython( db, queries, outputPath,
+                                       DNASearchParams( maxAccepts, maxRejects, minIdentity, strand,
+                                                        lengthFilter, editDistanceFilter ),
+                                       threads );
+            }, R"pbdoc(
+          Search queries (FASTA/FASTQ path, dict or list of (id, sequence)
+          pairs) against the indexed database. Hits are written to
+          outputPath (ALNOUT, or CSV for a .csv extension) if given,
+          otherwise they are returned as a dict of columns.
+        )pbdoc",
+            py::arg( "queries" ),
+            py::arg( "outputPath" ) = py::none(),
+            py::arg( "maxAccepts" ) = 1,
+            py::arg( "maxRejects" ) = 16,
+            py::arg( "minIdentity" ) = 0.75,
+            py::arg( "strand" ) = "both",
+            py::arg( "threads" ) = 0,
+            py::arg( "lengthFilter" ) = false,
+            py::arg( "editDistanceFilter" ) = false )
+      .def( "stream",
+            []( const SearchDatabase< DNA >& db, int maxAccepts, int maxRejects,
+                double minIdentity, const std::string& strand, int threads,
+                bool lengthFilter, bool editDistanceFilter ) {
+              return std::unique_ptr< SearchStream< DNA > >( new SearchStream< DNA >(
+                db, DNASearchParams( maxAccepts, maxRejects, minIdentity, strand,
+                                     lengthFilter, editDistanceFilter ),
+                threads ) );
+            }, R"pbdoc(
+          Open a stream to search chunks of queries against the database
+          in the background.
+        )pbdoc",
+            py::keep_alive< 0, 1 >(),
+            py::arg( "maxAccepts" ) = 1,
+            py::arg( "maxRejects" ) = 16,
+            py::arg( "minIdentity" ) = 0.75,
+            py::arg( "strand" ) = "both",
+            py::arg( "threads" ) = 0,
+            py::arg( "lengthFilter" ) = false,
+            py::arg( "editDistanceFilter" ) = false )
+      .def( "save", &SaveSearchDatabase< DNA >, R"pbdoc(
+          Write the index to indexPath, for load_database.
+        )pbdoc",
+            py::arg( "indexPath" ) )
+      .def( "memory_usage", &MemoryUsageToPython< DNA >, R"pbdoc(
+          Bytes taken by the kmer index, next to what the previous layout
+          (size_t offset and count arrays) would take.
+        )pbdoc" )
+      .def( "index_stats", &IndexStatsToPython< DNA >, R"pbdoc(
+          Word size, seed patterns (None for contiguous words), whether the
+          index is sparse, minimizer window, occurrence cap and the number of
+          kmers and postings it masked, number of kmer slots and of kmers
+          present, number of postings (sequence ids by kmer), mean posting
+          list length and index size in bytes.
+        )pbdoc" )
+      .def( "search_stats", &SearchStatsToPython< DNA >, R"pbdoc(
+          Number of queries searched, candidates aligned, accepted and
+          rejected, of rejected candidates abandoned before their alignment
+          was complete and of those skipped by the edit distance filter,
+          summed over the searches of the database since it was built,
+          loaded or reset (reset=True resets them after reading).
+        )pbdoc",
+            py::arg( "reset" ) = false )
+      .def( "__len__", &SearchDatabase< DNA >::NumSequences )
+      .def_property_readonly( "wordSize", &SearchDatabase< DNA >::KmerLength );
+
+    py::class_< SearchDatabase< Protein > >( m, "ProteinDatabase", R"pbdoc(
+          Protein database, indexed once and searchable many times.
+          Built from a FASTA/FASTQ path, a dict {id: sequence} or an
+          iterable of (id, sequence) pairs.
+        )pbdoc" )
+      .def( py::init( &SearchDatabaseFromFile< Protein > ), py::arg( "databasePath" ),
+            py::arg( "threads" ) = 0, py::arg( "compress" ) = false,
+            py::arg( "wordSize" ) = py::none(), py::arg( "sparse" ) = py::none(),
+            py::arg( "targetMemory" ) = IndexParams().targetMemory,
+            py::arg( "seeds" ) = py::none(),
+            py::arg( "minimizerWindow" ) = 1,
+            py::arg( "maxKmerOccurrences" ) = py::none() )
+      .def( py::init( &SearchDatabaseFromPython< Protein > ), py::arg( "sequences" ),
+            py::arg( "threads" ) = 0, py::arg( "compress" ) = false,
+            py::arg( "wordSize" ) = py::none(), py::arg( "sparse" ) = py::none(),
+            py::arg( "targetMemory" ) = IndexParams().targetMemory,
+            py::arg( "seeds" ) = py::none(),
+            py::arg( "minimizerWindow" ) = 1,
+            py::arg( "maxKmerOccurrences" ) = py::none() )
+      .def( "search",
+            []( const SearchDatabase< Protein >& db, const py::object& queries,
+                const py::object& outputPath, int maxAccepts, int maxRejects,
+                double minIdentity, int threads, bool lengthFilter ) {
+              return SearchFromPython( db, queries, outputPath,
+                                       ProteinSearchParams( maxAccepts, maxRejects, minIdentity,
+                                                            lengthFilter ),
+                                       threads );
+            }, R"pbdoc(
+          Search queries (FASTA/FASTQ path, dict or list of (id, sequence)
+          pairs) against the indexed database. Hits are written to
+          outputPath (ALNOUT, or CSV for a .csv extension) if given,
+          otherwise they are returned as a dict of columns.
+        )pbdoc",
+            py::arg( "queries" ),
+            py::arg( "outputPath" ) = py::none(),
+            py::arg( "maxAccepts" ) = 1,
+            py::arg( "maxRejects" ) = 16,
+            py::arg( "minIdentity" ) = 0.75,
+            py::arg( "threads" ) = 0,
+            py::arg( "lengthFilter" ) = false )
+      .def( "stream",
+            []( const SearchDatabase< Protein >& db, int maxAccepts, int maxRejects,
+                double minIdentity, int threads, bool lengthFilter ) {
+              return std::unique_ptr< SearchStream< Protein > >( new SearchStream< Protein >(
+                db, ProteinSearchParams( maxAccepts, maxRejects, minIdentity,
+                                         lengthFilter ),
+                threads ) );
+            }, R"pbdoc(
+          Open a stream to search chunks of queries against the database
+          in the background.
+        )pbdoc",
+            py::keep_alive< 0, 1 >(),
+            py::arg( "maxAccepts" ) = 1,
+            py::arg( "maxRejects" ) = 16,
+            py::arg( "minIdentity" ) = 0.75,
+            py::arg( "threads" ) = 0,
+            py::arg( "lengthFilter" ) = false )
+      .def( "save", &SaveSearchDatabase< Protein >, R"pbdoc(
+          Write the index to indexPath, for load_database.
+        )pbdoc",
+            py::arg( "indexPath" ) )
+      .def( "memory_usage", &MemoryUsageToPython< Protein >, R"pbdoc(
+          Bytes taken by the kmer index, next to what the previous layout
+          (size_t offset and count arrays) would take.
+        )pbdoc" )
+      .def( "index_stats", &IndexStatsToPython< Protein >, R"pbdoc(
+          Word size, seed patterns (None for contiguous words), whether the
+          index is sparse, minimizer window, occurrence cap and the number of
+          kmers and postings it masked, number of kmer slots and of kmers
+          present, number of postings (sequence ids by kmer), mean posting
+          list length and index size in bytes.
+        )pbdoc" )
+      .def( "search_stats", &SearchStatsToPython< Protein >, R"pbdoc(
+          Number of queries searched, candidates aligned, accepted and
+          rejected, and of rejected candidates abandoned before their
+          alignment was complete, summed over the searches of the database
+          since it was built, loaded or reset (reset=True resets them after
+          reading).
+        )pbdoc",
+            py::arg( "reset" ) = false )
+      .def( "__len__", &SearchDatabase< Protein >::NumSequences )
+      .def_property_readonly( "wordSize", &SearchDatabase< Protein >::KmerLength );
+
 #ifdef VERSION_INFO
     m.attr("__version__") = MACRO_STRINGIFY(VERSION_INFO);
 #else
     m.attr("__version__") = "dev";
 #endif
-}
\ No newline at end of file
+}
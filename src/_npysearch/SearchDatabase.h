@@ -0,0 +1,677 @@
+#pragma once
+
+#include <nsearch/Database.h>
+#include <nsearch/Database/HitWriter.h>
+#include <nsearch/Database/GlobalSearch.h>
+#include <nsearch/Sequence.h>
+#include <nsearch/Alphabet/DNA.h>
+#include <nsearch/Alphabet/Protein.h>
+
+#include <string>
+#include <limits>
+#include <memory>
+#include <map>
+#include <mutex>
+#include <condition_variable>
+#include <exception>
+#include <vector>
+#include <stdexcept>
+
+#include "Common.h"
+#include "FileFormat.h"
+#include "HitColumns.h"
+#include "ThreadPool.h"
+
+template < typename A >
+using QueryWithHits     = std::pair< Sequence< A >, HitList< A > >;
+
+template < typename A >
+using QueryWithHitsList = std::deque< QueryWithHits< A > >;
+
+template < typename A >
+class QueueItemInfo< QueryWithHitsList< A > > {
+public:
+  static size_t Count( const QueryWithHitsList< A >& list ) {
+    return std::accumulate(
+      list.begin(), list.end(), 0,
+      []( int sum, const QueryWithHits< A >& q ) { return sum + q.second.size(); } );
+  }
+};
+
+template < typename A >
+class SearchResultsWriterWorker {
+public:
+  SearchResultsWriterWorker( const std::string& path )
+      : mWriter( std::move(
+          DetectFileFormatAndOpenHitWriter< A >( path, FileFormat::ALNOUT ) ) ) {}
+
+  void Process( const QueryWithHitsList< A >& queryWithHitsList ) {
+    for( auto& queryWithHits : queryWithHitsList ) {
+      ( *mWriter ) << queryWithHits;
+    }
+  }
+
+private:
+  std::unique_ptr< HitWriter< A > > mWriter;
+};
+
+template < typename A >
+using SearchResultsWriter =
+  PooledWorkerQueue< SearchResultsWriterWorker< A >, QueryWithHitsList< A >,
+               const std::string& >;
+
+template < typename A >
+class QueueItemInfo< SequenceList< A > > {
+public:
+  static size_t Count( const SequenceList< A >& list ) {
+    return list.size();
+  }
+};
+
+// Search statistics of all the searches of a database, added up by the
+// workers after each batch of queries
+class CollectedSearchStats {
+public:
+  void Add( const SearchStats& stats ) {
+    std::unique_lock< std::mutex > lock( mMutex );
+    mStats += stats;
+  }
+
+  SearchStats Get() const {
+    std::unique_lock< std::mutex > lock( mMutex );
+    return mStats;
+  }
+
+  // Get and reset
+  SearchStats Take() {
+    std::unique_lock< std::mutex > lock( mMutex );
+    SearchStats stats = mStats;
+    mStats            = SearchStats();
+    return stats;
+  }
+
+private:
+  mutable std::mutex mMutex;
+  SearchStats        mStats;
+};
+
+template < typename A >
+class QueryDatabaseSearcherWorker {
+public:
+  QueryDatabaseSearcherWorker( SearchResultsWriter< A >* writer,
+                               const Database< A >*      database,
+                               const SearchParams< A > &params,
+                               CollectedSearchStats*     stats )
+      : mGlobalSearch( *database, params ), mWriter( *writer ),
+        mStats( *stats ) {}
+
+  void Process( const SequenceList< A >& queries ) {
+    QueryWithHitsList< A > list;
+
+    for( auto& query : queries ) {
+      auto hits = mGlobalSearch.Query( query );
+      if( hits.empty() )
+        continue;
+
+      list.push_back( { query, hits } );
+    }
+
+    if( !list.empty() ) {
+      mWriter.Enqueue( list );
+    }
+
+    mStats.Add( mGlobalSearch.Stats() );
+    mGlobalSearch.ResetStats();
+  }
+
+private:
+  GlobalSearch< A >         mGlobalSearch;
+  SearchResultsWriter< A >& mWriter;
+  CollectedSearchStats&     mStats;
+};
+
+template < typename A >
+using QueryDatabaseSearcher =
+  PooledWorkerQueue< QueryDatabaseSearcherWorker< A >, SequenceList< A >,
+               SearchResultsWriter< A >*, const Database< A >*,
+               const SearchParams< A >&, CollectedSearchStats* >;
+
+// Queries numbered in the order they were read, so that the
+// hits can be returned in query order
+template < typename A >
+using QueryBatch = std::pair< size_t, SequenceList< A > >;
+
+template < typename A >
+class QueueItemInfo< QueryBatch< A > > {
+public:
+  static size_t Count( const QueryBatch< A >& batch ) {
+    return batch.second.size();
+  }
+};
+
+class CollectedHits {
+public:
+  void Add( const size_t batchNo, HitColumns&& columns,
+            std::vector< size_t >&& numHitsByQuery ) {
+    {
+      std::unique_lock< std::mutex > lock( mMutex );
+      mBatches[ batchNo ] = { std::move( columns ), std::move( numHitsByQuery ) };
+    }
+    mBatchAdded.notify_all();
+  }
+
+  HitColumns Merge() {
+    HitColumns columns;
+    for( auto& batch : mBatches ) {
+      columns.Append( std::move( batch.second.columns ) );
+    }
+    mBatches.clear();
+    return columns;
+  }
+
+  // Batches that are still missing will never come: Take throws error
+  void Fail( const std::exception_ptr& error ) {
+    {
+      std::unique_lock< std::mutex > lock( mMutex );
+      mError = error;
+    }
+    mBatchAdded.notify_all();
+  }
+
+  // Waits until batches [fromBatchNo, toBatchNo) are all collected,
+  // then removes and merges them
+  HitColumns Take( const size_t fromBatchNo, const size_t toBatchNo,
+                   std::vector< size_t >* numHitsByQuery ) {
+    std::unique_lock< std::mutex > lock( mMutex );
+    mBatchAdded.wait( lock, [&] {
+      if( mError )
+        return true;
+
+      for( size_t batchNo = fromBatchNo; batchNo < toBatchNo; batchNo++ ) {
+        if( mBatches.find( batchNo ) == mBatches.end() )
+          return false;
+      }
+      return true;
+    } );
+    if( mError )
+      std::rethrow_exception( mError );
+
+    HitColumns columns;
+    for( size_t batchNo = fromBatchNo; batchNo < toBatchNo; batchNo++ ) {
+      auto it = mBatches.find( batchNo );
+      columns.Append( std::move( it->second.columns ) );
+      numHitsByQuery->insert( numHitsByQuery->end(),
+                              it->second.numHitsByQuery.begin(),
+                              it->second.numHitsByQuery.end() );
+      mBatches.erase( it );
+    }
+    return columns;
+  }
+
+private:
+  struct Batch {
+    HitColumns            columns;
+    std::vector< size_t > numHitsByQuery;
+  };
+
+  std::mutex                mMutex;
+  std::condition_variable   mBatchAdded;
+  std::map< size_t, Batch > mBatches;
+  std::exception_ptr        mError;
+};
+
+template < typename A >
+class QueryDatabaseCollectorWorker {
+public:
+  QueryDatabaseCollectorWorker( CollectedHits*           hits,
+                                const Database< A >*     database,
+                                const SearchParams< A >& params,
+                                CollectedSearchStats*    stats )
+      : mGlobalSearch( *database, params ), mHits( *hits ), mStats( *stats ) {}
+
+  void Process( const QueryBatch< A >& batch ) {
+    HitColumns            columns;
+    std::vector< size_t > numHitsByQuery;
+
+    for( auto& query : batch.second ) {
+      auto hits = mGlobalSearch.Query( query );
+      for( auto& hit : hits ) {
+        columns.Add( query, hit );
+      }
+      numHitsByQuery.push_back( hits.size() );
+    }
+
+    mStats.Add( mGlobalSearch.Stats() );
+    mGlobalSearch.ResetStats();
+    mHits.Add( batch.first, std::move( columns ), std::move( numHitsByQuery ) );
+  }
+
+private:
+  GlobalSearch< A >     mGlobalSearch;
+  CollectedHits&        mHits;
+  CollectedSearchStats& mStats;
+};
+
+template < typename A >
+using QueryDatabaseCollector =
+  PooledWorkerQueue< QueryDatabaseCollectorWorker< A >, QueryBatch< A >,
+               CollectedHits*, const Database< A >*,
+               const SearchParams< A >&, CollectedSearchStats* >;
+
+template < typename A >
+struct WordSize {
+  static const int VALUE = 8; // DNA, default
+};
+
+template <>
+struct WordSize< Protein > {
+  static const int VALUE = 5;
+};
+
+// IndexParams::wordSize picking the word size with ChooseWordSize
+static const int AutoWordSize = -1;
+
+// IndexParams::sparseIndex using a sparse index when a dense kmer table
+// would not fit targetMemory
+static const int AutoSparseIndex = -1;
+
+struct IndexParams {
+  int    numThreads       = 0;     // <= 0: one per core
+  bool   compressPostings = false; // see Database::SetCompressPostings
+  int    wordSize         = 0;     // 0: WordSize< A >::VALUE
+  int    sparseIndex      = AutoSparseIndex; // see Database::SetSparseIndex
+  size_t targetMemory     = size_t( 1 ) << 30; // see Database::DenseTableMemory
+
+  // Spaced seeds instead of contiguous words, see
+  // Database::SetSeedPatterns. Excludes wordSize.
+  std::vector< std::string > seedPatterns;
+
+  size_t minimizerWindow = 1; // see Database::SetMinimizerWindow
+  size_t maxKmerOccurrences = 0; // see Database::SetMaxKmerOccurrences
+};
+
+// Longest word size, starting from the default, whose dense kmer table
+// fits into targetMemory and has no more entries than the database has
+// residues. Longer words mean shorter posting lists to go through for
+// every query kmer.
+template < typename A >
+static size_t ChooseWordSize( const SequenceList< A >& sequences,
+                              const size_t             targetMemory,
+                              const bool               compressPostings ) {
+  size_t numResidues = 0;
+  for( auto& seq : sequences ) {
+    numResidues += seq.Length();
+  }
+
+  size_t wordSize = WordSize< A >::VALUE;
+  while( wordSize < Database< A >::MaxKmerLength() ) {
+    const size_t kmerBits = BitMapPolicy< A >::NumBits * ( wordSize + 1 );
+    if( ( size_t( 1 ) << kmerBits ) > numResidues ||
+        Database< A >::DenseTableMemory( kmerBits, numResidues,
+                                         compressPostings ) > targetMemory )
+      break;
+    wordSize++;
+  }
+  return wordSize;
+}
+
+static DNA::Strand ParseStrand( const std::string& strand ) {
+  if( strand == "both" || strand == "joint" ) return DNA::Strand::Both;
+  if( strand == "plus" ) return DNA::Strand::Plus;
+  if( strand == "minus" ) return DNA::Strand::Minus;
+  throw std::invalid_argument( "Strand must be 'plus', 'minus', 'both' or 'joint'." );
+}
+
+/*
+ * Database which is read and indexed once, and can then be searched
+ * repeatedly without rebuilding the kmer index
+ */
+template < typename A >
+class SearchDatabase {
+public:
+  SearchDatabase( const std::string& databasePath,
+                  const IndexParams& indexParams = IndexParams() );
+  SearchDatabase( SequenceList< A >&& sequences,
+                  const IndexParams& indexParams = IndexParams() );
+
+  // Index files written by Save are memory mapped by default
+  static std::unique_ptr< SearchDatabase > Load( const std::string& indexPath,
+                                                 const bool useMmap = true,
+                                                 const bool verifyChecksum = false );
+  void Save( const std::string& indexPath ) const;
+
+  // Searches run on the shared thread pool, using at most numThreads of
+  // its threads (numThreads <= 0: all of them)
+
+  // Write hits to a file (ALNOUT or CSV, depending on the extension)
+  void Search( const std::string& queryPath, const std::string& outputPath,
+               const SearchParams< A >& searchParams,
+               const int numThreads = 0 ) const;
+  void Search( SequenceList< A > queries, const std::string& outputPath,
+               const SearchParams< A >& searchParams,
+               const int numThreads = 0 ) const;
+
+  // Collect hits in query order
+  HitColumns Search( const std::string&       queryPath,
+                     const SearchParams< A >& searchParams,
+                     const int                numThreads = 0 ) const;
+  HitColumns Search( SequenceList< A >        queries,
+                     const SearchParams< A >& searchParams,
+                     const int                numThreads = 0 ) const;
+
+  size_t NumSequences() const;
+  size_t KmerLength() const;
+
+  const Database< A >& GetDatabase() const {
+    return mDatabase;
+  }
+
+  // Summed over the searches since the database was built or loaded (or
+  // the statistics were reset)
+  CollectedSearchStats& SearchStatistics() const {
+    return mSearchStats;
+  }
+
+private:
+  SearchDatabase() : mDatabase( WordSize< A >::VALUE ) {}
+
+  // Fills the list with the next batch of queries, returns false when done
+  using QueryProducer = std::function< bool( SequenceList< A >* ) >;
+
+  void Index( SequenceList< A >&& sequences, const IndexParams& indexParams,
+              ProgressOutput& progress );
+
+  QueryProducer ReadQueries( const std::string& queryPath,
+                             ProgressOutput&    progress ) const;
+  QueryProducer ListQueries( SequenceList< A >& queries ) const;
+
+  void SearchToFile( const QueryProducer& nextQueries,
+                     const std::string& outputPath,
+                     const SearchParams< A >& searchParams,
+                     const int numThreads, ProgressOutput& progress ) const;
+  HitColumns SearchToColumns( const QueryProducer&     nextQueries,
+                              const SearchParams< A >& searchParams,
+                              const int                numThreads,
+                              ProgressOutput&          progress ) const;
+
+  enum ProgressType {
+    ReadDBFile,
+    StatsDB,
+    IndexDB,
+    ReadQueryFile,
+    SearchDB,
+    WriteHits
+  };
+
+  static const int numQueriesPerWorkItem = 64;
+
+  Database< A >                mDatabase;
+  mutable CollectedSearchStats mSearchStats;
+};
+
+/*
+ * Implementation
+ */
+template < typename A >
+SearchDatabase< A >::SearchDatabase( const std::string& databasePath,
+                                     const IndexParams& indexParams )
+    : mDatabase( WordSize< A >::VALUE ) {
+  ProgressOutput progress;
+
+  Sequence< A >     seq;
+  SequenceList< A > sequences;
+
+  auto dbReader = DetectFileFormatAndOpenReader< A >( databasePath, FileFormat::FASTA );
+
+  progress.Add( ProgressType::ReadDBFile, "Read database", UnitType::BYTES );
+
+  // Read DB
+  progress.Activate( ProgressType::ReadDBFile );
+  while( !dbReader->EndOfFile() ) {
+    ( *dbReader ) >> seq;
+    sequences.push_back( std::move( seq ) );
+    progress.Set( ProgressType::ReadDBFile, dbReader->NumBytesRead(),
+                  dbReader->NumBytesTotal() );
+  }
+
+  Index( std::move( sequences ), indexParams, progress );
+}
+
+template < typename A >
+SearchDatabase< A >::SearchDatabase( SequenceList< A >&& sequences,
+                                     const IndexParams&  indexParams )
+    : mDatabase( WordSize< A >::VALUE ) {
+  ProgressOutput progress;
+  Index( std::move( sequences ), indexParams, progress );
+}
+
+template < typename A >
+std::unique_ptr< SearchDatabase< A > >
+SearchDatabase< A >::Load( const std::string& indexPath, const bool useMmap,
+                           const bool verifyChecksum ) {
+  std::unique_ptr< SearchDatabase > db( new SearchDatabase() );
+  db->mDatabase.Load( indexPath, useMmap, verifyChecksum );
+  return db;
+}
+
+template < typename A >
+void SearchDatabase< A >::Save( const std::string& indexPath ) const {
+  mDatabase.Save( indexPath );
+}
+
+template < typename A >
+void SearchDatabase< A >::Index( SequenceList< A >&& sequences,
+                                 const IndexParams&  indexParams,
+                                 ProgressOutput&     progress ) {
+  if( !indexParams.seedPatterns.empty() ) {
+    if( indexParams.wordSize != 0 )
+      throw std::invalid_argument(
+        "Word size and seed patterns cannot be combined" );
+    mDatabase.SetSeedPatterns( indexParams.seedPatterns );
+  } else if( indexParams.wordSize == AutoWordSize ) {
+    mDatabase.SetKmerLength(
+      ChooseWordSize( sequences, indexParams.targetMemory,
+                      indexParams.compressPostings ) );
+  } else if( indexParams.wordSize != 0 ) {
+    mDatabase.SetKmerLength( indexParams.wordSize );
+  }
+
+  if( indexParams.sparseIndex == AutoSparseIndex ) {
+    size_t numKmers = 0;
+    for( auto& seq : sequences ) {
+      numKmers += seq.Length() * mDatabase.NumSeedPatterns();
+    }
+    mDatabase.SetSparseIndex(
+      Database< A >::DenseTableMemory( mDatabase.KmerBits(), numKmers,
+                                       indexParams.compressPostings ) >
+      indexParams.targetMemory );
+  } else {
+    mDatabase.SetSparseIndex( indexParams.sparseIndex != 0 );
+  }
+
+  mDatabase.SetMinimizerWindow( indexParams.minimizerWindow );
+  mDatabase.SetMaxKmerOccurrences( indexParams.maxKmerOccurrences );
+
+  progress.Add( ProgressType::StatsDB, "Analyze database" );
+  progress.Add( ProgressType::IndexDB, "Index database" );
+
+  mDatabase.SetProgressCallback(
+    [&]( typename Database< A >::ProgressType type, size_t num, size_t total ) {
+      switch( type ) {
+        case Database< A >::ProgressType::StatsCollection:
+          progress.Activate( ProgressType::StatsDB )
+            .Set( ProgressType::StatsDB, num, total );
+          break;
+
+        case Database< A >::ProgressType::Indexing:
+          progress.Activate( ProgressType::IndexDB )
+            .Set( ProgressType::IndexDB, num, total );
+          break;
+
+        default:
+          break;
+      }
+    } );
+  mDatabase.SetNumThreads( indexParams.numThreads );
+  mDatabase.SetCompressPostings( indexParams.compressPostings );
+  mDatabase.Initialize( std::move( sequences ) );
+  mDatabase.SetProgressCallback(
+    []( typename Database< A >::ProgressType, size_t, size_t ) {} );
+}
+
+template < typename A >
+typename SearchDatabase< A >::QueryProducer
+SearchDatabase< A >::ReadQueries( const std::string& queryPath,
+                                  ProgressOutput&    progress ) const {
+  progress.Add( ProgressType::ReadQueryFile, "Read queries", UnitType::BYTES );
+
+  std::shared_ptr< SequenceReader< A > > qryReader =
+    DetectFileFormatAndOpenReader< A >( queryPath, FileFormat::FASTA );
+
+  progress.Activate( ProgressType::ReadQueryFile );
+  return [qryReader, &progress]( SequenceList< A >* queries ) {
+    if( qryReader->EndOfFile() )
+      return false;
+
+    qryReader->Read( numQueriesPerWorkItem, queries );
+    progress.Set( ProgressType::ReadQueryFile, qryReader->NumBytesRead(),
+                  qryReader->NumBytesTotal() );
+    return true;
+  };
+}
+
+template < typename A >
+typename SearchDatabase< A >::QueryProducer
+SearchDatabase< A >::ListQueries( SequenceList< A >& queries ) const {
+  auto it = queries.begin();
+  return [it, &queries]( SequenceList< A >* batch ) mutable {
+    if( it == queries.end() )
+      return false;
+
+    for( int i = 0; i < numQueriesPerWorkItem && it != queries.end(); i++ ) {
+      batch->push_back( std::move( *it++ ) );
+    }
+    return true;
+  };
+}
+
+template < typename A >
+void SearchDatabase< A >::Search( const std::string&       queryPath,
+                                  const std::string&       outputPath,
+                                  const SearchParams< A >& searchParams,
+                                  const int                numThreads ) const {
+  ProgressOutput progress;
+  SearchToFile( ReadQueries( queryPath, progress ), outputPath, searchParams,
+                numThreads, progress );
+}
+
+template < typename A >
+void SearchDatabase< A >::Search( SequenceList< A >        queries,
+                                  const std::string&       outputPath,
+                                  const SearchParams< A >& searchParams,
+                                  const int                numThreads ) const {
+  ProgressOutput progress;
+  SearchToFile( ListQueries( queries ), outputPath, searchParams, numThreads,
+                progress );
+}
+
+template < typename A >
+HitColumns
+SearchDatabase< A >::Search( const std::string&       queryPath,
+                             const SearchParams< A >& searchParams,
+                             const int                numThreads ) const {
+  ProgressOutput progress;
+  return SearchToColumns( ReadQueries( queryPath, progress ), searchParams,
+                          numThreads, progress );
+}
+
+template < typename A >
+HitColumns
+SearchDatabase< A >::Search( SequenceList< A >        queries,
+                             const SearchParams< A >& searchParams,
+                             const int                numThreads ) const {
+  ProgressOutput progress;
+  return SearchToColumns( ListQueries( queries ), searchParams, numThreads,
+                          progress );
+}
+
+template < typename A >
+void SearchDatabase< A >::SearchToFile( const QueryProducer&     nextQueries,
+                                        const std::string&       outputPath,
+                                        const SearchParams< A >& searchParams,
+                                        const int                numThreads,
+                                        ProgressOutput&          progress ) const {
+  progress.Add( ProgressType::SearchDB, "Search database" );
+  progress.Add( ProgressType::WriteHits, "Write hits" );
+
+  SearchResultsWriter< A >   writer( &SharedThreadPool(), 1, outputPath );
+  QueryDatabaseSearcher< A > searcher( &SharedThreadPool(), numThreads, &writer,
+                                       &mDatabase, searchParams, &mSearchStats );
+
+  searcher.OnProcessed( [&]( size_t numProcessed, size_t numEnqueued ) {
+    progress.Set( ProgressType::SearchDB, numProcessed, numEnqueued );
+  } );
+  writer.OnProcessed( [&]( size_t numProcessed, size_t numEnqueued ) {
+    progress.Set( ProgressType::WriteHits, numProcessed, numEnqueued );
+  } );
+
+  // Read and process queries
+  SequenceList< A > queries;
+  while( nextQueries( &queries ) ) {
+    searcher.Enqueue( queries );
+    queries.clear();
+  }
+
+  // Search
+  progress.Activate( ProgressType::SearchDB );
+  searcher.WaitTillDone();
+
+  progress.Activate( ProgressType::WriteHits );
+  writer.WaitTillDone();
+
+  std::cout << "\n";
+}
+
+template < typename A >
+HitColumns
+SearchDatabase< A >::SearchToColumns( const QueryProducer&     nextQueries,
+                                      const SearchParams< A >& searchParams,
+                                      const int                numThreads,
+                                      ProgressOutput&          progress ) const {
+  progress.Add( ProgressType::SearchDB, "Search database" );
+
+  CollectedHits               hits;
+  QueryDatabaseCollector< A > searcher( &SharedThreadPool(), numThreads, &hits,
+                                        &mDatabase, searchParams,
+                                        &mSearchStats );
+
+  searcher.OnProcessed( [&]( size_t numProcessed, size_t numEnqueued ) {
+    progress.Set( ProgressType::SearchDB, numProcessed, numEnqueued );
+  } );
+
+  // Read and process queries
+  QueryBatch< A > batch;
+  size_t          batchNo = 0;
+  while( nextQueries( &batch.second ) ) {
+    batch.first = batchNo++;
+    searcher.Enqueue( batch );
+    batch.second.clear();
+  }
+
+  // Search
+  progress.Activate( ProgressType::SearchDB );
+  searcher.WaitTillDone();
+
+  std::cout << "\n";
+  return hits.Merge();
+}
+
+template < typename A >
+size_t SearchDatabase< A >::NumSequences() const {
+  return mDatabase.NumSequences();
+}
+
+template < typename A >
+size_t SearchDatabase< A >::KmerLength() const {
+  return mDatabase.KmerLength();
+}
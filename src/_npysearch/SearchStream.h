@@ -0,0 +1,87 @@
+#pragma once
+
+#include <deque>
+#include <stdexcept>
+#include <string>
+#include <vector>
+
+#include "SearchDatabase.h"
+
+/*
+ * Chunks of queries searched in the background while earlier chunks are
+ * being consumed. Hits of a chunk are handed out in query order once all
+ * of its queries have been searched.
+ */
+template < typename A >
+class SearchStream {
+public:
+  SearchStream( const SearchDatabase< A >& db,
+                const SearchParams< A >&   searchParams,
+                const int                  numThreads = 0 )
+      : mSearcher( &SharedThreadPool(), numThreads, &mHits, &db.GetDatabase(),
+                   searchParams, &db.SearchStatistics() ),
+        mNextBatchNo( 0 ) {
+    // Wakes Next up when a search fails
+    mSearcher.OnError(
+      [this]( const std::exception_ptr& error ) { mHits.Fail( error ); } );
+  }
+
+  // Splits the chunk into work items of numQueriesPerWorkItem queries
+  void Enqueue( SequenceList< A >&& queries ) {
+    Chunk chunk;
+    chunk.fromBatchNo = mNextBatchNo;
+
+    QueryBatch< A > batch;
+    for( auto& query : queries ) {
+      chunk.queryIds.push_back( query.identifier );
+      batch.second.push_back( std::move( query ) );
+
+      if( batch.second.size() == numQueriesPerWorkItem ) {
+        batch.first = mNextBatchNo++;
+        mSearcher.Enqueue( batch );
+        batch.second.clear();
+      }
+    }
+
+    if( !batch.second.empty() ) {
+      batch.first = mNextBatchNo++;
+      mSearcher.Enqueue( batch );
+    }
+
+    chunk.toBatchNo = mNextBatchNo;
+    mChunks.push_back( std::move( chunk ) );
+  }
+
+  size_t NumPending() const {
+    return mChunks.size();
+  }
+
+  // Waits for the oldest chunk. numHitsByQuery has one entry per query
+  // in queryIds, the hit rows are in the same order.
+  HitColumns Next( std::vector< std::string >* queryIds,
+                   std::vector< size_t >*      numHitsByQuery ) {
+    if( mChunks.empty() )
+      throw std::out_of_range( "No queries pending" );
+
+    Chunk chunk = std::move( mChunks.front() );
+    mChunks.pop_front();
+
+    *queryIds = std::move( chunk.queryIds );
+    return mHits.Take( chunk.fromBatchNo, chunk.toBatchNo, numHitsByQuery );
+  }
+
+private:
+  struct Chunk {
+    size_t                     fromBatchNo, toBatchNo;
+    std::vector< std::string > queryIds;
+  };
+
+  static const size_t numQueriesPerWorkItem = 64;
+
+  // Declared before the searcher, whose workers write into it
+  CollectedHits               mHits;
+  QueryDatabaseCollector< A > mSearcher;
+
+  size_t              mNextBatchNo;
+  std::deque< Chunk > mChunks;
+};
@@ -0,0 +1,51 @@
+#pragma once
+
+#include <nsearch/Sequence.h>
+#include <nsearch/Alphabet.h>
+
+#include <memory>
+#include <string>
+
+#include "FileFormat.h"
+
+/*
+ * Residues of no particular alphabet: sequence files are read without
+ * knowing what they will be searched as
+ */
+struct AnyAlphabet {
+  typedef char CharType;
+
+  static const char* Name() { return "Any"; }
+};
+
+/*
+ * Sequences of a FASTA/FASTQ file (by extension, FASTA otherwise), read
+ * in batches through the buffered SequenceReader. They are kept as they
+ * are in the file: the search upper-cases what it is given.
+ */
+class SequenceIterator {
+public:
+  SequenceIterator( const std::string& path )
+      : mReader( DetectFileFormatAndOpenReader< AnyAlphabet >(
+          path, FileFormat::FASTA ) ) {
+    mReader->SetUpcase( false );
+  }
+
+  // Returns false once the file is exhausted
+  bool NextBatch( const size_t count, SequenceList< AnyAlphabet >* batch ) {
+    batch->clear();
+    mReader->Read( count, batch );
+    return !batch->empty();
+  }
+
+  size_t NumBytesRead() const {
+    return mReader->NumBytesRead();
+  }
+
+  size_t NumBytesTotal() const {
+    return mReader->NumBytesTotal();
+  }
+
+private:
+  std::unique_ptr< SequenceReader< AnyAlphabet > > mReader;
+};
@@ -35,10 +35,18 @@ inline bool IsBlank( const std::string& str ) {
   return str.empty() || std::all_of( str.begin(), str.end(), isspace );
 }
 
+// Files written on Windows end their lines with \r\n
+inline void StripCarriageReturn( std::string& str ) {
+  if( !str.empty() && str.back() == '\r' )
+    str.pop_back();
+}
+
 void TextStreamReader::operator>>( std::string& str ) {
   do {
     getline( mInput, str );
   } while( !EndOfFile() && IsBlank( str ) );
+
+  StripCarriageReturn( str );
 }
 
 /*
@@ -102,8 +110,8 @@ TextFileReader::~TextFileReader() {
 }
 
 void TextFileReader::operator>>( std::string& str ) {
-  str.clear();
 ReadLine:
+  str.clear();
   while( !EndOfFile() ) {
     char* pos =
       ( char* ) memchr( mBuffer + mBufferPos, '\n', mBufferSize - mBufferPos );
@@ -125,6 +133,8 @@ ReadLine:
 
   if( IsBlank( str ) && !EndOfFile() )
     goto ReadLine;
+
+  StripCarriageReturn( str );
 }
 
 bool TextFileReader::EndOfFile() const {
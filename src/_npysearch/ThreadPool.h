@@ -0,0 +1,357 @@
+#pragma once
+
+#include <algorithm>
+#include <atomic>
+#include <condition_variable>
+#include <deque>
+#include <exception>
+#include <functional>
+#include <future>
+#include <memory>
+#include <mutex>
+#include <queue>
+#include <thread>
+#include <tuple>
+#include <utility>
+#include <vector>
+
+#include <unistd.h>
+
+#include "WorkerQueue.h"
+
+/*
+ * Fixed set of threads running tasks, kept alive between searches
+ */
+class ThreadPool {
+public:
+  using Task = std::packaged_task< void() >;
+
+  ThreadPool( const int numThreads = 0 )
+      : mPid( getpid() ), mSync( new Sync() ), mNumThreads( 0 ),
+        mNumBusy( 0 ) {
+    Resize( numThreads );
+  }
+
+  ~ThreadPool() {
+    SetNumThreads( 0 );
+  }
+
+  ThreadPool( const ThreadPool& ) = delete;
+  ThreadPool& operator=( const ThreadPool& ) = delete;
+
+  // numThreads <= 0 means one thread per core. Shrinking waits for the
+  // running tasks of the threads that are stopped.
+  void Resize( const int numThreads ) {
+    SetNumThreads( numThreads > 0
+                     ? numThreads
+                     : std::max( 1u, std::thread::hardware_concurrency() ) );
+  }
+
+  // The future holds what the task throws
+  std::future< void > Submit( const std::function< void() >& fn ) {
+    RestartAfterFork();
+
+    Task                task( fn );
+    std::future< void > result = task.get_future();
+    {
+      std::unique_lock< std::mutex > lock( mSync->mutex );
+      mTasks.push( std::move( task ) );
+    }
+    mSync->condition.notify_one();
+    return result;
+  }
+
+  size_t Size() {
+    RestartAfterFork();
+    return mNumThreads;
+  }
+
+  size_t NumBusy() {
+    RestartAfterFork();
+    return mNumBusy;
+  }
+
+  size_t NumQueued() {
+    RestartAfterFork();
+
+    std::unique_lock< std::mutex > lock( mSync->mutex );
+    return mTasks.size();
+  }
+
+private:
+  void SetNumThreads( const size_t numThreads ) {
+    RestartAfterFork();
+
+    std::unique_lock< std::mutex > resizeLock( mSync->resizeMutex );
+    std::vector< std::thread >     stopped;
+    {
+      std::unique_lock< std::mutex > lock( mSync->mutex );
+      mNumThreads = numThreads;
+
+      while( mThreads.size() < numThreads ) {
+        size_t index = mThreads.size();
+        mThreads.push_back( std::thread( [this, index] { ThreadLoop( index ); } ) );
+      }
+      // Never shrunk: a stopped thread still clears its slot
+      if( mRunning.size() < numThreads )
+        mRunning.resize( numThreads, NULL );
+      while( mThreads.size() > numThreads ) {
+        stopped.push_back( std::move( mThreads.back() ) );
+        mThreads.pop_back();
+      }
+    }
+
+    mSync->condition.notify_all();
+    for( auto& thread : stopped ) {
+      thread.join();
+    }
+  }
+
+  // Only the forking thread survives in a child process (e.g. with
+  // multiprocessing). The handles of the parent's threads cannot be
+  // joined there, so they are detached, and new threads are started.
+  // The threads may have held the locks at the fork, and destroying a
+  // locked mutex is undefined, so the locks and condition are replaced
+  // and the old ones left behind.
+  //
+  // The child has its own copy of the queue, and its new threads run the
+  // queued tasks, so that their futures in the child are fulfilled. The
+  // tasks that were running cannot be finished: they are destroyed,
+  // which makes their futures throw broken_promise instead of never
+  // becoming ready.
+  void RestartAfterFork() {
+    if( mPid == getpid() )
+      return;
+
+    mPid = getpid();
+    mSync.release();
+    mSync.reset( new Sync() );
+
+    for( auto& thread : mThreads ) {
+      thread.detach();
+    }
+    mThreads.clear();
+
+    // They live on the stacks of the parent's threads, which the child
+    // still has a copy of
+    for( auto& running : mRunning ) {
+      if( running ) {
+        Task abandoned( std::move( *running ) );
+        running = NULL;
+      }
+    }
+    mNumBusy = 0;
+
+    size_t numThreads = mNumThreads;
+    mNumThreads       = 0;
+    SetNumThreads( numThreads );
+  }
+
+  void ThreadLoop( const size_t index ) {
+    while( true ) {
+      Task task;
+      {
+        std::unique_lock< std::mutex > lock( mSync->mutex );
+        mSync->condition.wait( lock, [&] {
+          return index >= mNumThreads || !mTasks.empty();
+        } );
+
+        if( index >= mNumThreads )
+          break;
+
+        task = std::move( mTasks.front() );
+        mTasks.pop();
+        mRunning[ index ] = &task;
+        mNumBusy++;
+      }
+
+      task();
+
+      {
+        std::unique_lock< std::mutex > lock( mSync->mutex );
+        mRunning[ index ] = NULL;
+        mNumBusy--;
+      }
+    }
+  }
+
+  struct Sync {
+    std::mutex              resizeMutex;
+    std::mutex              mutex;
+    std::condition_variable condition;
+  };
+
+  pid_t                      mPid;
+  std::unique_ptr< Sync >    mSync;
+  std::vector< std::thread > mThreads;
+  std::queue< Task >         mTasks;
+  std::vector< Task* >       mRunning; // by thread index, NULL when idle
+  std::atomic< size_t >      mNumThreads;
+  std::atomic< size_t >      mNumBusy;
+};
+
+// Pool shared by all searches of the module
+inline ThreadPool& SharedThreadPool() {
+  static ThreadPool pool;
+  return pool;
+}
+
+/*
+ * Same interface as WorkerQueue, but the items are processed by tasks on
+ * a ThreadPool instead of threads of its own. At most numWorkers tasks
+ * work on the queue at a time (numWorkers <= 0: as many as the pool has
+ * threads). Workers are created on demand and reused until the queue is
+ * destroyed, so a worker holding e.g. an output file is never recreated.
+ *
+ * The first exception a worker throws (creating the worker or processing
+ * an item) drops the queued items and goes to the OnError callbacks;
+ * Enqueue and WaitTillDone rethrow it from then on.
+ */
+template < class Worker, class QueueItem, typename... Args >
+class PooledWorkerQueue {
+public:
+  using OnProcessedCallback =
+    std::function< void( const size_t, const size_t ) >;
+  using OnErrorCallback = std::function< void( const std::exception_ptr& ) >;
+
+  PooledWorkerQueue( ThreadPool* pool, const int numWorkers, Args... args )
+      : mPool( *pool ),
+        mMaxWorkers( numWorkers <= 0 ? pool->Size() : numWorkers ),
+        mArgs( args... ), mStop( false ), mNumActive( 0 ),
+        mTotalEnqueued( 0 ), mTotalProcessed( 0 ) {}
+
+  ~PooledWorkerQueue() {
+    std::unique_lock< std::mutex > lock( mMutex );
+    mStop = true;
+    mIdle.wait( lock, [&] { return mNumActive == 0; } );
+  }
+
+  void Enqueue( QueueItem& queueItem ) {
+    bool startWorker = false;
+    {
+      std::unique_lock< std::mutex > lock( mMutex );
+      if( mError )
+        std::rethrow_exception( mError );
+
+      mTotalEnqueued += QueueItemInfo< QueueItem >::Count( queueItem );
+      mQueue.push( std::move( queueItem ) );
+
+      if( mNumActive < mMaxWorkers ) {
+        mNumActive++;
+        startWorker = true;
+      }
+    }
+
+    if( startWorker ) {
+      mPool.Submit( [this] { this->WorkerLoop(); } );
+    }
+  }
+
+  bool Done() const {
+    std::unique_lock< std::mutex > lock( mMutex );
+    return mNumActive == 0 && mQueue.empty();
+  }
+
+  void WaitTillDone() {
+    std::unique_lock< std::mutex > lock( mMutex );
+    mIdle.wait( lock, [&] { return mNumActive == 0 && mQueue.empty(); } );
+    if( mError )
+      std::rethrow_exception( mError );
+  }
+
+  void OnProcessed( const OnProcessedCallback& callback ) {
+    mProcessedCallbacks.push_back( callback );
+  }
+
+  void OnError( const OnErrorCallback& callback ) {
+    mErrorCallbacks.push_back( callback );
+  }
+
+private:
+  using ArgsTuple = std::tuple< typename std::decay< Args >::type... >;
+
+  template < size_t... I >
+  Worker* NewWorker( std::index_sequence< I... > ) {
+    return new Worker( std::get< I >( mArgs )... );
+  }
+
+  // Drains the queue, then hands the worker back for the next task
+  void WorkerLoop() {
+    std::unique_ptr< Worker > worker;
+    {
+      std::unique_lock< std::mutex > lock( mMutex );
+      if( !mIdleWorkers.empty() ) {
+        worker = std::move( mIdleWorkers.back() );
+        mIdleWorkers.pop_back();
+      }
+    }
+
+    try {
+      if( !worker ) {
+        worker.reset(
+          NewWorker( std::make_index_sequence< sizeof...( Args ) >() ) );
+      }
+
+      QueueItem queueItem;
+      while( true ) {
+        { // acquire lock
+          std::unique_lock< std::mutex > lock( mMutex );
+          if( mStop || mQueue.empty() ) {
+            mIdleWorkers.push_back( std::move( worker ) );
+            mNumActive--;
+
+            // Notify under the lock: once it is released, the queue
+            // may be destroyed
+            mIdle.notify_all();
+            return;
+          }
+
+          queueItem = std::move( mQueue.front() );
+          mQueue.pop();
+        } // release lock
+
+        worker->Process( queueItem );
+
+        { // acquire lock
+          std::unique_lock< std::mutex > lock( mMutex );
+          mTotalProcessed += QueueItemInfo< QueueItem >::Count( queueItem );
+
+          for( auto& cb : mProcessedCallbacks ) {
+            cb( mTotalProcessed, mTotalEnqueued );
+          }
+        } // release lock
+      }
+    } catch( ... ) {
+      // The worker may be left in any state, so it is not reused
+      worker.reset();
+
+      std::unique_lock< std::mutex > lock( mMutex );
+      if( !mError ) {
+        mError = std::current_exception();
+        for( auto& cb : mErrorCallbacks ) {
+          cb( mError );
+        }
+      }
+      mQueue = std::queue< QueueItem >();
+      mNumActive--;
+      mIdle.notify_all();
+    }
+  }
+
+  ThreadPool& mPool;
+  size_t      mMaxWorkers;
+  ArgsTuple   mArgs;
+
+  mutable std::mutex                       mMutex;
+  std::condition_variable                  mIdle;
+  bool                                     mStop;
+  size_t                                   mNumActive;
+  std::queue< QueueItem >                  mQueue;
+  std::vector< std::unique_ptr< Worker > > mIdleWorkers;
+  std::exception_ptr                       mError;
+
+  size_t                            mTotalEnqueued;
+  size_t                            mTotalProcessed;
+  std::deque< OnProcessedCallback > mProcessedCallbacks;
+  std::deque< OnErrorCallback >     mErrorCallbacks;
+};
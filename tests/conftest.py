@@ -0,0 +1,46 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+ROOT      = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INCLUDE   = os.path.join(ROOT, "include")
+CPP       = os.path.join(ROOT, "tests", "cpp")
+EXTDATA   = os.path.join(ROOT, "inst", "extdata")
+TEST_DATA = os.path.join(ROOT, "tests", "data")
+
+
+@pytest.fixture(scope = "session")
+def runHarness(tmp_path_factory):
+    """
+    Compiles a C++ harness from tests/cpp against the nsearch headers and
+    runs it. Skips the test when no C++ compiler is available.
+
+    Input
+    -----
+    name   = str, harness file name in tests/cpp without the .cpp
+
+    Output
+    ------
+    result = subprocess.CompletedProcess of the run, with str stdout
+    """
+
+    compiler = os.environ.get("CXX") or shutil.which("g++") or shutil.which("clang++")
+    if compiler is None:
+        pytest.skip("no C++ compiler to build the test harnesses")
+
+    buildDir = tmp_path_factory.mktemp("harnesses")
+    binaries = {}
+
+    def run(name):
+        if name not in binaries:
+            binary = str(buildDir / name)
+            subprocess.run([compiler, "-std=c++14", "-O2", "-pthread", "-I" + INCLUDE,
+                            os.path.join(CPP, name + ".cpp"), "-o", binary],
+                           check = True)
+            binaries[name] = binary
+        return subprocess.run([binaries[name]], stdout = subprocess.PIPE,
+                              universal_newlines = True)
+
+    return run
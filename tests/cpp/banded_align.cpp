@@ -0,0 +1,185 @@
+/*
+ * Aligns random pairs of related sequences with BandedAlign at every SIMD
+ * level the CPU supports, and checks that scores and cigars are those of
+ * the scalar kernel. Also checks the traceback of the scalar kernel: the
+ * cigar aligns exactly the residues between start and end, tells matches
+ * from mismatches, no traceback at all gives the same score, and the
+ * CigarCounts of the cigar give its identity. Prints the differences and
+ * exits with 1 if any.
+ */
+
+#include "nsearch/Alignment/BandedAlign.h"
+#include "nsearch/Alphabet/DNA.h"
+#include "nsearch/Alphabet/Protein.h"
+#include "nsearch/Sequence.h"
+
+#include <cstdint>
+#include <iostream>
+#include <random>
+#include <string>
+#include <vector>
+
+static std::mt19937 rng( 7 );
+
+static std::string RandomSequence( const std::string& letters,
+                                   const size_t       length ) {
+  std::string seq;
+  for( size_t i = 0; i < length; i++ )
+    seq += letters[ rng() % letters.size() ];
+  return seq;
+}
+
+// seq with up to 30% substitutions, insertions and deletions
+static std::string Mutate( const std::string& letters,
+                           const std::string& seq ) {
+  const int   rate = rng() % 4;
+  std::string mutated;
+  for( char ch : seq ) {
+    const int r = rng() % 100;
+    if( r < rate * 3 )
+      continue;
+    if( r < rate * 6 )
+      mutated += letters[ rng() % letters.size() ];
+    mutated += r < rate * 10 ? letters[ rng() % letters.size() ] : ch;
+  }
+  return mutated;
+}
+
+// Whether cigar aligns the residues [ posA, endA ) of A to the residues
+// [ posB, endB ) of B, and says which pairs match
+template < typename A >
+static bool IsAlignment( const Cigar& cigar, const Sequence< A >& seqA,
+                         size_t posA, const size_t endA,
+                         const Sequence< A >& seqB, size_t posB,
+                         const size_t endB ) {
+  for( auto& entry : cigar ) {
+    for( int i = 0; i < entry.count; i++ ) {
+      if( entry.op != CigarOp::Deletion && posA++ == endA )
+        return false;
+      if( entry.op != CigarOp::Insertion && posB++ == endB )
+        return false;
+      if( entry.op == CigarOp::Match || entry.op == CigarOp::Mismatch ) {
+        const bool match =
+          MatchPolicy< A >::Match( seqA[ posA - 1 ], seqB[ posB - 1 ] );
+        if( match != ( entry.op == CigarOp::Match ) )
+          return false;
+      }
+    }
+  }
+  return posA == endA && posB == endB;
+}
+
+// The residues [ *from, *to ) BandedAlign aligns, from start to end in
+// direction dir (the cigar is in sequence order either way)
+static void AlignedRange( size_t start, size_t end, const size_t length,
+                          const AlignmentDirection dir, size_t* from,
+                          size_t* to ) {
+  if( end == size_t( -1 ) )
+    end = dir == AlignmentDirection::Forward ? length : 0;
+  start = std::min( start, length );
+  end   = std::min( end, length );
+  *from = std::min( start, end );
+  *to   = std::max( start, end );
+}
+
+template < typename A >
+static int Run( const std::string& letters, const int numPairs ) {
+  std::vector< SimdLevel > levels = { SimdLevel::SSE41, SimdLevel::AVX2 };
+  while( !levels.empty() && levels.back() > CpuSimdLevel() )
+    levels.pop_back();
+
+  BandedAlignParams scalarParams;
+  scalarParams.simdLevel = SimdLevel::None;
+  BandedAlign< A > scalar( scalarParams );
+
+  std::vector< BandedAlign< A > > aligners;
+  for( auto level : levels ) {
+    BandedAlignParams params;
+    params.simdLevel = level;
+    aligners.emplace_back( params );
+  }
+
+  int numDifferences = 0;
+  for( int i = 0; i < numPairs; i++ ) {
+    std::string a = RandomSequence( letters, rng() % 300 );
+    std::string b = Mutate( letters, a );
+    if( rng() % 5 == 0 )
+      b = b.substr( std::min< size_t >( rng() % 40, b.size() ) );
+    if( rng() % 2 )
+      std::swap( a, b );
+
+    // Whole sequences, from a start, or between a start and an end
+    const AlignmentDirection dir = rng() % 2 ? AlignmentDirection::Forward
+                                             : AlignmentDirection::Reverse;
+    size_t startA = 0, startB = 0, endA = -1, endB = -1;
+    if( dir == AlignmentDirection::Reverse ) {
+      startA = a.size();
+      startB = b.size();
+    }
+    const int mode = rng() % 3;
+    if( mode >= 1 ) {
+      startA = rng() % ( a.size() + 1 );
+      startB = rng() % ( b.size() + 1 );
+    }
+    if( mode == 2 ) {
+      if( dir == AlignmentDirection::Forward ) {
+        endA = startA + rng() % ( a.size() - startA + 1 );
+        endB = startB + rng() % ( b.size() - startB + 1 );
+      } else {
+        endA = rng() % ( startA + 1 );
+        endB = rng() % ( startB + 1 );
+      }
+    }
+
+    Sequence< A > seqA( "a", a ), seqB( "b", b );
+    Cigar         expectedCigar;
+    const int     expectedScore = scalar.Align(
+      seqA, seqB, &expectedCigar, dir, startA, startB, endA, endB );
+
+    const int scoreOnly =
+      scalar.Align( seqA, seqB, NULL, dir, startA, startB, endA, endB );
+    CigarCounts counts;
+    counts += expectedCigar;
+
+    size_t fromA, toA, fromB, toB;
+    AlignedRange( startA, endA, a.size(), dir, &fromA, &toA );
+    AlignedRange( startB, endB, b.size(), dir, &fromB, &toB );
+    if( !IsAlignment( expectedCigar, seqA, fromA, toA, seqB, fromB, toB ) ||
+        scoreOnly != expectedScore ||
+        counts.Identity() != expectedCigar.Identity() ) {
+      if( numDifferences < 10 ) {
+        std::cout << "traceback: " << a << " " << b << " score "
+                  << expectedScore << " cigar " << expectedCigar.ToString()
+                  << ", without traceback " << scoreOnly << " counts identity "
+                  << counts.Identity() << std::endl;
+      }
+      numDifferences++;
+    }
+
+    for( size_t l = 0; l < levels.size(); l++ ) {
+      Cigar     cigar;
+      const int score = aligners[ l ].Align( seqA, seqB, &cigar, dir, startA,
+                                             startB, endA, endB );
+      if( score != expectedScore || !( cigar == expectedCigar ) ) {
+        if( numDifferences < 10 ) {
+          std::cout << "level " << int( levels[ l ] ) << ": " << a << " " << b
+                    << " score " << score << " cigar " << cigar.ToString()
+                    << ", scalar score " << expectedScore << " cigar "
+                    << expectedCigar.ToString() << std::endl;
+        }
+        numDifferences++;
+      }
+    }
+  }
+  return numDifferences;
+}
+
+int main() {
+  std::cout << "SIMD level " << int( CpuSimdLevel() ) << std::endl;
+
+  int numDifferences = Run< DNA >( "ACGTACGTACGTACGTN", 20000 );
+  numDifferences += Run< Protein >( "ACDEFGHIKLMNPQRSTVWYX", 5000 );
+
+  std::cout << numDifferences << " differences" << std::endl;
+  return numDifferences > 0 ? 1 : 0;
+}
@@ -0,0 +1,108 @@
+/*
+ * Checks EditDistance against the textbook dynamic programming over the
+ * whole matrix, for random patterns in random texts and mutated copies of
+ * them, with maxDistance below, at and above the true distance. Prints the
+ * differences and exits with 1 if any.
+ */
+
+#include "nsearch/Alignment/EditDistance.h"
+#include "nsearch/Alphabet/DNA.h"
+#include "nsearch/Sequence.h"
+
+#include <algorithm>
+#include <cstdint>
+#include <iostream>
+#include <random>
+#include <string>
+#include <vector>
+
+static std::mt19937 rng( 7 );
+
+// Lowest edit distance of pattern to any substring of text
+static size_t BruteForceDistance( const std::string& pattern,
+                                  const std::string& text ) {
+  const size_t          m = pattern.size();
+  std::vector< size_t > previous( m + 1 ), current( m + 1 );
+  for( size_t i = 0; i <= m; i++ )
+    previous[ i ] = i;
+
+  size_t best = previous[ m ];
+  for( char residue : text ) {
+    current[ 0 ] = 0;
+    for( size_t i = 1; i <= m; i++ ) {
+      const bool match = MatchPolicy< DNA >::Match( pattern[ i - 1 ], residue );
+      current[ i ] = std::min( { previous[ i - 1 ] + ( match ? 0 : 1 ),
+                                 previous[ i ] + 1, current[ i - 1 ] + 1 } );
+    }
+    best = std::min( best, current[ m ] );
+    std::swap( previous, current );
+  }
+  return best;
+}
+
+static std::string RandomSequence( const std::string& letters,
+                                   const size_t       length ) {
+  std::string seq;
+  for( size_t i = 0; i < length; i++ )
+    seq += letters[ rng() % letters.size() ];
+  return seq;
+}
+
+int main() {
+  // Mostly ACGT, with ambiguous residues
+  const std::string letters = "ACGTACGTACGTACGTNRY";
+
+  EditDistance< DNA > editDistance;
+  int                 numDifferences = 0;
+  for( int i = 0; i < 5000; i++ ) {
+    // Patterns over several 64 residue blocks every third time
+    const bool  isLong = i % 3 == 0;
+    std::string pattern =
+      RandomSequence( letters, 1 + rng() % ( isLong ? 400 : 150 ) );
+
+    std::string text;
+    if( rng() % 2 ) {
+      // Up to 40% of the pattern mutated, between random flanks
+      const int rate = rng() % 40;
+      text           = RandomSequence( "ACGT", rng() % 30 );
+      for( char ch : pattern ) {
+        const int r = rng() % 100;
+        if( r < rate / 3 )
+          continue;
+        if( r < 2 * rate / 3 ) {
+          text += RandomSequence( "ACGT", 1 );
+        } else if( r < rate ) {
+          text += ch;
+          text += RandomSequence( "ACGT", 1 );
+        } else {
+          text += ch;
+        }
+      }
+      text += RandomSequence( "ACGT", rng() % 30 );
+    } else {
+      text = RandomSequence( letters, rng() % ( isLong ? 500 : 200 ) );
+    }
+
+    const size_t distance = BruteForceDistance( pattern, text );
+    editDistance.SetPattern( Sequence< DNA >( pattern ) );
+    for( size_t maxDistance :
+         { size_t( 0 ), size_t( 1 ), distance > 0 ? distance - 1 : 0, distance,
+           distance + 1, size_t( rng() % 200 ), pattern.size() + 5 } ) {
+      const size_t result =
+        editDistance.Distance( Sequence< DNA >( text ), maxDistance );
+      const bool ok =
+        distance <= maxDistance ? result == distance : result > maxDistance;
+      if( !ok ) {
+        if( numDifferences < 10 ) {
+          std::cout << pattern << " in " << text << " maxDistance "
+                    << maxDistance << ": " << result << ", expected "
+                    << distance << std::endl;
+        }
+        numDifferences++;
+      }
+    }
+  }
+
+  std::cout << numDifferences << " differences" << std::endl;
+  return numDifferences > 0 ? 1 : 0;
+}
@@ -0,0 +1,208 @@
+/*
+ * Checks that exceptions of pool tasks and of PooledWorkerQueue workers
+ * reach the caller instead of terminating the process, and that a forked
+ * child gets a working pool: it runs the tasks the parent had queued,
+ * and the futures of the tasks that were running throw broken_promise.
+ * Prints the failures and exits with 1 if any.
+ */
+
+#include "../../src/_npysearch/ThreadPool.h"
+
+#include <sys/wait.h>
+#include <unistd.h>
+
+#include <atomic>
+#include <chrono>
+#include <future>
+#include <iostream>
+#include <stdexcept>
+#include <string>
+#include <thread>
+#include <vector>
+
+static int numFailures = 0;
+
+static void Check( const bool ok, const std::string& what ) {
+  if( !ok ) {
+    std::cout << "failed: " << what << std::endl;
+    numFailures++;
+  }
+}
+
+// Throws on item 3, or when created with failInConstructor
+class FailingWorker {
+public:
+  FailingWorker( std::atomic< int >* processed, bool failInConstructor )
+      : mProcessed( *processed ) {
+    if( failInConstructor )
+      throw std::runtime_error( "constructor" );
+  }
+
+  void Process( const int& item ) {
+    if( item == 3 )
+      throw std::runtime_error( "item 3" );
+    mProcessed++;
+  }
+
+private:
+  std::atomic< int >& mProcessed;
+};
+
+using FailingQueue =
+  PooledWorkerQueue< FailingWorker, int, std::atomic< int >*, bool >;
+
+// Stops at the first item Enqueue refuses
+static void EnqueueAll( FailingQueue& queue, const int from, const int to ) {
+  try {
+    for( int item = from; item < to; item++ ) {
+      queue.Enqueue( item );
+    }
+  } catch( const std::runtime_error& ) {
+  }
+}
+
+static std::string WaitForError( FailingQueue& queue ) {
+  try {
+    queue.WaitTillDone();
+  } catch( const std::runtime_error& error ) {
+    return error.what();
+  }
+  return "";
+}
+
+static void CheckTaskException() {
+  ThreadPool pool( 2 );
+  auto       result =
+    pool.Submit( [] { throw std::runtime_error( "task" ); } );
+  try {
+    result.get();
+    Check( false, "task exception reaches the future" );
+  } catch( const std::runtime_error& error ) {
+    Check( std::string( error.what() ) == "task",
+           "task exception reaches the future" );
+  }
+
+  // The thread that ran it is still there
+  Check( pool.Submit( [] {} ).wait_for( std::chrono::seconds( 10 ) ) ==
+           std::future_status::ready,
+         "pool runs tasks after an exception" );
+}
+
+static void CheckWorkerExceptions() {
+  std::atomic< int > processed( 0 );
+  ThreadPool         pool( 2 );
+
+  // One worker, so the items after 3 are still queued when it throws
+  FailingQueue queue( &pool, 1, &processed, false );
+  int          numErrors = 0;
+  queue.OnError( [&]( const std::exception_ptr& ) { numErrors++; } );
+  EnqueueAll( queue, 0, 100 );
+
+  Check( WaitForError( queue ) == "item 3", "WaitTillDone rethrows" );
+  Check( processed == 3, "queued items are dropped after an exception" );
+  Check( numErrors == 1, "OnError is called once" );
+  Check( WaitForError( queue ) == "item 3", "the exception is kept" );
+
+  int  item = 0;
+  bool threw = false;
+  try {
+    queue.Enqueue( item );
+  } catch( const std::runtime_error& ) {
+    threw = true;
+  }
+  Check( threw, "Enqueue rethrows" );
+
+  FailingQueue failingConstructor( &pool, 2, &processed, true );
+  EnqueueAll( failingConstructor, 0, 10 );
+  Check( WaitForError( failingConstructor ) == "constructor",
+         "worker constructor exception is rethrown" );
+}
+
+// Whether the future is ready within 10 s, and then holds the error
+static bool IsBrokenPromise( std::future< void >& result ) {
+  if( result.wait_for( std::chrono::seconds( 10 ) ) !=
+      std::future_status::ready )
+    return false;
+  try {
+    result.get();
+  } catch( const std::future_error& error ) {
+    return error.code() == std::future_errc::broken_promise;
+  }
+  return false;
+}
+
+static bool IsDone( std::future< void >& result ) {
+  if( result.wait_for( std::chrono::seconds( 10 ) ) !=
+      std::future_status::ready )
+    return false;
+  try {
+    result.get();
+  } catch( ... ) {
+    return false;
+  }
+  return true;
+}
+
+static void CheckFork() {
+  std::atomic< int >                 started( 0 );
+  ThreadPool                         pool( 2 );
+  std::vector< std::future< void > > results;
+
+  // Both threads busy, and two more tasks queued, at the fork
+  for( int i = 0; i < 4; i++ ) {
+    results.push_back( pool.Submit( [&] {
+      started++;
+      std::this_thread::sleep_for( std::chrono::milliseconds( 300 ) );
+    } ) );
+  }
+  while( started < 2 ) {
+    std::this_thread::sleep_for( std::chrono::milliseconds( 10 ) );
+  }
+
+  const pid_t pid = fork();
+  if( pid == 0 ) {
+    // Don't hang the test if the child's pool deadlocks
+    alarm( 20 );
+
+    // Must not wait for the locks of the parent's threads
+    pool.NumQueued();
+
+    const int  startedAtFork = started;
+    const bool ran =
+      pool.Submit( [] {} ).wait_for( std::chrono::seconds( 10 ) ) ==
+      std::future_status::ready;
+    const bool running =
+      IsBrokenPromise( results[ 0 ] ) && IsBrokenPromise( results[ 1 ] );
+    const bool queued = IsDone( results[ 2 ] ) && IsDone( results[ 3 ] );
+
+    std::atomic< int > processed( 0 );
+    FailingQueue       queue( &pool, 2, &processed, false );
+    EnqueueAll( queue, 4, 50 );
+    queue.WaitTillDone();
+
+    const bool ok = ran && running && queued &&
+                    started == startedAtFork + 2 && processed == 46 &&
+                    pool.Size() == 2 &&
+                    pool.NumQueued() == 0;
+    _exit( ok ? 0 : 1 );
+  }
+
+  // The parent runs all four itself
+  for( auto& result : results ) {
+    Check( IsDone( result ), "parent runs its tasks after the fork" );
+  }
+
+  int status;
+  waitpid( pid, &status, 0 );
+  Check( WIFEXITED( status ) && WEXITSTATUS( status ) == 0,
+         "forked child runs the queued tasks, and running ones are broken" );
+}
+
+int main() {
+  CheckTaskException();
+  CheckWorkerExceptions();
+  CheckFork();
+
+  std::cout << numFailures << " failures" << std::endl;
+  return numFailures > 0 ? 1 : 0;
+}
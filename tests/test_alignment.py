@@ -0,0 +1,10 @@
+def test_banded_align(runHarness):
+    # SIMD levels against the scalar kernel, and its traceback
+    result = runHarness("banded_align")
+    assert result.returncode == 0, result.stdout
+
+
+def test_edit_distance(runHarness):
+    # Against the full dynamic programming matrix
+    result = runHarness("edit_distance")
+    assert result.returncode == 0, result.stdout
@@ -0,0 +1,33 @@
+"""
+Reading sequence files, which keeps the sequences as they are
+"""
+
+import npysearch as npy
+
+
+def writeFile(tmp_path, name, text):
+    path = tmp_path / name
+    path.write_text(text)
+    return str(path)
+
+
+def test_read_fasta_keeps_case(tmp_path):
+    path = writeFile(tmp_path, "mixed.fasta",
+                     ">dna one\nacgTN\nggc\n>protein\nMKlvW\n")
+    expected = {"dna one": "acgTNggc", "protein": "MKlvW"}
+    assert npy.readFasta(path) == expected
+    assert list(npy.iterFasta(path)) == list(expected.items())
+
+
+def test_read_fastq_keeps_case(tmp_path):
+    path = writeFile(tmp_path, "reads.fastq", "@read\nacgTn\n+\nIIII#\n")
+    assert npy.readFasta(path) == {"read": "acgTn"}
+
+
+def test_search_upcases_sequences_read(tmp_path):
+    sequence = "GTGAGTGATGGTTGAGGTAGTGTGGAGATAAAGG"
+    path     = writeFile(tmp_path, "lower.fasta",
+                         ">lower\n" + sequence.lower() + "\n")
+    results  = npy.blast(npy.readFasta(path), {"upper": sequence},
+                         strand = "plus")
+    assert list(results["Identity"]) == [1.0]
@@ -0,0 +1,88 @@
+"""
+Saving and loading database indexes, and loading damaged index files
+"""
+
+import os
+import struct
+
+import pytest
+
+import npysearch as npy
+
+from conftest import EXTDATA
+
+# Offset of the section table in the index file header, and the sections
+# (see Database::IndexSection)
+SECTIONS_OFFSET = 80
+SEQUENCE_IDS, KMER_OFFSETS, INDEXED_KMERS = 1, 2, 4
+
+
+def searchColumns(db):
+    results = db.search(os.path.join(EXTDATA, "query.fasta"), maxAccepts = 4)
+    return {column: list(values) for column, values in results.items()}
+
+
+def savedIndex(tmp_path, **arguments):
+    db   = npy.Database(os.path.join(EXTDATA, "db.fasta"), **arguments)
+    path = str(tmp_path / "db.idx")
+    db.save(path)
+    return db, path
+
+
+def damage(path, section, fn):
+    """
+    Replaces the bytes of a section of an index file with fn(bytes)
+    """
+
+    with open(path, "r+b") as file:
+        file.seek(SECTIONS_OFFSET + 16 * section)
+        offset, size = struct.unpack("<QQ", file.read(16))
+        file.seek(offset)
+        data = fn(file.read(size))
+        assert len(data) == size
+        file.seek(offset)
+        file.write(data)
+
+
+@pytest.mark.parametrize("arguments", [{}, {"compress": True},
+                                       {"wordSize": 16, "sparse": True}])
+@pytest.mark.parametrize("mmap", [True, False])
+def test_load_searches_like_the_saved_database(tmp_path, arguments, mmap):
+    db, path = savedIndex(tmp_path, **arguments)
+    loaded   = npy.Database.load(path, mmap = mmap, verify = True)
+    assert searchColumns(loaded) == searchColumns(db)
+
+
+def test_load_rejects_out_of_range_sequence_ids(tmp_path):
+    _, path = savedIndex(tmp_path)
+    damage(path, SEQUENCE_IDS, lambda data: b"\xff" * 4 + data[4:])
+    with pytest.raises(RuntimeError, match = "Corrupt index file"):
+        npy.Database.load(path)
+
+
+def test_load_rejects_unterminated_compressed_postings(tmp_path):
+    _, path = savedIndex(tmp_path, compress = True)
+    damage(path, SEQUENCE_IDS, lambda data: b"\x80" * len(data))
+    with pytest.raises(RuntimeError, match = "Corrupt index file"):
+        npy.Database.load(path)
+
+
+def test_load_rejects_misplaced_sparse_kmers(tmp_path):
+    _, path = savedIndex(tmp_path, wordSize = 16, sparse = True)
+    damage(path, INDEXED_KMERS, lambda data: b"\xff" * 7 + b"\x00" + data[8:])
+    with pytest.raises(RuntimeError, match = "Corrupt index file"):
+        npy.Database.load(path)
+
+
+def test_load_rejects_wrong_kmer_counts(tmp_path):
+    # One kmer moved from the first sequence to the second
+    _, path = savedIndex(tmp_path)
+
+    def moveKmer(data):
+        offsets = list(struct.unpack("<%dI" % (len(data) // 4), data))
+        offsets[1] -= 1
+        return struct.pack("<%dI" % len(offsets), *offsets)
+
+    damage(path, KMER_OFFSETS, moveKmer)
+    with pytest.raises(RuntimeError, match = "Corrupt index file"):
+        npy.Database.load(path)
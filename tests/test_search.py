@@ -0,0 +1,86 @@
+"""
+Searches of the example data in inst/extdata, against the hits recorded in
+tests/data. After a change that is meant to alter the hits, record them
+again with
+
+    python tests/test_search.py
+
+dna_all_hits.tsv is the exception: it holds every hit of query.fasta, as
+reported by npysearch 0.0.1 (its ALNOUT output, converted to the table),
+and is not recorded again. Its hits are compared in any order, since of
+candidates sharing equally many kmers with a query, 0.0.1 aligned them
+in no particular order.
+"""
+
+import os
+
+import pytest
+
+import npysearch as npy
+
+from conftest import EXTDATA, TEST_DATA
+
+# name: (query, database, search arguments, recording)
+SEARCHES = {
+    "dna": ("query.fasta", "db.fasta", {"maxAccepts": 4}, "dna_hits.tsv"),
+    "dna_query2": ("query2.fasta", "db.fasta", {"maxAccepts": 4},
+                   "dna_query2_hits.tsv"),
+    "protein": ("prot.fasta", "prot.fasta",
+                {"maxAccepts": 4, "alphabet": "protein"}, "protein_hits.tsv"),
+    # Neither the single pass over both strands nor the edit distance
+    # filter loses a hit on this data
+    "dna_joint": ("query.fasta", "db.fasta",
+                  {"maxAccepts": 4, "strand": "joint"}, "dna_hits.tsv"),
+    "dna_edit_distance_filter": ("query.fasta", "db.fasta",
+                                 {"maxAccepts": 4, "editDistanceFilter": True},
+                                 "dna_hits.tsv"),
+    "dna_all": ("query.fasta", "db.fasta",
+                {"maxAccepts": 100, "maxRejects": 1000}, "dna_all_hits.tsv"),
+}
+
+# Recordings of an earlier version, which are compared in any order
+REFERENCE_RECORDINGS = {"dna_all_hits.tsv"}
+
+
+def tableLines(results):
+    """
+    Formats a results table as tab separated lines, the column names first
+    """
+
+    columns = list(results.keys())
+    lines   = ["\t".join(columns)]
+    for row in zip(*results.values()):
+        lines.append("\t".join(repr(float(value)) if column == "Identity"
+                               else str(value)
+                               for column, value in zip(columns, row)))
+    return lines
+
+
+def search(name):
+    query, database, arguments, recording = SEARCHES[name]
+    results = npy.blast(os.path.join(EXTDATA, query),
+                        os.path.join(EXTDATA, database), **arguments)
+    return tableLines(results), os.path.join(TEST_DATA, recording)
+
+
+@pytest.mark.parametrize("name", sorted(SEARCHES))
+def test_search_matches_recording(name):
+    lines, recording = search(name)
+    with open(recording) as file:
+        expected = file.read().splitlines()
+    if os.path.basename(recording) in REFERENCE_RECORDINGS:
+        lines, expected = sorted(lines), sorted(expected)
+    assert lines == expected
+
+
+if __name__ == "__main__":
+    # The first search of each recording writes it
+    recorded = set()
+    for name in SEARCHES:
+        if SEARCHES[name][3] in REFERENCE_RECORDINGS:
+            continue
+        lines, recording = search(name)
+        if recording not in recorded:
+            with open(recording, "w") as file:
+                file.write("\n".join(lines) + "\n")
+            recorded.add(recording)
@@ -0,0 +1,4 @@
+def test_thread_pool(runHarness):
+    # Exceptions of tasks and workers, and the pool of a forked child
+    result = runHarness("thread_pool")
+    assert result.returncode == 0, result.stdout